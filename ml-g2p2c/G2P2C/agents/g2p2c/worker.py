@@ -3,7 +3,7 @@ import numpy as np
 import pandas as pd
 from collections import deque
 from utils.pumpAction import Pump
-from utils.core import get_env, time_in_range, custom_reward, combined_shape, linear_scaling, inverse_linear_scaling
+from utils.core import get_env, TimeInRange, custom_reward, combined_shape, linear_scaling, inverse_linear_scaling
 from agents.g2p2c.core import Memory, BGPredBuffer, CGPredHorizon
 from utils.statespace import StateSpace
 from utils.reward_func import composite_reward
@@ -44,6 +44,7 @@ class Worker:
         if not self.reinit_flag:
             self.episode += 1
         self.counter = 0
+        self.episode_tir = TimeInRange()  # metrics of the episode, updated every step
         self.init_state = self.env.reset()
         init_cgm = self.init_state.observation.CGM
         self.cur_state, self.feat = self.state_space.update(cgm=init_cgm, ins=0, meal=0)
@@ -101,6 +102,7 @@ class Worker:
                                                   pump_action, reward, rl_action, policy_step['mu'][0], policy_step['std'][0],
                                                   policy_step['log_prob'][0], policy_step['state_value'][0], info['day_hour'],
                                                   info['day_min']]
+            self.episode_tir.update(cur_cgm)
             self.counter += 1
             stop_factor = (self.max_epi_length - 1) if self.worker_mode == 'training' else (self.max_test_epi_len - 1)
 
@@ -115,8 +117,7 @@ class Worker:
                           mode='a', header=False, index=False)
                 alive_steps = self.counter
                 aBGpred_rmse, cBGpred_rmse = self.bgp_buffer.calc_simple_rmse()
-                normo, hypo, sev_hypo, hyper, lgbi, hgbi, ri, sev_hyper = time_in_range(df['cgm'], df['meal'], df['ins'],
-                                                                             self.episode, self.counter, display=False)
+                normo, hypo, sev_hypo, hyper, lgbi, hgbi, ri, sev_hyper = self.episode_tir.result()
                 self.save_log([[self.episode, self.counter, df['rew'].sum(), normo, hypo, sev_hypo, hyper, lgbi,
                                 hgbi, ri, sev_hyper, aBGpred_rmse, cBGpred_rmse]],
                               '/' + self.worker_mode + '/data/' + self.worker_mode + '_episode_summary_')
@@ -7,7 +7,7 @@ import pandas as pd
 from copy import deepcopy
 from collections import deque
 from utils.pumpAction import Pump
-from utils.core import get_env, time_in_range, custom_reward, combined_shape
+from utils.core import get_env, TimeInRange, custom_reward, combined_shape
 from agents.td3.core import Memory, StateSpace, composite_reward
 from agents.std_bb.BBController import BasalBolusController
 from utils.carb_counting import carb_estimate
@@ -47,6 +47,7 @@ class Worker:
         if not self.reinit_flag:
             self.episode += 1
         self.counter = 0
+        self.episode_tir = TimeInRange()  # metrics of the episode, updated every step
         self.init_state = self.env.reset()
         self.cur_state, self.feat = self.state_space.update(cgm=self.init_state.CGM, ins=0, meal=0)
         self.cgm_hist = deque(self.calibration * [0], self.calibration)
@@ -108,6 +109,7 @@ class Worker:
             self.episode_history[self.counter] = [self.episode, self.counter, state.CGM, info['meal'] * info['sample_time'],
                                                   pump_action, reward, rl_action, mu[0], sigma[0], 0, 0, info['day_hour'],
                                                   info['day_min'], 0]
+            self.episode_tir.update(state.CGM)
             self.counter += 1
             stop_factor = (self.max_epi_length - 1) if self.worker_mode == 'training' else (self.max_test_epi_len - 1)
             criteria = state.CGM <= 40 or state.CGM >= 600 or self.counter > stop_factor  # training or state.CGM >= 400
@@ -116,8 +118,7 @@ class Worker:
                 df.to_csv(self.args.experiment_dir + '/' + self.worker_mode + '/data/logs_worker_' + str(self.worker_id) + '.csv',
                           mode='a', header=False, index=False)
                 alive_steps = self.counter
-                normo, hypo, sev_hypo, hyper, lgbi, hgbi, ri, sev_hyper = time_in_range(df['cgm'], df['meal'], df['ins'],
-                                                                             self.episode, self.counter, display=False)
+                normo, hypo, sev_hypo, hyper, lgbi, hgbi, ri, sev_hyper = self.episode_tir.result()
                 self.save_log([[self.episode, self.counter, df['rew'].sum(), normo, hypo, sev_hypo, hyper, lgbi,
                                 hgbi, ri, sev_hyper, 0, 0]],
                               '/' + self.worker_mode + '/data/' + self.worker_mode + '_episode_summary_')
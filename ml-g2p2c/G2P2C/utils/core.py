@@ -7,6 +7,7 @@ from gym.envs.registration import register
 #? 안쓰길...
 import warnings
 import math
+import bisect
 import torch
 
 
@@ -93,47 +94,85 @@ def get_exp_avg(arr, scale):
     return ema
 
 
+class TimeInRange:
+    """
+    Running version of time_in_range: update() takes one cgm reading in O(1)
+    and result() gives the metrics of the readings so far, so the episode
+    does not need to be kept or rescanned. merge() adds the counts of
+    another TimeInRange, e.g. of another worker.
+    """
+    # upper (inclusive) limits of severe hypo, hypo, normo and hyper
+    EDGES = (50, 70, 180, 300)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.EDGES) + 1)
+        self.n = 0
+        self.rl_sum, self.rl_n = 0.0, 0  # risk of the readings with fBG < 0
+        self.rh_sum, self.rh_n = 0.0, 0  # and with fBG > 0
+
+    def update(self, reading):
+        self.counts[bisect.bisect_left(self.EDGES, reading)] += 1
+        self.n += 1
+        fBG = 1.509 * (math.log(max(reading, 1)) ** 1.084 - 5.381)
+        if fBG < 0:
+            self.rl_sum += 10 * fBG ** 2
+            self.rl_n += 1
+        elif fBG > 0:
+            self.rh_sum += 10 * fBG ** 2
+            self.rh_n += 1
+        return self
+
+    def update_many(self, readings):
+        readings = np.asarray(readings, dtype=np.float64).ravel()
+        bins = np.searchsorted(self.EDGES, readings, side='left')
+        counts = np.bincount(bins, minlength=len(self.counts))
+        self.counts = [int(a + b) for a, b in zip(self.counts, counts)]
+        self.n += len(readings)
+        fBG = 1.509 * (np.log(np.maximum(readings, 1)) ** 1.084 - 5.381)
+        self.rl_sum += (10 * fBG[fBG < 0] ** 2).sum()
+        self.rl_n += int((fBG < 0).sum())
+        self.rh_sum += (10 * fBG[fBG > 0] ** 2).sum()
+        self.rh_n += int((fBG > 0).sum())
+        return self
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.n += other.n
+        self.rl_sum += other.rl_sum
+        self.rl_n += other.rl_n
+        self.rh_sum += other.rh_sum
+        self.rh_n += other.rh_n
+        return self
+
+    def result(self):
+        """(normo, hypo, severe_hypo, hyper, LBGI, HBGI, RI, severe_hyper) as time_in_range"""
+        if self.n == 0:
+            return TimeInRange().update(0).result()  # as time_in_range of no readings
+        severe_hypo, hypo, normo, hyper, severe_hyper = (c * 100 / self.n for c in self.counts)
+        LBGI = self.rl_sum / self.rl_n if self.rl_n else 0.0
+        HBGI = self.rh_sum / self.rh_n if self.rh_n else 0.0
+        return normo, hypo, severe_hypo, hyper, LBGI, HBGI, LBGI + HBGI, severe_hyper
+
+
 def time_in_range(metric, meal_data, insulin_data, episode, counter, display=False):
     '''
     :param metric: an array with the cgm readings
     :return: time in ranges hypo, hyper, normo
     '''
-    hypo = 0
-    normo = 0
-    hyper = 0
-    severe_hypo = 0
-    severe_hyper = 0
-
-    if len(metric) == 0:
-        metric.append(0)  # to avoid division by zero
-
-    for reading in metric:
-        if reading <= 50:
-            severe_hypo += 1
-        elif reading <= 70:
-            hypo += 1
-        elif reading <= 180:
-            normo += 1
-        elif reading <= 300:
-            hyper += 1
-        else:
-            severe_hyper += 1
-
-    LBGI, HBGI, RI = risk_index(metric, len(metric))
+    normo, hypo, severe_hypo, hyper, LBGI, HBGI, RI, severe_hyper = TimeInRange().update_many(metric).result()
 
     if display:
         print("Episode {} ran for {} steps ({} hours)...".format(episode, counter, counter/20))
-        print("Time in Normoglycemia (70 - 180) : {}".format(normo * 100 / len(metric)))
-        print("Time in Hypoglycemia (<70): {} ".format(hypo * 100 / len(metric)))
-        print("Time in Severe Hypoglycemia (<50): {}".format(severe_hypo * 100 / len(metric)))
-        print("Time in Hyperglycemia (>180): {} ".format(hyper * 100 / len(metric)))
+        print("Time in Normoglycemia (70 - 180) : {}".format(normo))
+        print("Time in Hypoglycemia (<70): {} ".format(hypo))
+        print("Time in Severe Hypoglycemia (<50): {}".format(severe_hypo))
+        print("Time in Hyperglycemia (>180): {} ".format(hyper))
         print("LBGI: {}".format(LBGI))
         print("HBGI: {}".format(HBGI))
         print("RI: {}".format(RI))
 
     # todo add other useful metrics, capability to save metrics to a file.
-    return (normo * 100 / len(metric)), (hypo * 100 / len(metric)), (severe_hypo * 100 / len(metric)), \
-           (hyper * 100 / len(metric)), LBGI, HBGI, RI, (severe_hyper * 100 / len(metric))
+    return normo, hypo, severe_hypo, hyper, LBGI, HBGI, RI, severe_hyper
 
 
 def discount_cumsum(x, discount):
@@ -0,0 +1,36 @@
+"""
+Compare the throughput of the T1DPatient integrator backends.
+
+Usage: python benchmark_integrators.py [simulated minutes]
+"""
+from simglucose.patient.t1dpatient import T1DPatient, Action
+from simglucose.patient import integrators
+import sys
+import time
+
+
+def steps_per_second(n_minutes, **kwargs):
+    patient = T1DPatient.withName("adolescent#001", **kwargs)
+    basal = patient._params.u2ss * patient._params.BW / 6000  # U/min
+    # one warm-up step so numba compilation is not timed
+    patient.step(Action(CHO=0, insulin=basal))
+    tic = time.perf_counter()
+    for t in range(n_minutes):
+        CHO = 50 if t % 360 == 60 else 0
+        patient.step(Action(CHO=CHO, insulin=basal))
+    toc = time.perf_counter()
+    return n_minutes / (toc - tic)
+
+
+if __name__ == "__main__":
+    n_minutes = int(sys.argv[1]) if len(sys.argv) > 1 else 1440
+    print("numba available: {}".format(integrators.njit is not None))
+    reference = steps_per_second(n_minutes, integrator="dopri5")
+    print("dopri5: {:10.0f} steps/sec".format(reference))
+    for substeps in (1, 2, 4):
+        rate = steps_per_second(n_minutes, integrator="rk4", substeps=substeps)
+        print(
+            "rk4 x{}: {:10.0f} steps/sec ({:.1f}x)".format(
+                substeps, rate, rate / reference
+            )
+        )
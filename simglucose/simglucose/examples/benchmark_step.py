@@ -0,0 +1,62 @@
+"""
+Compare the per-step cost of T1DSimEnv in the default and the lean mode.
+
+The patient uses the fixed-step integrator with macro-stepping, so that
+the time left is mostly the env's own bookkeeping. The lean mode only
+saves bookkeeping, which is small next to the patient integration without
+numba, so the bookkeeping is also timed alone: the patient and sensor
+minutes of a step are computed once and replayed at every step.
+
+Usage: python benchmark_step.py [steps]
+"""
+from simglucose.simulation.env import T1DSimEnv
+from simglucose.controller.base import Action
+from simglucose.sensor.cgm import CGMSensor
+from simglucose.actuator.pump import InsulinPump
+from simglucose.patient.t1dpatient import T1DPatient
+from simglucose.simulation.scenario_gen import RandomScenario
+from datetime import datetime
+import numpy as np
+import sys
+import time
+
+
+def make_env(lean):
+    patient = T1DPatient.withName("adolescent#001", integrator="rk4")
+    sensor = CGMSensor.withName("Dexcom", seed=1)
+    pump = InsulinPump.withName("Insulet")
+    scenario = RandomScenario(start_time=datetime(2018, 1, 1), seed=1)
+    env = T1DSimEnv(patient, sensor, pump, scenario, macro_step=True, lean=lean)
+    env.reset()
+    env.step(Action(basal=0.02, bolus=0))  # warm-up (numba compilation)
+    return env
+
+
+def us_per_step(env, n_steps):
+    action = Action(basal=0.02, bolus=0)
+    # what an RL worker reads
+    CGM = np.empty(n_steps)
+    tic = time.perf_counter()
+    for i in range(n_steps):
+        obs, reward, done, info = env.step(action)
+        CGM[i] = obs.CGM
+    toc = time.perf_counter()
+    return (toc - tic) / n_steps * 1e6
+
+
+def bookkeeping_us_per_step(env, n_steps):
+    minutes = list(env.mini_steps(Action(basal=0.02, bolus=0)))
+    env.mini_steps = lambda action: iter(minutes)
+    return us_per_step(env, n_steps)
+
+
+if __name__ == "__main__":
+    n_steps = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    for name, timer in [("step", us_per_step),
+                        ("bookkeeping", bookkeeping_us_per_step)]:
+        default = timer(make_env(lean=False), n_steps)
+        lean = timer(make_env(lean=True), n_steps)
+        print("{}:".format(name))
+        print("  default: {:8.1f} us/step".format(default))
+        print("  lean:    {:8.1f} us/step ({:.2f}x)".format(lean,
+                                                         default / lean))
@@ -0,0 +1,14 @@
+from simglucose.analysis.ensemble import dataset_report
+import sys
+
+# a TrajectoryDataset directory, e.g. the dataset of batch_simulate
+dataset_root = sys.argv[1]
+
+# only the BG column of the first day of two patients is read
+results, ri_per_hour, zone_stats = dataset_report(
+    dataset_root,
+    patients=['adolescent#001', 'adult#001'],
+    start=0,
+    stop=24 * 60)
+print(results)
+print(zone_stats)
@@ -18,6 +18,7 @@ setup(
         "numpy>=1.25.0",
         "pandas>=2.0.3",
     ],
+    extras_require={"numba": ["numba>=0.57"]},
     include_package_data=True,
     zip_safe=False,
     long_description=open("README.md").read(),
@@ -1,10 +1,8 @@
-import pandas as pd
-import pkg_resources
+from simglucose import registry
 import logging
 import numpy as np
 
-INSULIN_PUMP_PARA_FILE = pkg_resources.resource_filename(
-    'simglucose', 'params/pump_params.csv')
+INSULIN_PUMP_PARA_FILE = registry.INSULIN_PUMP_PARA_FILE
 logger = logging.getLogger(__name__)
 
 
@@ -16,17 +14,16 @@ class InsulinPump(object):
 
     @classmethod
     def withName(cls, name):
-        pump_params = pd.read_csv(INSULIN_PUMP_PARA_FILE)
-        params = pump_params.loc[pump_params.Name == name].squeeze()
-        return cls(params)
+        return cls(registry.pumps.get(name))
 
     def bolus(self, amount):
+        # amount may be a scalar or an array, e.g. one value per patient
         bol = amount * self.U2PMOL  # convert from U/min to pmol/min
         bol = np.round(bol / self._params['inc_bolus']
                        ) * self._params['inc_bolus']
         bol = bol / self.U2PMOL     # convert from pmol/min to U/min
-        bol = min(bol, self._params['max_bolus'])
-        bol = max(bol, self._params['min_bolus'])
+        bol = np.minimum(bol, self._params['max_bolus'])
+        bol = np.maximum(bol, self._params['min_bolus'])
         return bol
 
     def basal(self, amount):
@@ -34,8 +31,8 @@ class InsulinPump(object):
         bas = np.round(bas / self._params['inc_basal']
                        ) * self._params['inc_basal']
         bas = bas / self.U2PMOL     # convert from pmol/min to U/min
-        bas = min(bas, self._params['max_basal'])
-        bas = max(bas, self._params['min_basal'])
+        bas = np.minimum(bas, self._params['max_basal'])
+        bas = np.maximum(bas, self._params['min_basal'])
         return bas
 
     def reset(self):
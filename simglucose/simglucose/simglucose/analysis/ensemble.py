@@ -0,0 +1,115 @@
+"""
+Out-of-core analysis of a partitioned trajectory dataset.
+
+dataset_report computes the statistics of report() over the runs of a
+TrajectoryDataset (simulation.dataset) without loading it whole. The
+dataset is opened lazily with pyarrow.dataset: the patient filter prunes
+the patient=<name>/ partitions, and only the minutes and BG columns of the
+rows in the time range are read, one run file at a time. The runs are
+reduced in batches of runs_per_batch with the metrics kernels, runs of the
+same length and sample time at once, so memory is bounded by one batch.
+"""
+from simglucose.analysis.metrics import (GlycemicMetrics, zone_fractions,
+                                         RISK_KEYS, ZONES)
+from simglucose.simulation.dataset import TrajectoryDataset, FORMATS
+import numpy as np
+import pandas as pd
+import logging
+
+try:
+    import pyarrow.dataset as ds
+except ImportError:
+    ds = None
+
+logger = logging.getLogger(__name__)
+
+
+def iter_runs(dataset, patients=None, start=None, stop=None):
+    """
+    Yield (patient, run_id, minutes, BG) for each run of dataset, reading
+    only the rows with start <= minutes < stop (minutes since the start of
+    the run) of the runs of patients.
+    """
+    arrow_dataset = dataset.to_arrow_dataset()
+    partition_filter = None
+    if patients is not None:
+        partition_filter = ds.field('patient').isin(list(patients))
+    row_filter = None
+    if start is not None:
+        row_filter = ds.field('minutes') >= start
+    if stop is not None:
+        before_stop = ds.field('minutes') < stop
+        row_filter = (before_stop if row_filter is None else
+                      row_filter & before_stop)
+    ext = FORMATS[dataset.format]
+    for fragment in arrow_dataset.get_fragments(filter=partition_filter):
+        keys = ds.get_partition_keys(fragment.partition_expression)
+        run_id = fragment.path.replace('\\', '/').rsplit('/', 1)[-1]
+        table = fragment.to_table(columns=['minutes', 'BG'],
+                                  filter=row_filter)
+        yield (keys.get('patient'), run_id[:-len(ext)],
+               table.column('minutes').to_numpy(),
+               table.column('BG').to_numpy().astype(np.float64))
+
+
+def dataset_report(dataset, patients=None, start=None, stop=None,
+                   sample_time=None, window_length=60, runs_per_batch=256,
+                   format='parquet'):
+    """
+    Statistics of the runs of dataset (a TrajectoryDataset or its root
+    directory), as the first three outputs of report(): results,
+    ri_per_hour and zone_stats. Runs are indexed by (patient, run_id).
+
+    patients    - names of the patients to analyze, all by default
+    start, stop - range of minutes since the start of each run to analyze
+    sample_time - minutes between rows, by default read from each run
+    format      - format of the files when dataset is a directory
+    """
+    if not isinstance(dataset, TrajectoryDataset):
+        dataset = TrajectoryDataset(dataset, format=format)
+    percent_stats, ri_per_hour, ri_mean, zones = [], [], [], []
+    batch = []
+
+    def flush():
+        groups = {}
+        for run in batch:
+            groups.setdefault((len(run[2]), run[3]), []).append(run)
+        for (_, st), runs in groups.items():
+            metrics = GlycemicMetrics(
+                np.column_stack([run[2] for run in runs]), sample_time=st,
+                window_length=window_length,
+                names=pd.MultiIndex.from_tuples(
+                    [run[:2] for run in runs], names=['patient', 'run_id']))
+            percent_stats.append(metrics.percent_stats())
+            ri_per_hour.append(metrics.ri_per_hour())
+            ri_mean.append(metrics.ri_mean())
+            zones.append(metrics.zones)
+        del batch[:]
+
+    n_runs = 0
+    for patient, run_id, minutes, BG in iter_runs(dataset, patients, start,
+                                                  stop):
+        if len(BG) == 0:
+            continue
+        st = sample_time
+        if st is None:
+            st = float(minutes[1] - minutes[0]) if len(minutes) > 1 else 1.0
+        batch.append((patient, run_id, BG, st))
+        n_runs += 1
+        if len(batch) >= runs_per_batch:
+            flush()
+    flush()
+    logger.info('Analyzed {} runs of {}'.format(n_runs, dataset.root))
+
+    if not percent_stats:
+        empty = pd.DataFrame()
+        return empty, empty, pd.DataFrame([[np.nan] * len(ZONES)],
+                                          columns=list(ZONES))
+    results = pd.concat([pd.concat(percent_stats), pd.concat(ri_mean)],
+                        axis=1).sort_index()
+    ri_per_hour = pd.concat(
+        [pd.concat([f.loc[key] for f in ri_per_hour]).sort_index()
+         for key in RISK_KEYS], keys=list(RISK_KEYS))
+    zone_stats = pd.DataFrame([zone_fractions(np.concatenate(zones))],
+                              columns=list(ZONES))
+    return results, ri_per_hour, zone_stats
@@ -0,0 +1,160 @@
+"""
+Glycemic metrics of ensembles of runs, without plotting.
+
+The kernels take a block of BG values of shape (n_steps, n_runs), one column
+per run, and compute the numbers of analysis.report in a few vectorized
+passes over the whole block: percent time in range, LBGI/HBGI/risk index
+per window (one hour by default) and the CVGA percentiles and zones.
+GlycemicMetrics collects them and gives the DataFrames report returns.
+matplotlib is not imported.
+"""
+import numpy as np
+import pandas as pd
+
+# columns of percent_stats, and the steps they count
+PERCENT_RANGES = (
+    ('70<=BG<=180', lambda BG: (BG >= 70) & (BG <= 180)),
+    ('BG>180', lambda BG: BG > 180),
+    ('BG<70', lambda BG: BG < 70),
+    ('BG>250', lambda BG: BG > 250),
+    ('BG<50', lambda BG: BG < 50),
+)
+RISK_KEYS = ('LBGI', 'HBGI', 'Risk Index')
+ZONES = ('A', 'B', 'C', 'D', 'E')
+
+
+def as_block(BG):
+    """BG as a float array of shape (n_steps, n_runs)"""
+    BG = np.asarray(BG, dtype=np.float64)
+    if BG.ndim == 1:
+        BG = BG[:, np.newaxis]
+    return BG
+
+
+def percent_time_in_range(BG):
+    """
+    Percent of the steps of each run in each of PERCENT_RANGES, as an
+    array of shape (n_runs, len(PERCENT_RANGES)). Steps with a NaN BG count
+    as out of every range.
+    """
+    BG = as_block(BG)
+    out = np.empty((BG.shape[1], len(PERCENT_RANGES)))
+    for j, (_, in_range) in enumerate(PERCENT_RANGES):
+        out[:, j] = in_range(BG).sum(axis=0)
+    return out / max(len(BG), 1) * 100
+
+
+def risk_per_window(BG, sample_time=3, window_length=60):
+    """
+    Mean LBGI, HBGI and risk index of each run over consecutive windows of
+    window_length minutes, as three arrays of shape (n_windows, n_runs).
+    The last window is dropped when it is not full, and non-positive BG
+    values are left out, as in report.risk_index_trace.
+    """
+    BG = as_block(BG)
+    step_size = int(window_length / sample_time)
+    n_windows = len(BG) // step_size
+    block = BG[:n_windows * step_size].reshape(n_windows, step_size, -1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fBG = 1.509 * (np.log(np.where(block > 0, block, np.nan))**1.084 -
+                       5.381)
+        count = (~np.isnan(fBG)).sum(axis=1)
+        # NaN times False stays NaN, so left-out values stay out
+        LBGI = np.nansum(10 * (fBG * (fBG < 0))**2, axis=1) / count
+        HBGI = np.nansum(10 * (fBG * (fBG > 0))**2, axis=1) / count
+    return LBGI, HBGI, LBGI + HBGI
+
+
+def cvga_bounds(BG):
+    """2.5th and 97.5th BG percentiles of each run, clipped to [50, 400]"""
+    BG_min, BG_max = np.percentile(as_block(BG), [2.5, 97.5], axis=0)
+    return np.clip(BG_min, 50, 400), np.clip(BG_max, 50, 400)
+
+
+def cvga_zone(BG_min, BG_max):
+    """
+    CVGA zone ('A' to 'E') of runs with the given 2.5th and 97.5th BG
+    percentiles, by the rules of report.CVGA_analysis. Runs outside of its
+    grid (e.g. a minimum above 110) get ''.
+    """
+    BG_min = np.clip(BG_min, 50, 400)
+    BG_max = np.clip(BG_max, 50, 400)
+    A = (BG_min > 90) & (BG_min <= 110) & (BG_max >= 110) & (BG_max < 180)
+    B = (BG_min > 70) & (BG_min <= 110) & (BG_max >= 110) & (BG_max < 300)
+    C = (((BG_min > 90) & (BG_min <= 110) & (BG_max >= 300)) |
+         ((BG_min <= 70) & (BG_max >= 110) & (BG_max < 180)))
+    D = (((BG_min > 70) & (BG_min <= 90) & (BG_max >= 300)) |
+         ((BG_min <= 70) & (BG_max >= 180) & (BG_max < 300)))
+    E = (BG_min <= 70) & (BG_max >= 300)
+    return np.select([A, B, C, D, E], list(ZONES), default='')
+
+
+def zone_fractions(zones):
+    """Fraction of the runs in each CVGA zone, as a tuple (A, B, C, D, E)"""
+    zones = np.asarray(zones)
+    n = float(max(len(zones), 1))
+    return tuple((zones == z).sum() / n for z in ZONES)
+
+
+class GlycemicMetrics(object):
+    """
+    Metrics of an ensemble of runs.
+
+    BG is a DataFrame with one column per run (e.g. df.unstack(level=0).BG
+    of simulate results), or an array of shape (n_steps, n_runs) with the
+    run names in names.
+        percent        - percent_time_in_range, (n_runs, 5)
+        LBGI, HBGI, RI - risk_per_window, (n_windows, n_runs)
+        BG_min, BG_max - cvga_bounds, (n_runs, )
+        zones          - cvga_zone of each run
+    """
+
+    def __init__(self, BG, sample_time=3, window_length=60, names=None):
+        if isinstance(BG, pd.DataFrame):
+            if names is None:
+                names = BG.columns
+            BG = BG.values
+        BG = as_block(BG)
+        if names is None:
+            names = range(BG.shape[1])
+        if not isinstance(names, pd.Index):
+            names = pd.Index(names)
+        self.names = names
+        self.sample_time = sample_time
+        self.percent = percent_time_in_range(BG)
+        self.LBGI, self.HBGI, self.RI = risk_per_window(
+            BG, sample_time, window_length)
+        self.BG_min, self.BG_max = cvga_bounds(BG)
+        self.zones = cvga_zone(self.BG_min, self.BG_max)
+
+    def __len__(self):
+        return len(self.names)
+
+    def percent_stats(self):
+        """As the first output of report.percent_stats"""
+        return pd.DataFrame(self.percent, index=self.names,
+                            columns=[r[0] for r in PERCENT_RANGES])
+
+    def ri_per_hour(self):
+        """As the first output of report.risk_index_trace"""
+        return pd.concat(
+            [pd.DataFrame(values.T, index=self.names)
+             for values in (self.LBGI, self.HBGI, self.RI)],
+            keys=list(RISK_KEYS))
+
+    def ri_mean(self):
+        """Mean of ri_per_hour over the windows, one column per index"""
+        count = (~np.isnan(self.RI)).sum(axis=0)
+        with np.errstate(invalid='ignore'):
+            means = [np.nansum(values, axis=0) / count
+                     for values in (self.LBGI, self.HBGI, self.RI)]
+        return pd.DataFrame(dict(zip(RISK_KEYS, means)), index=self.names)
+
+    def zone_stats(self):
+        """As the first output of report.CVGA"""
+        return pd.DataFrame([zone_fractions(self.zones)],
+                            columns=list(ZONES))
+
+    def results(self):
+        """percent_stats and ri_mean side by side, as report's results"""
+        return pd.concat([self.percent_stats(), self.ri_mean()], axis=1)
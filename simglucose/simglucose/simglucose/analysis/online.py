@@ -0,0 +1,201 @@
+"""
+Online glycemic statistics.
+
+GlucoseStats is updated with one BG value at a time in O(1) and gives the
+metrics of everything seen so far: time in ranges, mean, CV, GMI and the
+mean LBGI/HBGI/risk index. Its state is a handful of sums (the mean and
+variance use Welford's update), so two accumulators, e.g. of the workers
+of a batch, are merged exactly with merge or GlucoseStats.combine. The
+ranges are those of report.percent_stats.
+T1DSimEnv keeps one for the current episode in env.glucose_stats.
+"""
+from simglucose.analysis.risk import risk, risk_array
+from bisect import bisect_left, bisect_right
+import math
+import numpy as np
+
+
+class GlucoseStats(object):
+    # edges of the ranges counted, in mg/dL: a value on one of LOW_EDGES
+    # belongs to the range above it, one on HIGH_EDGES to the range below
+    LOW_EDGES = (50.0, 70.0)
+    HIGH_EDGES = (180.0, 250.0)
+    RANGES = ("BG<50", "50<=BG<70", "70<=BG<=180", "180<BG<=250", "BG>250")
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0  # sum of squared deviations from the mean
+        self.min = math.inf
+        self.max = -math.inf
+        self.counts = [0] * len(self.RANGES)
+        self._lbgi = 0.0  # sums of the risk indices
+        self._hbgi = 0.0
+        self.risk_pending = 0  # last values added without their risk
+
+    def update(self, BG, LBGI=None, HBGI=None):
+        """Add one BG value; its LBGI and HBGI are computed if not given"""
+        if LBGI is None or HBGI is None:
+            LBGI, HBGI, _ = risk(BG)
+        self._add(BG)
+        self._lbgi += LBGI
+        self._hbgi += HBGI
+        return self
+
+    def update_bg(self, BG):
+        """
+        Add one BG value without its risk indices, which are given later
+        with add_risk. Until then the risk means leave it out.
+        """
+        self.risk_pending += 1
+        return self._add(BG)
+
+    def _add(self, BG):
+        self.n += 1
+        delta = BG - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (BG - self.mean)
+        if BG < self.min:
+            self.min = BG
+        if BG > self.max:
+            self.max = BG
+        self.counts[bisect_right(self.LOW_EDGES, BG) +
+                    bisect_left(self.HIGH_EDGES, BG)] += 1
+        return self
+
+    def add_risk(self, LBGI, HBGI):
+        """LBGI and HBGI arrays of the last values added with update_bg"""
+        self._lbgi += np.sum(LBGI)
+        self._hbgi += np.sum(HBGI)
+        self.risk_pending -= len(LBGI)
+        return self
+
+    def update_many(self, BG):
+        """Add an array of BG values at once"""
+        BG = np.asarray(BG, dtype=np.float64).ravel()
+        if len(BG) == 0:
+            return self
+        other = GlucoseStats()
+        other.n = len(BG)
+        other.mean = BG.mean()
+        other._m2 = ((BG - other.mean)**2).sum()
+        other.min = BG.min()
+        other.max = BG.max()
+        bins = (np.searchsorted(self.LOW_EDGES, BG, side="right") +
+                np.searchsorted(self.HIGH_EDGES, BG, side="left"))
+        other.counts = np.bincount(bins, minlength=len(self.RANGES)).tolist()
+        rl, rh, _ = risk_array(BG)
+        other._lbgi = rl.sum()
+        other._hbgi = rh.sum()
+        return self.merge(other)
+
+    def merge(self, other):
+        """Add the values seen by other to these stats"""
+        if other.n == 0:
+            return self
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self._m2 += other._m2 + delta**2 * self.n * other.n / n
+        self.n = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self._lbgi += other._lbgi
+        self._hbgi += other._hbgi
+        self.risk_pending += other.risk_pending
+        return self
+
+    def __add__(self, other):
+        return GlucoseStats().merge(self).merge(other)
+
+    @classmethod
+    def combine(cls, stats):
+        """Merge of an iterable of GlucoseStats"""
+        total = cls()
+        for s in stats:
+            total.merge(s)
+        return total
+
+    def copy(self):
+        return GlucoseStats().merge(self)
+
+    def _share(self, count):
+        if self.n == 0:
+            return float("nan")
+        return count / self.n * 100
+
+    def percent(self):
+        """Percent of the values in each of RANGES"""
+        return {name: self._share(c) for name, c in zip(self.RANGES, self.counts)}
+
+    @property
+    def TIR(self):
+        """Percent of time in range, 70 <= BG <= 180"""
+        return self._share(self.counts[2])
+
+    @property
+    def TBR(self):
+        """Percent of time below range, BG < 70"""
+        return self._share(self.counts[0] + self.counts[1])
+
+    @property
+    def TAR(self):
+        """Percent of time above range, BG > 180"""
+        return self._share(self.counts[3] + self.counts[4])
+
+    @property
+    def std(self):
+        if self.n == 0:
+            return float("nan")
+        return math.sqrt(self._m2 / self.n)
+
+    @property
+    def CV(self):
+        """Coefficient of variation, in percent"""
+        if self.n == 0:
+            return float("nan")
+        return self.std / self.mean * 100
+
+    @property
+    def GMI(self):
+        """Glucose management indicator, in percent"""
+        if self.n == 0:
+            return float("nan")
+        return 3.31 + 0.02392 * self.mean
+
+    @property
+    def LBGI(self):
+        n = self.n - self.risk_pending
+        return self._lbgi / n if n else float("nan")
+
+    @property
+    def HBGI(self):
+        n = self.n - self.risk_pending
+        return self._hbgi / n if n else float("nan")
+
+    @property
+    def risk(self):
+        return self.LBGI + self.HBGI
+
+    def as_dict(self):
+        d = {
+            "n": self.n,
+            "mean_BG": self.mean if self.n else float("nan"),
+            "std_BG": self.std,
+            "CV": self.CV,
+            "GMI": self.GMI,
+            "TIR": self.TIR,
+            "TBR": self.TBR,
+            "TAR": self.TAR,
+            "LBGI": self.LBGI,
+            "HBGI": self.HBGI,
+            "Risk": self.risk,
+        }
+        d.update(self.percent())
+        return d
+
+    def __repr__(self):
+        return ("GlucoseStats(n={}, mean={:.1f}, TIR={:.1f}%, LBGI={:.2f}, "
+                "HBGI={:.2f})").format(self.n, self.mean, self.TIR,
+                                       self.LBGI, self.HBGI)
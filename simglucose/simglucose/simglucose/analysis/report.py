@@ -4,8 +4,11 @@ import numpy as np
 import os
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
-from matplotlib.collections import PatchCollection
+from matplotlib.collections import LineCollection, PatchCollection
+from concurrent.futures import ProcessPoolExecutor
 # from pandas.plotting import lag_plot
+from simglucose.analysis.metrics import (GlycemicMetrics, cvga_bounds,
+                                         cvga_zone, zone_fractions)
 import logging
 
 logger = logging.getLogger(__name__)
@@ -24,9 +27,13 @@ def ensemble_BG(BG, ax=None, plot_var=False, nstd=3):
     if plot_var and not std_curve.isnull().all():
         ax.fill_between(
             t, up_env, down_env, alpha=0.5, label='+/- {0}*std'.format(nstd))
-    for p in BG:
-        ax.plot_date(
-            t, BG[p], '-', color='grey', alpha=0.5, lw=0.5, label='_nolegend_')
+    # all the curves as one artist, x in matplotlib date numbers
+    x = mdates.date2num(t)
+    segments = np.empty((BG.shape[1], len(x), 2))
+    segments[:, :, 0] = x
+    segments[:, :, 1] = BG.values.T
+    ax.add_collection(LineCollection(
+        segments, colors='grey', alpha=0.5, lw=0.5, label='_nolegend_'))
     ax.plot(t, mean_curve, lw=2, label='Mean Curve')
     ax.xaxis.set_minor_locator(mdates.HourLocator(interval=3))
     ax.xaxis.set_minor_formatter(mdates.DateFormatter('%H:%M\n'))
@@ -72,19 +79,11 @@ def ensemblePlot(df):
 
 
 def percent_stats(BG, ax=None):
+    p_stats = GlycemicMetrics(BG).percent_stats()
     if ax is None:
         fig, ax = plt.subplots(1)
-    p_hyper = (BG > 180).sum() / len(BG) * 100
-    p_hyper.name = 'BG>180'
-    p_hypo = (BG < 70).sum() / len(BG) * 100
-    p_hypo.name = 'BG<70'
-    p_normal = ((BG >= 70) & (BG <= 180)).sum() / len(BG) * 100
-    p_normal.name = '70<=BG<=180'
-    p_250 = (BG > 250).sum() / len(BG) * 100
-    p_250.name = 'BG>250'
-    p_50 = (BG < 50).sum() / len(BG) * 100
-    p_50.name = 'BG<50'
-    p_stats = pd.concat([p_normal, p_hyper, p_hypo, p_250, p_50], axis=1)
+    else:
+        fig = ax.figure
     p_stats.plot(ax=ax, kind='bar')
     ax.set_ylabel('Percent of time in Range (%)')
     fig.tight_layout()
@@ -93,33 +92,17 @@ def percent_stats(BG, ax=None):
 
 
 def risk_index_trace(df_BG, sample_time=3, window_length=60, visualize=False):
-    step_size = int(window_length / sample_time)  # window size set to 1 hour for calculating Risk Index
-    chunk_BG = [df_BG.iloc[i:i + step_size, :] for i in range(0, len(df_BG), step_size)]
-
-    if len(chunk_BG[-1]) != step_size:  # Remove the last chunk which is not full
-        chunk_BG.pop()
-
-    fBG = [
-        1.509 * (np.log(BG[BG > 0]) ** 1.084 - 5.381) for BG in chunk_BG
-    ]
-
-    rl = [(10 * (fbg * (fbg < 0)) ** 2).mean() for fbg in fBG]
-    rh = [(10 * (fbg * (fbg > 0)) ** 2).mean() for fbg in fBG]
-
-    LBGI = pd.concat(rl, axis=1).transpose()
-    HBGI = pd.concat(rh, axis=1).transpose()
-    RI = LBGI + HBGI
-
-    ri_per_hour = pd.concat(
-        [LBGI.transpose(), HBGI.transpose(),
-         RI.transpose()],
-        keys=['LBGI', 'HBGI', 'Risk Index'])
+    # window size set to 1 hour for calculating Risk Index
+    metrics = GlycemicMetrics(df_BG, sample_time=sample_time,
+                              window_length=window_length)
+    ri_per_hour = metrics.ri_per_hour()
 
     axes = []
     if visualize:
         logger.info('Plotting risk trace plot')
         ri_per_hour_plot = pd.concat(
-            [HBGI.transpose(), -LBGI.transpose()], keys=['HBGI', '-LBGI'])
+            [ri_per_hour.loc['HBGI'], -ri_per_hour.loc['LBGI']],
+            keys=['HBGI', '-LBGI'])
         for i in range(len(ri_per_hour_plot.unstack(level=0))):
             logger.debug(
                 ri_per_hour_plot.unstack(level=0).iloc[i].unstack(level=1))
@@ -129,7 +112,7 @@ def risk_index_trace(df_BG, sample_time=3, window_length=60, visualize=False):
             plt.xlabel('Time (hour)')
             plt.ylabel('Risk Index')
 
-    ri_mean = ri_per_hour.transpose().mean().unstack(level=0)
+    ri_mean = metrics.ri_mean()
     fig, ax = plt.subplots(1)
     ri_mean.plot(ax=ax, kind='bar')
     fig.tight_layout()
@@ -201,24 +184,8 @@ def CVGA_background(ax=None):
 
 
 def CVGA_analysis(BG):
-    BG_min = np.percentile(BG, 2.5, axis=0)
-    BG_max = np.percentile(BG, 97.5, axis=0)
-    BG_min[BG_min < 50] = 50
-    BG_min[BG_min > 400] = 400
-    BG_max[BG_max < 50] = 50
-    BG_max[BG_max > 400] = 400
-
-    perA = ((BG_min > 90) & (BG_min <= 110) & (BG_max >= 110)
-            & (BG_max < 180)).sum() / float(len(BG_min))
-    perB = ((BG_min > 70) & (BG_min <= 110) & (BG_max >= 110)
-            & (BG_max < 300)).sum() / float(len(BG_min)) - perA
-    perC = (((BG_min > 90) & (BG_min <= 110) & (BG_max >= 300)) |
-            ((BG_min <= 70) & (BG_max >= 110) &
-             (BG_max < 180))).sum() / float(len(BG_min))
-    perD = (((BG_min > 70) & (BG_min <= 90) & (BG_max >= 300)) |
-            ((BG_min <= 70) & (BG_max >= 180) &
-             (BG_max < 300))).sum() / float(len(BG_min))
-    perE = ((BG_min <= 70) & (BG_max >= 300)).sum() / float(len(BG_min))
+    BG_min, BG_max = cvga_bounds(BG)
+    perA, perB, perC, perD, perE = zone_fractions(cvga_zone(BG_min, BG_max))
     return BG_min, BG_max, perA, perB, perC, perD, perE
 
 
@@ -248,18 +215,76 @@ def CVGA(BG_list, label=None):
     return zone_stats, fig, ax
 
 
-def report(df, cgm_sensor=None, save_path=None):
-    BG = df.unstack(level=0).BG
+# file name of each figure of report
+FIGURES = ('BG_trace.png', 'zone_stats.png', 'risk_stats.png', 'CVGA.png')
 
-    fig_ensemble, ax1, ax2, ax3 = ensemblePlot(df)
-    pstats, fig_percent, ax4 = percent_stats(BG)
-    if cgm_sensor is not None:
-        ri_per_hour, ri_mean, fig_ri, ax5 = risk_index_trace(BG, sample_time=cgm_sensor.sample_time, visualize=False)
+
+def _use_agg():
+    plt.switch_backend('agg')
+
+
+def _render_figure(task):
+    """Draw one figure of report and save it, in a worker process"""
+    name, data, sample_time, path = task
+    if name == 'BG_trace.png':
+        fig = ensemblePlot(data)[0]
     else:
-        ri_per_hour, ri_mean, fig_ri, ax5 = risk_index_trace(BG, visualize=False)
-    zone_stats, fig_cvga, ax6 = CVGA(BG, label='')
-    axes = [ax1, ax2, ax3, ax4, ax5, ax6]
-    figs = [fig_ensemble, fig_percent, fig_ri, fig_cvga]
+        BG = data.unstack(level=0).BG
+        if name == 'zone_stats.png':
+            fig = percent_stats(BG)[1]
+        elif name == 'risk_stats.png':
+            fig = risk_index_trace(BG, sample_time=sample_time)[2]
+        else:
+            fig = CVGA(BG, label='')[1]
+    fig.savefig(path)
+    plt.close('all')
+    return path
+
+
+def render_figures(df, save_path, sample_time=3, max_workers=None):
+    """
+    Draw the figures of report for df into save_path in a process pool,
+    one figure per task, with the non-interactive Agg backend.
+    """
+    columns = {'BG_trace.png': ['BG', 'CGM', 'CHO']}
+    tasks = [(name, df[columns.get(name, ['BG'])], sample_time,
+              os.path.join(save_path, name)) for name in FIGURES]
+    if max_workers is None:
+        max_workers = min(len(tasks), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             initializer=_use_agg) as pool:
+        return list(pool.map(_render_figure, tasks))
+
+
+def report(df, cgm_sensor=None, save_path=None, plot=True, parallel=False):
+    """
+    Performance statistics of the runs in df (simulate results, indexed by
+    patient and time). With plot=False, the numbers are computed by
+    metrics.GlycemicMetrics alone, no figure is made and figs and axes are
+    empty. With parallel and save_path, the figures are drawn into
+    save_path by render_figures instead of here; they are not shown and
+    figs and axes are empty too.
+    """
+    BG = df.unstack(level=0).BG
+    sample_time = 3 if cgm_sensor is None else cgm_sensor.sample_time
+    render_here = plot and not (parallel and save_path is not None)
+
+    if render_here:
+        fig_ensemble, ax1, ax2, ax3 = ensemblePlot(df)
+        pstats, fig_percent, ax4 = percent_stats(BG)
+        ri_per_hour, ri_mean, fig_ri, ax5 = risk_index_trace(
+            BG, sample_time=sample_time, visualize=False)
+        zone_stats, fig_cvga, ax6 = CVGA(BG, label='')
+        axes = [ax1, ax2, ax3, ax4, ax5, ax6]
+        figs = [fig_ensemble, fig_percent, fig_ri, fig_cvga]
+    else:
+        metrics = GlycemicMetrics(BG, sample_time=sample_time)
+        pstats = metrics.percent_stats()
+        ri_per_hour = metrics.ri_per_hour()
+        ri_mean = metrics.ri_mean()
+        zone_stats = metrics.zone_stats()
+        axes = []
+        figs = []
     results = pd.concat([pstats, ri_mean], axis=1)
 
     if save_path is not None:
@@ -267,12 +292,13 @@ def report(df, cgm_sensor=None, save_path=None):
         ri_per_hour.to_csv(os.path.join(save_path, 'risk_trace.csv'))
         zone_stats.to_csv(os.path.join(save_path, 'CVGA_stats.csv'))
 
-        fig_ensemble.savefig(os.path.join(save_path, 'BG_trace.png'))
-        fig_percent.savefig(os.path.join(save_path, 'zone_stats.png'))
-        fig_ri.savefig(os.path.join(save_path, 'risk_stats.png'))
-        fig_cvga.savefig(os.path.join(save_path, 'CVGA.png'))
-
-    plt.show()
+    if render_here:
+        if save_path is not None:
+            for fig, name in zip(figs, FIGURES):
+                fig.savefig(os.path.join(save_path, name))
+        plt.show()
+    elif plot:
+        render_figures(df, save_path, sample_time=sample_time)
     return results, ri_per_hour, zone_stats, figs, axes
 
 
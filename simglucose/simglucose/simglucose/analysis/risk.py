@@ -1,19 +1,32 @@
+import math
 import numpy as np
 
+# The risk function is clipped outside of these values, see risk
+MIN_BG = 20.0
+MAX_BG = 600.0
+
+
 def risk_index(BG, horizon):
+    """
+    Mean LBGI, HBGI and risk index over the last horizon values of BG.
+
+    BG is a sequence of values in mg/dL, or an array whose first axis is
+    time (e.g. n_steps x n_runs), in which case the indices are arrays over
+    the remaining axes.
+    """
     # BG is in mg/dL
     BG_to_compute = BG[-horizon:]
-    risks =[risk(r) for r in BG_to_compute]
-    LBGI = np.mean([r[0] for r in risks])
-    HBGI = np.mean([r[1] for r in risks])
-    RI = np.mean([r[2] for r in risks])
+    if len(BG_to_compute) == 1 and np.ndim(BG_to_compute[0]) == 0:
+        # per-step path
+        return risk(BG_to_compute[0])
+    rl, rh, ri = risk_array(BG_to_compute)
+    return (rl.mean(axis=0), rh.mean(axis=0), ri.mean(axis=0))
 
-    return (LBGI, HBGI, RI)
 
 def risk(BG):
     """
     Risk is a percentage - ranging from 0 to 100%.
-    The 20 and 600 mg/dl are just the values to which the risk formula was fit. 
+    The 20 and 600 mg/dl are just the values to which the risk formula was fit.
     The aim is to make the risk maximum when it is either 20 or 600.
     The units in the paper below are different (mmol/l), but in our units (mg/dl) these limits are 20 and 600.
 
@@ -21,14 +34,12 @@ def risk(BG):
     https://diabetesjournals.org/care/article/20/11/1655/21162/Symmetrization-of-the-Blood-Glucose-Measurement
 
     """
-    MIN_BG = 20.0
-    MAX_BG = 600.0
-    if BG <= MIN_BG: 
+    if BG <= MIN_BG:
         return (100.0, 0.0, 100.0)
     if BG >= MAX_BG:
         return (0.0, 100.0, 100.0)
-    
-    U = 1.509 * (np.log(BG)**1.084 - 5.381)
+
+    U = 1.509 * (math.log(BG)**1.084 - 5.381)
 
     ri = 10 * U**2
 
@@ -38,3 +49,21 @@ def risk(BG):
     if U >= 0:
         rh = ri
     return (rl, rh, ri)
+
+
+def risk_array(BG):
+    """
+    Element-wise risk of an array of BG values, as three arrays (rl, rh, ri)
+    """
+    BG = np.asarray(BG, dtype=np.float64)
+    with np.errstate(invalid="ignore"):
+        U = 1.509 * (np.log(np.clip(BG, MIN_BG, MAX_BG))**1.084 - 5.381)
+    ri = 10 * U**2
+    rl = np.where(U <= 0, ri, 0.0)
+    rh = np.where(U >= 0, ri, 0.0)
+
+    low = BG <= MIN_BG
+    high = BG >= MAX_BG
+    rl[low], rh[low], ri[low] = 100.0, 0.0, 100.0
+    rl[high], rh[high], ri[high] = 0.0, 100.0, 100.0
+    return rl, rh, ri
@@ -1,15 +1,30 @@
 from .base import Controller
 from .base import Action
+from simglucose import registry
+from collections import namedtuple
 import numpy as np
-import pandas as pd
-import pkg_resources
 import logging
 
 logger = logging.getLogger(__name__)
-CONTROL_QUEST = pkg_resources.resource_filename('simglucose',
-                                                'params/Quest.csv')
-PATIENT_PARA_FILE = pkg_resources.resource_filename(
-    'simglucose', 'params/vpatient_params.csv')
+CONTROL_QUEST = registry.CONTROL_QUEST
+PATIENT_PARA_FILE = registry.PATIENT_PARA_FILE
+
+# What the basal-bolus policy needs of a patient: the carbohydrate ratio and
+# correction factor of Quest.csv, and u2ss (pmol/(L*kg)) and BW (kg) of
+# vpatient_params.csv
+BBParams = namedtuple('BBParams', ['CR', 'CF', 'u2ss', 'BW'])
+# used for the patients that are not in the registry
+AVERAGE_PARAMS = BBParams(CR=1 / 15, CF=1 / 50, u2ss=1.43, BW=57.0)
+
+
+def bb_params(name):
+    """BBParams of the patient called name, AVERAGE_PARAMS if unknown"""
+    if name not in registry.quests:
+        return AVERAGE_PARAMS
+    quest = registry.quests.get(name)
+    params = registry.patients.get(name)
+    return BBParams(CR=float(quest.CR), CF=float(quest.CF),
+                    u2ss=float(params.u2ss), BW=float(params.BW))
 
 
 class BBController(Controller):
@@ -19,9 +34,16 @@ class BBController(Controller):
     baseline when developing a more advanced controller.
     """
     def __init__(self, target=140):
-        self.quest = pd.read_csv(CONTROL_QUEST)
-        self.patient_params = pd.read_csv(PATIENT_PARA_FILE)
         self.target = target
+        self._params = {}  # patient name -> BBParams
+        self._batch = None  # (names, CR, CF, basal) of the last policy_batch
+
+    def params(self, name):
+        """BBParams of a patient, looked up once and then cached"""
+        params = self._params.get(name)
+        if params is None:
+            params = self._params[name] = bb_params(name)
+        return params
 
     def policy(self, observation, reward, done, **kwargs):
         sample_time = kwargs.get('sample_time', 1)
@@ -49,26 +71,15 @@ class BBController(Controller):
         simulator only accepts insulin rate. Hence the bolus is converted to
         insulin rate.
         """
-        if any(self.quest.Name.str.match(name)):
-            quest = self.quest[self.quest.Name.str.match(name)]
-            params = self.patient_params[self.patient_params.Name.str.match(
-                name)]
-            u2ss = params.u2ss.values.item()  # unit: pmol/(L*kg)
-            BW = params.BW.values.item()  # unit: kg
-        else:
-            quest = pd.DataFrame([['Average', 1 / 15, 1 / 50, 50, 30]],
-                                 columns=['Name', 'CR', 'CF', 'TDI', 'Age'])
-            u2ss = 1.43  # unit: pmol/(L*kg)
-            BW = 57.0  # unit: kg
-
-        basal = u2ss * BW / 6000  # unit: U/min
+        params = self.params(name)
+        basal = params.u2ss * params.BW / 6000  # unit: U/min
         if meal > 0:
             logger.info('Calculating bolus ...')
             logger.info(f'Meal = {meal} g/min')
             logger.info(f'glucose = {glucose}')
-            bolus = (
-                (meal * env_sample_time) / quest.CR.values + (glucose > 150) *
-                (glucose - self.target) / quest.CF.values).item()  # unit: U
+            bolus = float((meal * env_sample_time) / params.CR +
+                          (glucose > 150) *
+                          (glucose - self.target) / params.CF)  # unit: U
         else:
             bolus = 0  # unit: U
 
@@ -79,5 +90,31 @@ class BBController(Controller):
         bolus = bolus / env_sample_time  # unit: U/min
         return Action(basal=basal, bolus=bolus)
 
+    def policy_batch(self, names, meal, glucose, sample_time=1):
+        """
+        _bb_policy of many patients at once, e.g. the sub-environments of
+        T1DSimVectorEnv. Returns an Action of arrays of shape (len(names), ).
+
+        names       - patient name of each entry
+        meal        - meal of each entry, in g/min
+        glucose     - CGM reading of each entry, in mg/dL
+        sample_time - minutes of one step, a scalar or one per entry
+        """
+        names = tuple(names)
+        if self._batch is None or self._batch[0] != names:
+            params = np.array([self.params(name) for name in names],
+                              dtype=np.float64)
+            params = params.reshape(-1, len(BBParams._fields))
+            CR, CF, u2ss, BW = params.T
+            self._batch = (names, CR, CF, u2ss * BW / 6000)
+        _, CR, CF, basal = self._batch
+        meal = np.asarray(meal, dtype=np.float64)
+        glucose = np.asarray(glucose, dtype=np.float64)
+        bolus = np.where(
+            meal > 0,
+            (meal * sample_time) / CR + (glucose > 150) *
+            (glucose - self.target) / CF, 0.0)  # unit: U
+        return Action(basal=basal.copy(), bolus=bolus / sample_time)
+
     def reset(self):
         pass
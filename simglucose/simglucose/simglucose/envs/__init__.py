@@ -1,2 +1,3 @@
 from simglucose.envs.simglucose_gym_env import T1DSimEnv
 from simglucose.envs.simglucose_gym_env import T1DSimGymnaisumEnv
+from simglucose.envs.simglucose_vector_env import T1DSimVectorEnv
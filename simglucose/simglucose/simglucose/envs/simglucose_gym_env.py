@@ -4,8 +4,8 @@ from simglucose.sensor.cgm import CGMSensor
 from simglucose.actuator.pump import InsulinPump
 from simglucose.simulation.scenario_gen import RandomScenario
 from simglucose.controller.base import Action
+from simglucose import registry
 import numpy as np
-import pkg_resources
 import gym
 from gym import spaces
 from gym.utils import seeding
@@ -13,9 +13,7 @@ from datetime import datetime
 import gymnasium
 
 
-PATIENT_PARA_FILE = pkg_resources.resource_filename(
-    "simglucose", "params/vpatient_params.csv"
-)
+PATIENT_PARA_FILE = registry.PATIENT_PARA_FILE
 
 
 class T1DSimEnv(gym.Env):
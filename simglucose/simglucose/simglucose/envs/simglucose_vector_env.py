@@ -0,0 +1,242 @@
+from simglucose.patient.batch_t1dpatient import BatchT1DPatient
+from simglucose.patient.t1dpatient import Action
+from simglucose.sensor.cgm import BatchCGMSensor
+from simglucose.actuator.pump import InsulinPump
+from simglucose.simulation.scenario_gen import draw_meals
+from simglucose.analysis.risk import risk_array
+from datetime import datetime, timedelta
+import numpy as np
+import gymnasium
+from gymnasium.utils import seeding
+
+
+class T1DSimVectorEnv(gymnasium.vector.VectorEnv):
+    """
+    N sub-environments of T1DSimGymnaisumEnv simulated together.
+
+    Sub-environment i simulates patient_names[i]. The patients are a
+    BatchT1DPatient, the sensors a BatchCGMSensor and the meals of the
+    random scenarios are looked up for all sub-environments at once, so a
+    step costs one batched solver call per minute rather than N Python
+    envs. As in the single env, every episode starts at a random hour with
+    a random initial glucose and its own sensor and scenario seeds, drawn
+    from the generator seeded by reset(seed=...).
+
+    Sub-environments whose episode ended (BG out of [10, 600], or
+    max_episode_steps reached) are reset automatically at the end of
+    step(); their last observation and info are returned in
+    info["final_observation"] and info["final_info"].
+    """
+
+    metadata = {"render_modes": []}
+    MAX_BG = 1000
+    SENSOR_HARDWARE = "Dexcom"
+    INSULIN_PUMP_HARDWARE = "Insulet"
+
+    def __init__(
+        self,
+        patient_names,
+        custom_scenario=None,
+        reward_fun=None,
+        seed=None,
+        max_episode_steps=None,
+    ):
+        """
+        patient_names   - one patient name per sub-environment, names may
+                          repeat
+        custom_scenario - a Scenario used by every sub-environment instead
+                          of a RandomScenario (each one gets a fork of it)
+        reward_fun      - reward of the CGM values of the last hour, as in
+                          T1DSimEnv.step. Defaults to a vectorized risk_diff
+        """
+        self.patient_names = list(patient_names)
+        n = len(self.patient_names)
+        self.reward_fun = reward_fun
+        self.custom_scenario = custom_scenario
+        self.max_episode_steps = max_episode_steps
+        self.np_random, _ = seeding.np_random(seed)
+
+        self.patient = BatchT1DPatient.withNames(
+            self.patient_names, random_init_bg=True, seed=[None] * n
+        )
+        self.sensor = BatchCGMSensor.withName(self.SENSOR_HARDWARE, [None] * n)
+        self.pump = InsulinPump.withName(self.INSULIN_PUMP_HARDWARE)
+        self.sample_time = int(self.sensor.sample_time)
+
+        super().__init__(
+            n,
+            gymnasium.spaces.Box(
+                low=0, high=self.MAX_BG, shape=(1,), dtype=np.float32
+            ),
+            gymnasium.spaces.Box(
+                low=0,
+                high=self.pump._params["max_basal"],
+                shape=(1,),
+                dtype=np.float32,
+            ),
+        )
+
+        # episode state of each sub-environment
+        self.start_times = [None] * n
+        self.episode_seeds = np.zeros((n, 3), dtype=np.int64)
+        self._t_start = np.zeros(n)
+        self._start_minute = np.zeros(n, dtype=np.int64)
+        self._steps = np.zeros(n, dtype=np.int64)
+        self._scenarios = [None] * n
+        self._meal_gens = [None] * n
+        self._meal_time = np.full((n, 6), np.nan)
+        self._meal_amount = np.zeros((n, 6))
+        window = int(60 / self.sample_time)
+        self._CGM_hist = np.zeros((n, window))
+        self._n_hist = np.zeros(n, dtype=np.int64)
+        self._actions = None
+
+    def reset_async(self, seed=None, options=None):
+        if seed is not None:
+            self.np_random, _ = seeding.np_random(seed)
+
+    def reset_wait(self, seed=None, options=None):
+        rows = np.arange(self.num_envs)
+        self.patient.reset()
+        self.sensor.reset()
+        return self._reset_rows(rows), {}
+
+    def step_async(self, actions):
+        self._actions = actions
+
+    def step_wait(self):
+        n = self.num_envs
+        basal = np.asarray(self._actions, dtype=np.float64).reshape(n)
+        # This env only controls basal insulin
+        insulin = self.pump.basal(basal) + self.pump.bolus(np.zeros(n))
+
+        CHO_sum = np.zeros(n)
+        BG = np.zeros(n)
+        CGM = np.zeros(n)
+        for CHO_t in self._meals_of_step():
+            self.patient.step(Action(CHO=CHO_t, insulin=insulin))
+            tmp_BG = self.patient.observation.Gsub
+            tmp_CGM = self.sensor.measure(self.patient.t, tmp_BG)
+            CHO_sum += CHO_t
+            BG += tmp_BG
+            CGM += tmp_CGM
+        BG /= self.sample_time
+        CGM /= self.sample_time
+        self._push_CGM(np.arange(n), CGM)
+        self._steps += 1
+
+        rewards = self._rewards()
+        terminated = (BG < 10) | (BG > 600)
+        if self.max_episode_steps is None:
+            truncated = np.zeros(n, dtype=bool)
+        else:
+            truncated = ~terminated & (self._steps >= self.max_episode_steps)
+        LBGI, HBGI, risk = risk_array(BG)
+        infos = {
+            "meal": CHO_sum / self.sample_time,
+            "insulin": insulin,
+            "bg": BG,
+            "lbgi": LBGI,
+            "hbgi": HBGI,
+            "risk": risk,
+        }
+        obs = self._observation(CGM)
+
+        done = np.flatnonzero(terminated | truncated)
+        if len(done):
+            final_obs = np.full(n, None, dtype=object)
+            final_info = np.full(n, None, dtype=object)
+            for i in done:
+                final_obs[i] = obs[i].copy()
+                final_info[i] = {key: value[i] for key, value in infos.items()}
+            obs[done] = self._reset_rows(done)
+            infos["final_observation"] = final_obs
+            infos["_final_observation"] = terminated | truncated
+            infos["final_info"] = final_info
+            infos["_final_info"] = terminated | truncated
+        return obs, rewards, terminated, truncated, infos
+
+    def _observation(self, CGM):
+        return np.asarray(CGM, dtype=np.float32).reshape(-1, 1)
+
+    def _reset_rows(self, rows):
+        """
+        Start new episodes in the sub-environments in rows and return their
+        first observations
+        """
+        seeds = self.np_random.integers(0, 2**31, size=(len(rows), 3))
+        hours = self.np_random.integers(0, 24, size=len(rows))
+        self.episode_seeds[rows] = seeds
+        self.patient.reset_rows(rows, seeds[:, 0])
+        self.sensor.reset_rows(rows, seeds[:, 1])
+        self._t_start[rows] = self.patient.t
+        self._steps[rows] = 0
+        self._n_hist[rows] = 0
+
+        for i, seed, hour in zip(rows, seeds[:, 2], hours):
+            if self.custom_scenario is None:
+                start_time = datetime(2018, 1, 1, int(hour), 0, 0)
+                # what RandomScenario(start_time, seed) draws
+                self._meal_gens[i] = np.random.RandomState(int(seed))
+                self._next_day(i)
+            else:
+                self._scenarios[i] = self.custom_scenario.fork()
+                self._scenarios[i].reset()
+                start_time = self._scenarios[i].start_time
+            self.start_times[i] = start_time
+            self._start_minute[i] = start_time.hour * 60 + start_time.minute
+
+        # As in T1DSimEnv.reset, the history starts with one CGM sample and
+        # the observation returned is the next one
+        t = self.patient.t
+        BG = self.patient.observation.Gsub[rows]
+        self._push_CGM(rows, self.sensor.measure(t, BG, rows))
+        return self._observation(self.sensor.measure(t, BG, rows))
+
+    def _next_day(self, i):
+        meals = draw_meals(self._meal_gens[i], 1)[0]
+        self._meal_time[i] = meals["time"]
+        self._meal_amount[i] = meals["amount"]
+
+    def _meals_of_step(self):
+        """Meal of every sub-environment at each minute of the step"""
+        n = self.num_envs
+        t0 = self.patient.t
+        if self.custom_scenario is not None:
+            meals = np.empty((n, self.sample_time))
+            for i, scenario in enumerate(self._scenarios):
+                time = self.start_times[i] + timedelta(
+                    minutes=t0 - self._t_start[i])
+                meals[i] = scenario.actions_between(
+                    time, time + timedelta(minutes=self.sample_time))
+            return meals.T
+
+        elapsed = (t0 - self._t_start).astype(np.int64)
+        meals = np.zeros((self.sample_time, n))
+        for k in range(self.sample_time):
+            minute = (self._start_minute + elapsed + k) % 1440
+            # RandomScenario draws the next day when it is asked for midnight
+            for i in np.flatnonzero(minute == 0):
+                self._next_day(i)
+            hit = self._meal_time == minute[:, None]
+            first = hit.argmax(axis=1)
+            meals[k] = np.where(
+                hit.any(axis=1), self._meal_amount[np.arange(n), first], 0.0)
+        return meals
+
+    def _push_CGM(self, rows, CGM):
+        hist = self._CGM_hist
+        hist[rows, :-1] = hist[rows, 1:]
+        hist[rows, -1] = CGM
+        self._n_hist[rows] = np.minimum(self._n_hist[rows] + 1, hist.shape[1])
+
+    def _rewards(self):
+        if self.reward_fun is None:
+            # risk_diff of every sub-environment
+            _, _, risk = risk_array(self._CGM_hist[:, -2:])
+            return np.where(self._n_hist >= 2, risk[:, 0] - risk[:, 1], 0.0)
+        window = self._CGM_hist.shape[1]
+        return np.array([
+            self.reward_fun(list(self._CGM_hist[i, window - k:]))
+            for i, k in enumerate(self._n_hist)
+        ], dtype=np.float64)
@@ -0,0 +1,248 @@
+from .t1dpatient import Observation
+from .model import model_rhs
+from .parameters import PARAM_INDEX, params_to_array, init_state_from_params
+from simglucose import registry
+import numpy as np
+from scipy.integrate import ode
+import pandas as pd
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def batch_model(t, x, CHO, insulin, params, last_Qsto, last_foodtaken):
+    """
+    Vectorized right-hand side of the UVa/Padova model.
+
+    model_rhs evaluated for N patients at once.
+    Inputs:
+        - x: state matrix of shape (N, 13)
+        - CHO, insulin: arrays of shape (N,), in g/min and U/min
+        - params: parameter array of shape (N, P), see PARAM_NAMES
+        - last_Qsto, last_foodtaken: arrays of shape (N,)
+    Output:
+        dxdt of shape (N, 13)
+    """
+    # model_rhs works element-wise on state-major rows
+    return model_rhs(x.T, CHO, insulin, params.T, last_Qsto,
+                     last_foodtaken).T
+
+
+def _flat_model(t, y, CHO, insulin, params, last_Qsto, last_foodtaken):
+    x = y.reshape(-1, 13)
+    return batch_model(t, x, CHO, insulin, params, last_Qsto,
+                       last_foodtaken).ravel()
+
+
+class BatchT1DPatient(object):
+    """
+    N virtual patients advanced together.
+
+    The patients share one dopri5 solver over the flattened (N, 13) state, so
+    every integrator stage is a single vectorized evaluation of batch_model.
+    The meal bookkeeping mirrors T1DPatient.step element-wise, which keeps
+    trajectories equal (within solver tolerance) to N scalar patients.
+    """
+    SAMPLE_TIME = 1  # min
+    EAT_RATE = 5  # g/min CHO
+
+    def __init__(self, params, init_state=None, random_init_bg=False,
+                 seed=None, t0=0):
+        """
+        BatchT1DPatient constructor.
+        Inputs:
+            - params: a pandas DataFrame or a record array with one patient
+              per row, or a list of pandas sequences
+            - init_state: customized initial states of shape (N, 13).
+              If not specified, load the default initial states in params
+            - random_init_bg: randomize the initial glucose states
+            - seed: None, an integer shared by all patients, or a sequence of
+              per-patient seeds
+            - t0: simulation start time, it is 0 by default
+        """
+        if isinstance(params, pd.DataFrame):
+            params = params.to_records(index=False)
+        elif not isinstance(params, np.ndarray):
+            params = pd.DataFrame(list(params)).to_records(index=False)
+        self._params = params
+        self._params_array = params_to_array(self._params)
+        self._init_state = init_state
+        self.random_init_bg = random_init_bg
+        self._seed = seed
+        self.t0 = t0
+        self.names = list(self._params["Name"])
+        self.reset()
+
+    @classmethod
+    def withIDs(cls, patient_ids, **kwargs):
+        """
+        Construct patients by patient_id, see T1DPatient.withID
+        """
+        params = registry.patients.records[[i - 1 for i in patient_ids]]
+        return cls(params, **kwargs)
+
+    @classmethod
+    def withNames(cls, names, **kwargs):
+        """
+        Construct patients by name, see T1DPatient.withName. Names may repeat.
+        """
+        return cls(registry.patients.take(names), **kwargs)
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def params(self):
+        """Float parameter array of shape (N, P), see PARAM_NAMES"""
+        return self._params_array
+
+    @property
+    def state(self):
+        return self._odesolver.y.reshape(-1, 13)
+
+    @property
+    def t(self):
+        return self._odesolver.t
+
+    @property
+    def sample_time(self):
+        return self.SAMPLE_TIME
+
+    @property
+    def observation(self):
+        """
+        Subcutaneous glucose level of every patient, shape (N,)
+        """
+        GM = self.state[:, 12]  # subcutaneous glucose (mg/kg)
+        Gsub = GM / self._params_array[:, PARAM_INDEX["Vg"]]
+        return Observation(Gsub=Gsub)
+
+    def step(self, action):
+        """
+        Advance all patients by one sample time.
+        action.CHO and action.insulin are scalars or arrays of shape (N,).
+        """
+        n = len(self)
+        CHO = np.broadcast_to(np.asarray(action.CHO, dtype=np.float64), (n,))
+        insulin = np.broadcast_to(
+            np.asarray(action.insulin, dtype=np.float64), (n,))
+        to_eat = self._announce_meal(CHO)
+
+        # Detect eating or not and update last digestion amount
+        x = self.state
+        starts = (to_eat > 0) & (self._last_CHO <= 0)
+        if starts.any():
+            self._last_Qsto[starts] = x[starts, 0] + x[starts, 1]  # unit: mg
+            self._last_foodtaken[starts] = 0  # unit: g
+            self.is_eating[starts] = True
+        self._last_foodtaken[self.is_eating] += to_eat[self.is_eating]  # g
+
+        # Detect eating ended
+        self.is_eating[(to_eat <= 0) & (self._last_CHO > 0)] = False
+
+        # Update last input
+        self._last_CHO = to_eat
+        self._last_insulin = insulin
+
+        # ODE solver
+        self._odesolver.set_f_params(to_eat, insulin, self._params_array,
+                                     self._last_Qsto, self._last_foodtaken)
+        if self._odesolver.successful():
+            self._odesolver.integrate(self._odesolver.t + self.sample_time)
+        else:
+            logger.error("ODE solver failed!!")
+            raise RuntimeError("ODE solver failed")
+
+    def _announce_meal(self, meal):
+        """
+        Element-wise version of T1DPatient._announce_meal
+        """
+        self.planned_meal = self.planned_meal + meal
+        to_eat = np.where(self.planned_meal > 0,
+                          np.minimum(self.EAT_RATE, self.planned_meal), 0.0)
+        self.planned_meal = np.maximum(self.planned_meal - to_eat, 0)
+        return to_eat
+
+    @property
+    def seed(self):
+        return self._seed
+
+    @seed.setter
+    def seed(self, seed):
+        self._seed = seed
+        self.reset()
+
+    def _seeds(self):
+        if self._seed is None or np.isscalar(self._seed):
+            return [self._seed] * len(self)
+        return list(self._seed)
+
+    def _initial_states(self, rows, seeds):
+        """
+        Initial states of the given rows, shape (len(rows), 13), with the
+        glucose states drawn from seeds when random_init_bg is set
+        """
+        if self._init_state is None:
+            init_state = init_state_from_params(self._params[rows])
+        else:
+            init_state = np.array(self._init_state, dtype=np.float64)
+            init_state = init_state.reshape(len(self), 13)[rows]
+
+        if self.random_init_bg:
+            # Same draws as T1DPatient.reset, one RandomState per patient
+            for x, seed in zip(init_state, seeds):
+                random_state = np.random.RandomState(seed)
+                mean = [1.0 * x[3], 1.0 * x[4], 1.0 * x[12]]
+                cov = np.diag([0.1 * x[3], 0.1 * x[4], 0.1 * x[12]])
+                bg_init = random_state.multivariate_normal(mean, cov)
+                x[3], x[4], x[12] = bg_init
+        return init_state
+
+    def reset(self):
+        """
+        Reset all patients to their default initial states
+        """
+        n = len(self)
+        self.init_state = self._initial_states(np.arange(n), self._seeds())
+
+        self._last_Qsto = self.init_state[:, 0] + self.init_state[:, 1]
+        self._last_foodtaken = np.zeros(n)
+
+        self._odesolver = ode(_flat_model).set_integrator("dopri5")
+        self._odesolver.set_initial_value(self.init_state.ravel(), self.t0)
+
+        self._last_CHO = np.zeros(n)
+        self._last_insulin = np.zeros(n)
+        self.is_eating = np.zeros(n, dtype=bool)
+        self.planned_meal = np.zeros(n)
+
+    def reset_rows(self, rows, seeds=None):
+        """
+        Restart the patients in rows from their initial states at the current
+        time, the others carrying on. seeds (one per row) replace their seeds
+        for the initial glucose draw.
+        """
+        rows = np.asarray(rows, dtype=np.intp)
+        if seeds is not None:
+            seeds = list(seeds)
+            if self._seed is None or np.isscalar(self._seed):
+                self._seed = self._seeds()
+            for i, seed in zip(rows, seeds):
+                self._seed[i] = seed
+        all_seeds = self._seeds()
+        init_state = self._initial_states(rows, [all_seeds[i] for i in rows])
+        self.init_state[rows] = init_state
+
+        state = self.state.copy()
+        state[rows] = init_state
+        self._odesolver.set_initial_value(state.ravel(), self.t)
+
+        self._last_Qsto[rows] = init_state[:, 0] + init_state[:, 1]
+        self._last_foodtaken[rows] = 0
+        # step() may have stored read-only broadcasts of the last action
+        self._last_CHO = np.array(self._last_CHO)
+        self._last_CHO[rows] = 0
+        self._last_insulin = np.array(self._last_insulin)
+        self._last_insulin[rows] = 0
+        self.is_eating[rows] = False
+        self.planned_meal[rows] = 0
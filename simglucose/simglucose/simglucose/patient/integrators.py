@@ -0,0 +1,111 @@
+"""Fixed-step integrators for the UVa/Padova model"""
+from .model import model_rhs
+from .parameters import params_to_array
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+INTEGRATORS = ("dopri5", "rk4")
+DEFAULT_SUBSTEPS = 2  # RK4 substeps per simulated minute
+
+# the RK4 kernel evaluates the shared right-hand side
+_model = model_rhs
+
+
+def _rk4(x, dt, n_sub, CHO, insulin, p, last_Qsto, last_foodtaken):
+    """
+    Integrate the model over dt minutes with n_sub classic RK4 substeps.
+    """
+    h = dt / n_sub
+    for _ in range(n_sub):
+        k1 = _model(x, CHO, insulin, p, last_Qsto, last_foodtaken)
+        k2 = _model(x + h / 2 * k1, CHO, insulin, p, last_Qsto,
+                    last_foodtaken)
+        k3 = _model(x + h / 2 * k2, CHO, insulin, p, last_Qsto,
+                    last_foodtaken)
+        k4 = _model(x + h * k3, CHO, insulin, p, last_Qsto, last_foodtaken)
+        x = x + h / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+    return x
+
+
+def _rk4_path(x, n_steps, n_sub, CHO, insulin, p, last_Qsto, last_foodtaken):
+    """
+    Integrate n_steps minutes, returning the state at the end of each one.
+    Every minute is advanced exactly as _rk4(x, 1.0, n_sub, ...) would.
+    """
+    path = np.empty((n_steps, x.shape[0]))
+    for i in range(n_steps):
+        x = _rk4(x, 1.0, n_sub, CHO, insulin, p, last_Qsto, last_foodtaken)
+        path[i] = x
+    return path
+
+
+if njit is not None:
+    _model = njit(cache=True)(model_rhs)
+    _rk4 = njit(cache=True)(_rk4)
+    _rk4_path = njit(cache=True)(_rk4_path)
+
+
+class FixedStepODE(object):
+    """
+    Fixed-step replacement for scipy.integrate.ode as used by T1DPatient.
+
+    It exposes the subset of the ode interface T1DPatient relies on
+    (y, t, set_initial_value, set_f_params, successful, integrate) and works
+    on a plain float64 parameter vector, which lets numba compile the kernel
+    when it is installed.
+    """
+    def __init__(self, params, method="rk4", substeps=DEFAULT_SUBSTEPS):
+        if method != "rk4":
+            raise ValueError("Unknown fixed-step method: {}".format(method))
+        self.method = method
+        self.substeps = int(substeps)
+        self._p = params_to_array(params)
+        self._f_params = (0.0, 0.0, 0.0, 0.0)
+        self.y = None
+        self.t = None
+
+    def set_initial_value(self, y, t=0.0):
+        self.y = np.array(y, dtype=np.float64)
+        self.t = t
+        return self
+
+    def set_f_params(self, action, params, last_Qsto, last_foodtaken):
+        """
+        Same arguments as T1DPatient.model. params is ignored: the parameter
+        vector is bound at construction.
+        """
+        self._f_params = (float(action.CHO), float(action.insulin),
+                          float(last_Qsto), float(last_foodtaken))
+        return self
+
+    def successful(self):
+        return bool(np.all(np.isfinite(self.y)))
+
+    def integrate(self, t):
+        CHO, insulin, last_Qsto, last_foodtaken = self._f_params
+        dt = t - self.t
+        n_sub = max(1, int(round(self.substeps * dt)))
+        self.y = _rk4(self.y, dt, n_sub, CHO, insulin, self._p, last_Qsto,
+                      last_foodtaken)
+        self.t = t
+        return self.y
+
+    def integrate_minutes(self, n):
+        """
+        Advance n minutes in one kernel call and return the states at the
+        end of each minute, shape (n, 13). The result is identical to n
+        calls of integrate(t + 1).
+        """
+        CHO, insulin, last_Qsto, last_foodtaken = self._f_params
+        path = _rk4_path(self.y, n, self.substeps, CHO, insulin, self._p,
+                         last_Qsto, last_foodtaken)
+        self.y = path[-1].copy()
+        self.t = self.t + n
+        return path
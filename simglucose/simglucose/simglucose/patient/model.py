@@ -0,0 +1,155 @@
+"""Right-hand side of the UVa/Padova model"""
+from .parameters import PARAM_INDEX
+import numpy as np
+
+# Positions in the parameter vector, resolved at import for the numba kernel
+_BW = PARAM_INDEX["BW"]
+_KMAX = PARAM_INDEX["kmax"]
+_KMIN = PARAM_INDEX["kmin"]
+_KABS = PARAM_INDEX["kabs"]
+_B = PARAM_INDEX["b"]
+_D = PARAM_INDEX["d"]
+_F = PARAM_INDEX["f"]
+_KP1 = PARAM_INDEX["kp1"]
+_KP2 = PARAM_INDEX["kp2"]
+_KP3 = PARAM_INDEX["kp3"]
+_FSNC = PARAM_INDEX["Fsnc"]
+_KE1 = PARAM_INDEX["ke1"]
+_KE2 = PARAM_INDEX["ke2"]
+_K1 = PARAM_INDEX["k1"]
+_K2 = PARAM_INDEX["k2"]
+_VM0 = PARAM_INDEX["Vm0"]
+_VMX = PARAM_INDEX["Vmx"]
+_KM0 = PARAM_INDEX["Km0"]
+_M1 = PARAM_INDEX["m1"]
+_M2 = PARAM_INDEX["m2"]
+_M4 = PARAM_INDEX["m4"]
+_M30 = PARAM_INDEX["m30"]
+_KA1 = PARAM_INDEX["ka1"]
+_KA2 = PARAM_INDEX["ka2"]
+_KD = PARAM_INDEX["kd"]
+_VI = PARAM_INDEX["Vi"]
+_P2U = PARAM_INDEX["p2u"]
+_IB = PARAM_INDEX["Ib"]
+_KI = PARAM_INDEX["ki"]
+_KSC = PARAM_INDEX["ksc"]
+
+
+def model_rhs(x, CHO, insulin, p, last_Qsto, last_foodtaken):
+    """
+    dx/dt of the UVa/Padova model, the one copy of the equations behind
+    T1DPatient.model, batch_model and the RK4 kernel.
+
+    Branches are written as masks, so the same code runs on one patient and,
+    element-wise, on N patients, and compiles with numba.
+    Inputs:
+        - x: state of shape (13,), or (13, N) for N patients
+        - CHO, insulin: in g/min and U/min, scalars or arrays of shape (N,)
+        - p: parameter vector ordered as PARAM_NAMES, shape (P,) or (P, N)
+        - last_Qsto, last_foodtaken: scalars or arrays of shape (N,)
+    Output:
+        dxdt with the shape of x
+    """
+    BW = p[_BW]
+    kmax = p[_KMAX]
+    kmin = p[_KMIN]
+    kabs = p[_KABS]
+    b = p[_B]
+    d = p[_D]
+    f = p[_F]
+    kp1 = p[_KP1]
+    kp2 = p[_KP2]
+    kp3 = p[_KP3]
+    Fsnc = p[_FSNC]
+    ke1 = p[_KE1]
+    ke2 = p[_KE2]
+    k1 = p[_K1]
+    k2 = p[_K2]
+    Vm0 = p[_VM0]
+    Vmx = p[_VMX]
+    Km0 = p[_KM0]
+    m1 = p[_M1]
+    m2 = p[_M2]
+    m4 = p[_M4]
+    m30 = p[_M30]
+    ka1 = p[_KA1]
+    ka2 = p[_KA2]
+    kd = p[_KD]
+    Vi = p[_VI]
+    p2u = p[_P2U]
+    Ib = p[_IB]
+    ki = p[_KI]
+    ksc = p[_KSC]
+
+    dxdt = np.empty_like(x)
+    d_meal = CHO * 1000  # g -> mg
+    insulin = insulin * 6000 / BW  # U/min -> pmol/kg/min
+
+    # Glucose in the stomach
+    qsto = x[0] + x[1]
+    # NOTE: Dbar is in unit mg, hence last_foodtaken needs to be converted
+    # from mg to g. See https://github.com/jxx123/simglucose/issues/41 for
+    # details.
+    Dbar = last_Qsto + last_foodtaken * 1000  # unit: mg
+
+    # Stomach solid
+    dxdt[0] = -kmax * x[0] + d_meal
+
+    # kgut does not depend on Dbar without a meal, 1 keeps the division finite
+    has_meal = Dbar > 0
+    Dsafe = has_meal * Dbar + (Dbar <= 0) * 1.0
+    aa = 5 / (2 * Dsafe * (1 - b))
+    cc = 5 / (2 * Dsafe * d)
+    kgut = has_meal * (
+        kmin + (kmax - kmin) / 2 * (np.tanh(aa * (qsto - b * Dsafe)) -
+                                    np.tanh(cc * (qsto - d * Dsafe)) + 2)
+    ) + (Dbar <= 0) * kmax
+
+    # stomach liquid
+    dxdt[1] = kmax * x[0] - x[1] * kgut
+
+    # intestine
+    dxdt[2] = kgut * x[1] - kabs * x[2]
+
+    # Rate of appearance
+    Rat = f * kabs * x[2] / BW
+    # Glucose Production
+    EGPt = kp1 - kp2 * x[3] - kp3 * x[8]
+    # renal excretion
+    Et = (x[3] > ke2) * (ke1 * (x[3] - ke2))
+
+    # glucose kinetics
+    # plus dextrose IV injection input u[2] if needed
+    dxdt[3] = (x[3] >= 0) * (np.maximum(EGPt, 0.0) + Rat - Fsnc - Et -
+                             k1 * x[3] + k2 * x[4])
+
+    Vmt = Vm0 + Vmx * x[6]
+    Uidt = Vmt * x[4] / (Km0 + x[4])
+    dxdt[4] = (x[4] >= 0) * (-Uidt + k1 * x[3] - k2 * x[4])
+
+    # insulin kinetics
+    # plus insulin IV injection u[3] if needed
+    dxdt[5] = (x[5] >= 0) * (-(m2 + m4) * x[5] + m1 * x[9] + ka1 * x[10] +
+                             ka2 * x[11])
+    It = x[5] / Vi
+
+    # insulin action on glucose utilization
+    dxdt[6] = -p2u * x[6] + p2u * (It - Ib)
+
+    # insulin action on production
+    dxdt[7] = -ki * (x[7] - It)
+
+    dxdt[8] = -ki * (x[8] - x[7])
+
+    # insulin in the liver (pmol/kg)
+    dxdt[9] = (x[9] >= 0) * (-(m1 + m30) * x[9] + m2 * x[5])
+
+    # subcutaneous insulin kinetics
+    dxdt[10] = (x[10] >= 0) * (insulin - (ka1 + kd) * x[10])
+
+    dxdt[11] = (x[11] >= 0) * (kd * x[10] - ka2 * x[11])
+
+    # subcutaneous glucose
+    dxdt[12] = (x[12] >= 0) * (-ksc * x[12] + ksc * x[3])
+
+    return dxdt
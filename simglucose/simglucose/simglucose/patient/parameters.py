@@ -0,0 +1,47 @@
+"""Float-array views of the virtual patient parameters"""
+import numpy as np
+import pandas as pd
+
+# Model parameters in the column order of the (N, P) parameter array.
+PARAM_NAMES = (
+    "BW", "u2ss", "kmax", "kmin", "kabs", "b", "d", "f", "kp1", "kp2", "kp3",
+    "Fsnc", "ke1", "ke2", "k1", "k2", "Vm0", "Vmx", "Km0", "m1", "m2", "m4",
+    "m30", "ka1", "ka2", "kd", "Vi", "p2u", "Ib", "ki", "ksc", "Vg",
+)
+PARAM_INDEX = {name: i for i, name in enumerate(PARAM_NAMES)}
+STATE_NAMES = tuple("x0_{:2d}".format(i) for i in range(1, 14))
+
+
+def _is_table(params):
+    return isinstance(params, pd.DataFrame) or (
+        isinstance(params, np.ndarray) and params.dtype.names is not None)
+
+
+def _columns(params, names):
+    if isinstance(params, pd.DataFrame):
+        return params.loc[:, list(names)].to_numpy(dtype=np.float64)
+    if _is_table(params):
+        return np.column_stack([params[name] for name in names]).astype(
+            np.float64)
+    return np.array([params[name] for name in names], dtype=np.float64)
+
+
+def params_to_array(params):
+    """
+    Convert patient parameters to a float64 array.
+    Inputs:
+        - params: one patient (a pandas Series or a record from
+          simglucose.registry) or a table of patients (a DataFrame or a
+          record array), e.g. rows of vpatient_params.csv
+    Output:
+        an array of shape (P,) or (N, P), columns ordered as PARAM_NAMES
+    """
+    return np.ascontiguousarray(_columns(params, PARAM_NAMES))
+
+
+def init_state_from_params(params):
+    """
+    Default initial state (x0_ 1 ... x0_13) of one patient, shape (13,), or
+    of a table of patients, shape (N, 13).
+    """
+    return _columns(params, STATE_NAMES)
@@ -1,40 +1,77 @@
 from .base import Patient
+from .integrators import INTEGRATORS, DEFAULT_SUBSTEPS, FixedStepODE
+from .model import model_rhs
+from .parameters import PARAM_INDEX, params_to_array, init_state_from_params
+from simglucose import registry
 import numpy as np
-from scipy.integrate import ode
-import pandas as pd
+from scipy.integrate import ode, solve_ivp
 from collections import namedtuple
+import copy
 import logging
-import pkg_resources
 
 logger = logging.getLogger(__name__)
 
+_BW = PARAM_INDEX["BW"]
+_U2SS = PARAM_INDEX["u2ss"]
+
 Action = namedtuple("patient_action", ["CHO", "insulin"])
 Observation = namedtuple("observation", ["Gsub"])
-
-PATIENT_PARA_FILE = pkg_resources.resource_filename(
-    "simglucose", "params/vpatient_params.csv"
+PatientSnapshot = namedtuple(
+    "patient_snapshot",
+    [
+        "t",
+        "state",
+        "last_Qsto",
+        "last_foodtaken",
+        "last_action",
+        "is_eating",
+        "planned_meal",
+    ],
 )
 
+PATIENT_PARA_FILE = registry.PATIENT_PARA_FILE
+
 
 class T1DPatient(Patient):
     SAMPLE_TIME = 1  # min
     EAT_RATE = 5  # g/min CHO
 
-    def __init__(self, params, init_state=None, random_init_bg=False, seed=None, t0=0):
+    def __init__(
+        self,
+        params,
+        init_state=None,
+        random_init_bg=False,
+        seed=None,
+        t0=0,
+        integrator="dopri5",
+        substeps=None,
+    ):
         """
         T1DPatient constructor.
         Inputs:
-            - params: a pandas sequence
+            - params: a pandas sequence or a record from simglucose.registry
             - init_state: customized initial state.
               If not specified, load the default initial state in
-              params.iloc[2:15]
+              params["x0_ 1"] ... params["x0_13"]
             - t0: simulation start time, it is 0 by default
+            - integrator: "dopri5" (scipy, the reference) or "rk4" (fixed
+              step, compiled with numba when it is installed)
+            - substeps: number of RK4 substeps per minute, only used by the
+              fixed-step integrator
         """
+        if integrator not in INTEGRATORS:
+            raise ValueError(
+                "integrator must be one of {}, got {}".format(INTEGRATORS, integrator)
+            )
         self._params = params
+        # what the solver is given: model_rhs reads a float vector
+        self._param_vector = params_to_array(params)
         self._init_state = init_state
         self.random_init_bg = random_init_bg
         self._seed = seed
         self.t0 = t0
+        self.integrator = integrator
+        self.substeps = DEFAULT_SUBSTEPS if substeps is None else substeps
         self.reset()
 
     @classmethod
@@ -46,9 +83,7 @@ class T1DPatient(Patient):
         11 - 20: adult#001 - adult#001
         21 - 30: child#001 - child#010
         """
-        patient_params = pd.read_csv(PATIENT_PARA_FILE)
-        params = patient_params.iloc[patient_id - 1, :]
-        return cls(params, **kwargs)
+        return cls(registry.patients.get_id(patient_id), **kwargs)
 
     @classmethod
     def withName(cls, name, **kwargs):
@@ -59,9 +94,7 @@ class T1DPatient(Patient):
             adult#001 - adult#001
             child#001 - child#010
         """
-        patient_params = pd.read_csv(PATIENT_PARA_FILE)
-        params = patient_params.loc[patient_params.Name == name].squeeze()
-        return cls(params, **kwargs)
+        return cls(registry.patients.get(name), **kwargs)
 
     @property
     def state(self):
@@ -103,7 +136,7 @@ class T1DPatient(Patient):
 
         # ODE solver
         self._odesolver.set_f_params(
-            action, self._params, self._last_Qsto, self._last_foodtaken
+            action, self._param_vector, self._last_Qsto, self._last_foodtaken
         )
         if self._odesolver.successful():
             self._odesolver.integrate(self._odesolver.t + self.sample_time)
@@ -111,97 +144,135 @@ class T1DPatient(Patient):
             logger.error("ODE solver failed!!")
             raise
 
-    @staticmethod
-    def model(t, x, action, params, last_Qsto, last_foodtaken):
-        dxdt = np.zeros(13)
-        d = action.CHO * 1000  # g -> mg
-        insulin = action.insulin * 6000 / params.BW  # U/min -> pmol/kg/min
-        basal = params.u2ss * params.BW / 6000  # U/min
-
-        # Glucose in the stomach
-        qsto = x[0] + x[1]
-        # NOTE: Dbar is in unit mg, hence last_foodtaken needs to be converted
-        # from mg to g. See https://github.com/jxx123/simglucose/issues/41 for
-        # details.
-        Dbar = last_Qsto + last_foodtaken * 1000  # unit: mg
-
-        # Stomach solid
-        dxdt[0] = -params.kmax * x[0] + d
-
-        if Dbar > 0:
-            aa = 5 / (2 * Dbar * (1 - params.b))
-            cc = 5 / (2 * Dbar * params.d)
-            kgut = params.kmin + (params.kmax - params.kmin) / 2 * (
-                np.tanh(aa * (qsto - params.b * Dbar))
-                - np.tanh(cc * (qsto - params.d * Dbar))
-                + 2
-            )
-        else:
-            kgut = params.kmax
-
-        # stomach liquid
-        dxdt[1] = params.kmax * x[0] - x[1] * kgut
-
-        # intestine
-        dxdt[2] = kgut * x[1] - params.kabs * x[2]
-
-        # Rate of appearance
-        Rat = params.f * params.kabs * x[2] / params.BW
-        # Glucose Production
-        EGPt = params.kp1 - params.kp2 * x[3] - params.kp3 * x[8]
-        # Glucose Utilization
-        Uiit = params.Fsnc
-
-        # renal excretion
-        if x[3] > params.ke2:
-            Et = params.ke1 * (x[3] - params.ke2)
-        else:
-            Et = 0
-
-        # glucose kinetics
-        # plus dextrose IV injection input u[2] if needed
-        dxdt[3] = max(EGPt, 0) + Rat - Uiit - Et - params.k1 * x[3] + params.k2 * x[4]
-        dxdt[3] = (x[3] >= 0) * dxdt[3]
-
-        Vmt = params.Vm0 + params.Vmx * x[6]
-        Kmt = params.Km0
-        Uidt = Vmt * x[4] / (Kmt + x[4])
-        dxdt[4] = -Uidt + params.k1 * x[3] - params.k2 * x[4]
-        dxdt[4] = (x[4] >= 0) * dxdt[4]
-
-        # insulin kinetics
-        dxdt[5] = (
-            -(params.m2 + params.m4) * x[5]
-            + params.m1 * x[9]
-            + params.ka1 * x[10]
-            + params.ka2 * x[11]
-        )  # plus insulin IV injection u[3] if needed
-        It = x[5] / params.Vi
-        dxdt[5] = (x[5] >= 0) * dxdt[5]
-
-        # insulin action on glucose utilization
-        dxdt[6] = -params.p2u * x[6] + params.p2u * (It - params.Ib)
-
-        # insulin action on production
-        dxdt[7] = -params.ki * (x[7] - It)
-
-        dxdt[8] = -params.ki * (x[8] - x[7])
+    def multi_step(self, action, n):
+        """
+        Advance n minutes under a constant action and return the
+        subcutaneous glucose at the end of each minute, shape (n,).
 
-        # insulin in the liver (pmol/kg)
-        dxdt[9] = -(params.m1 + params.m30) * x[9] + params.m2 * x[5]
-        dxdt[9] = (x[9] >= 0) * dxdt[9]
+        When no food is involved (action.CHO == 0 and no planned meal left)
+        the meal bookkeeping is constant over the interval, so the n minutes
+        are integrated in a single solver call. Otherwise this falls back to
+        n calls of step().
+        """
+        if action.CHO > 0 or self.planned_meal > 0:
+            Gsub = np.empty(n)
+            for i in range(n):
+                self.step(action)
+                Gsub[i] = self.observation.Gsub
+            return Gsub
+
+        t0 = self.t
+        states = self._hold(action.insulin, t0 + n, t0 + np.arange(1, n + 1))
+        return states[:, 12] / self._params.Vg
+
+    def simulate_schedule(self, schedule, t_end, t_eval):
+        """
+        Simulate a piecewise-constant input schedule up to time t_end and
+        return the subcutaneous glucose at the times in t_eval, shape
+        (len(t_eval),).
+
+        schedule is a sequence of (t, Action) breakpoints in increasing time,
+        the first one at the current time. Action.CHO is the meal (g)
+        announced at t, as a scenario would, and Action.insulin the rate
+        (U/min) held until the next breakpoint. t_eval is increasing, within
+        (self.t, t_end].
+
+        Minutes in which the patient eats are stepped one by one (their
+        glucose is the one at the end of the minute); the fasting time
+        between them is integrated adaptively in one solver call per
+        breakpoint interval.
+        """
+        t_eval = np.asarray(t_eval, dtype=np.float64)
+        Gsub = np.empty(len(t_eval))
+        times = [t for t, _ in schedule]
+        if not times or times[0] != self.t:
+            raise ValueError("The schedule must start at t = {}".format(self.t))
+        if np.any(np.diff(times) <= 0) or times[-1] >= t_end:
+            raise ValueError("Breakpoints must increase and precede t_end")
+
+        k = 0
+        for (_, action), te in zip(schedule, times[1:] + [t_end]):
+            CHO = action.CHO
+            while self.t < te and (CHO > 0 or self.planned_meal > 0):
+                self.step(action._replace(CHO=CHO))
+                CHO = 0
+                while k < len(t_eval) and t_eval[k] <= self.t:
+                    Gsub[k] = self.observation.Gsub
+                    k += 1
+            if self.t < te:
+                j = np.searchsorted(t_eval, te, side="right")
+                states = self._hold(action.insulin, te, t_eval[k:j])
+                Gsub[k:j] = states[:, 12] / self._params.Vg
+                k = j
+        return Gsub
+
+    def _hold(self, insulin, t_end, t_eval):
+        """
+        Integrate to t_end under a constant insulin rate and no food,
+        returning the states at t_eval
+        """
+        # What the first of a run of step() calls would do; the remaining
+        # ones leave the bookkeeping unchanged
+        if self._last_action.CHO > 0:
+            logger.info("t = {}, Patient finishes eating!".format(self.t))
+            self.is_eating = False
+        self._last_action = Action(CHO=0, insulin=insulin)
 
-        # subcutaneous insulin kinetics
-        dxdt[10] = insulin - (params.ka1 + params.kd) * x[10]
-        dxdt[10] = (x[10] >= 0) * dxdt[10]
+        self._odesolver.set_f_params(
+            self._last_action,
+            self._param_vector,
+            self._last_Qsto,
+            self._last_foodtaken,
+        )
+        if not self._odesolver.successful():
+            logger.error("ODE solver failed!!")
+            raise RuntimeError("ODE solver failed")
+        return self._integrate_span(t_end, t_eval)
 
-        dxdt[11] = params.kd * x[10] - params.ka2 * x[11]
-        dxdt[11] = (x[11] >= 0) * dxdt[11]
+    def _integrate_span(self, t_end, t_eval):
+        """
+        States at t_eval on the way to t_end, from one solver call
+        """
+        t0 = self._odesolver.t
+        if self.integrator != "dopri5":
+            # the fixed-step path is computed on the minute grid
+            path = self._odesolver.integrate_minutes(int(round(t_end - t0)))
+            idx = np.round(np.asarray(t_eval) - t0).astype(int) - 1
+            return path[idx]
+
+        # scipy's ode has no dense output; solve_ivp runs the same
+        # Dormand-Prince pair with the dopri5 default tolerances
+        ts = np.union1d(t_eval, [t_end])
+        sol = solve_ivp(
+            self.model,
+            (t0, t_end),
+            self._odesolver.y,
+            method="RK45",
+            t_eval=ts,
+            args=self._odesolver.f_params,
+            rtol=1e-6,
+            atol=1e-12,
+        )
+        if not sol.success:
+            logger.error("ODE solver failed!!")
+            raise RuntimeError(sol.message)
+        states = sol.y.T
+        self._odesolver.set_initial_value(states[-1], t_end)
+        return states[np.searchsorted(ts, t_eval)]
 
-        # subcutaneous glucose
-        dxdt[12] = -params.ksc * x[12] + params.ksc * x[3]
-        dxdt[12] = (x[12] >= 0) * dxdt[12]
+    @staticmethod
+    def model(t, x, action, params, last_Qsto, last_foodtaken):
+        """
+        dx/dt of the patient, see model.model_rhs. params is a record, a
+        pandas Series or a float vector ordered as PARAM_NAMES.
+        """
+        if not isinstance(params, np.ndarray):
+            params = params_to_array(params)
+        dxdt = model_rhs(
+            x, action.CHO, action.insulin, params, last_Qsto, last_foodtaken
+        )
 
+        basal = params[_U2SS] * params[_BW] / 6000  # U/min
         if action.insulin > basal:
             logger.debug("t = {}, injecting insulin: {}".format(t, action.insulin))
 
@@ -235,6 +306,43 @@ class T1DPatient(Patient):
             to_eat = 0
         return to_eat
 
+    def snapshot(self):
+        """
+        Capture everything step() depends on, so that restore() can resume
+        the simulation from this point.
+        """
+        return PatientSnapshot(
+            t=self.t,
+            state=np.array(self.state, dtype=np.float64),
+            last_Qsto=self._last_Qsto,
+            last_foodtaken=self._last_foodtaken,
+            last_action=self._last_action,
+            is_eating=self.is_eating,
+            planned_meal=self.planned_meal,
+        )
+
+    def restore(self, snapshot):
+        """
+        Resume from a PatientSnapshot taken from this or another patient
+        with the same parameters.
+        """
+        self._odesolver = self._new_solver()
+        self._odesolver.set_initial_value(np.copy(snapshot.state), snapshot.t)
+        self._last_Qsto = snapshot.last_Qsto
+        self._last_foodtaken = snapshot.last_foodtaken
+        self._last_action = snapshot.last_action
+        self.is_eating = snapshot.is_eating
+        self.planned_meal = snapshot.planned_meal
+
+    def fork(self):
+        """
+        A new patient sharing the parameters of this one and starting from
+        its current state. The two evolve independently afterwards.
+        """
+        clone = copy.copy(self)
+        clone.restore(self.snapshot())
+        return clone
+
     @property
     def seed(self):
         return self._seed
@@ -249,7 +357,7 @@ class T1DPatient(Patient):
         Reset the patient state to default intial state
         """
         if self._init_state is None:
-            self.init_state = np.copy(self._params.iloc[2:15].values)
+            self.init_state = init_state_from_params(self._params)
         else:
             self.init_state = self._init_state
 
@@ -277,13 +385,20 @@ class T1DPatient(Patient):
         self._last_foodtaken = 0
         self.name = self._params.Name
 
-        self._odesolver = ode(self.model).set_integrator("dopri5")
+        self._odesolver = self._new_solver()
         self._odesolver.set_initial_value(self.init_state, self.t0)
 
         self._last_action = Action(CHO=0, insulin=0)
         self.is_eating = False
         self.planned_meal = 0
 
+    def _new_solver(self):
+        if self.integrator == "dopri5":
+            return ode(self.model).set_integrator("dopri5")
+        return FixedStepODE(
+            self._params, method=self.integrator, substeps=self.substeps
+        )
+
 
 if __name__ == "__main__":
     logger.setLevel(logging.INFO)
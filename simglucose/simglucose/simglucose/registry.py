@@ -0,0 +1,97 @@
+"""
+Process-wide registry of the bundled parameter files.
+
+Each CSV is parsed at most once per process, on first use, into a read-only
+NumPy record array. Lookups by name or id are O(1) and return np.record
+objects, which support both attribute (params.BW) and item (params["BW"])
+access like the pandas rows they replace.
+"""
+import threading
+import pandas as pd
+import pkg_resources
+
+PATIENT_PARA_FILE = pkg_resources.resource_filename(
+    "simglucose", "params/vpatient_params.csv"
+)
+SENSOR_PARA_FILE = pkg_resources.resource_filename(
+    "simglucose", "params/sensor_params.csv"
+)
+INSULIN_PUMP_PARA_FILE = pkg_resources.resource_filename(
+    "simglucose", "params/pump_params.csv"
+)
+CONTROL_QUEST = pkg_resources.resource_filename("simglucose", "params/Quest.csv")
+
+
+class ParamTable(object):
+    """
+    Immutable, lazily loaded view of one parameter CSV.
+    """
+
+    def __init__(self, filename, kind="parameters"):
+        self.filename = filename
+        self.kind = kind
+        self._records = None
+        self._index = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._records is None:
+                records = pd.read_csv(self.filename).to_records(index=False)
+                records.flags.writeable = False
+                self._index = {name: i for i, name in enumerate(records.Name)}
+                self._records = records
+        return self._records
+
+    @property
+    def records(self):
+        """Read-only record array holding the whole table"""
+        if self._records is None:
+            return self._load()
+        return self._records
+
+    @property
+    def names(self):
+        return tuple(self.records.Name)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, name):
+        if self._index is None:
+            self._load()
+        return name in self._index
+
+    def index(self, name):
+        """Row number of name"""
+        if self._index is None:
+            self._load()
+        try:
+            return self._index[name]
+        except KeyError:
+            raise KeyError("Unknown {} name: {}".format(self.kind, name)) from None
+
+    def get(self, name):
+        """Parameters of name, as an np.record"""
+        return self.records[self.index(name)]
+
+    def get_id(self, i):
+        """Parameters of the i-th row, counting from 1"""
+        if not 1 <= i <= len(self):
+            raise KeyError("{} id must be in [1, {}], got {}".format(
+                self.kind, len(self), i))
+        return self.records[i - 1]
+
+    def take(self, names):
+        """Record array with the rows of names, in order (names may repeat)"""
+        return self.records[[self.index(n) for n in names]]
+
+    def to_frame(self):
+        """A new DataFrame with the whole table"""
+        return pd.DataFrame.from_records(self.records)
+
+
+patients = ParamTable(PATIENT_PARA_FILE, kind="patient")
+sensors = ParamTable(SENSOR_PARA_FILE, kind="sensor")
+pumps = ParamTable(INSULIN_PUMP_PARA_FILE, kind="pump")
+quests = ParamTable(CONTROL_QUEST, kind="quest")
@@ -1,15 +1,25 @@
 # from .noise_gen import CGMNoiseGenerator
 from .noise_gen import CGMNoise
-import pandas as pd
+from simglucose import registry
+from collections import namedtuple
+import numpy as np
+import copy
 import logging
-import pkg_resources
 
 logger = logging.getLogger(__name__)
-SENSOR_PARA_FILE = pkg_resources.resource_filename(
-    'simglucose', 'params/sensor_params.csv')
+SENSOR_PARA_FILE = registry.SENSOR_PARA_FILE
+SensorSnapshot = namedtuple('sensor_snapshot', ['noise_generator', 'noise',
+                                                'noise_pos', 'last_CGM'])
 
 
 class CGMSensor(object):
+    """
+    The noise of a whole episode (NOISE_MINUTES of samples) is generated up
+    front with CGMNoise.generate and read by position, the next block being
+    generated when an episode runs longer.
+    """
+    NOISE_MINUTES = 1440  # minutes of noise generated at once
+
     def __init__(self, params, seed=None):
         self._params = params
         self.name = params.Name
@@ -19,22 +29,38 @@ class CGMSensor(object):
 
     @classmethod
     def withName(cls, name, **kwargs):
-        sensor_params = pd.read_csv(SENSOR_PARA_FILE)
-        params = sensor_params.loc[sensor_params.Name == name].squeeze()
-        return cls(params, **kwargs)
+        return cls(registry.sensors.get(name), **kwargs)
 
     def measure(self, patient):
         if patient.t % self.sample_time == 0:
-            BG = patient.observation.Gsub
-            CGM = BG + next(self._noise_generator)
-            CGM = max(CGM, self._params["min"])
-            CGM = min(CGM, self._params["max"])
-            self._last_CGM = CGM
-            return CGM
+            return self._sample(patient.observation.Gsub)
+
+        # Zero-Order Hold
+        return self._last_CGM
+
+    def measure_at(self, t, BG):
+        """
+        Same as measure, for a patient whose time is t and whose
+        subcutaneous glucose is BG
+        """
+        if t % self.sample_time == 0:
+            return self._sample(BG)
 
         # Zero-Order Hold
         return self._last_CGM
 
+    def _sample(self, BG):
+        if self._noise_pos == len(self._noise):
+            self._noise = self._noise_generator.generate(
+                self.NOISE_MINUTES // self.sample_time)
+            self._noise_pos = 0
+        CGM = BG + self._noise[self._noise_pos]
+        self._noise_pos += 1
+        CGM = max(CGM, self._params["min"])
+        CGM = min(CGM, self._params["max"])
+        self._last_CGM = CGM
+        return CGM
+
     @property
     def seed(self):
         return self._seed
@@ -42,13 +68,107 @@ class CGMSensor(object):
     @seed.setter
     def seed(self, seed):
         self._seed = seed
-        self._noise_generator = CGMNoise(self._params, seed=seed)
+        self._new_noise()
+
+    def snapshot(self):
+        """Position of the noise sequence and the zero-order hold value"""
+        # the noise block is replaced, never written to, so it is shared
+        return SensorSnapshot(noise_generator=copy.deepcopy(self._noise_generator),
+                              noise=self._noise, noise_pos=self._noise_pos,
+                              last_CGM=self._last_CGM)
+
+    def restore(self, snapshot):
+        self._noise_generator = copy.deepcopy(snapshot.noise_generator)
+        self._noise = snapshot.noise
+        self._noise_pos = snapshot.noise_pos
+        self._last_CGM = snapshot.last_CGM
+
+    def fork(self):
+        clone = copy.copy(self)
+        clone.restore(self.snapshot())
+        return clone
 
     def reset(self):
         logger.debug('Resetting CGM sensor ...')
-        self._noise_generator = CGMNoise(self._params, seed=self.seed)
+        self._new_noise()
         self._last_CGM = 0
 
+    def _new_noise(self):
+        self._noise_generator = CGMNoise(self._params, seed=self.seed)
+        self._noise = np.empty(0)
+        self._noise_pos = 0
+
+
+class BatchCGMSensor(object):
+    """
+    N sensors of the same model, each with its own noise sequence, sampled
+    at once for N patients sharing the same time (e.g. a BatchT1DPatient).
+
+    The noise of each sensor is read from a row of an (N, BLOCK) buffer,
+    refilled with CGMNoise.generate, so it is the sequence of
+    CGMSensor(params, seed) for the seed of that row.
+    """
+    BLOCK = 288  # noise values buffered per sensor
+
+    def __init__(self, params, seeds):
+        self._params = params
+        self.name = params.Name
+        self.sample_time = params.sample_time
+        self.seeds = list(seeds)
+        self.reset()
+
+    @classmethod
+    def withName(cls, name, seeds):
+        return cls(registry.sensors.get(name), seeds)
+
+    def __len__(self):
+        return len(self.seeds)
+
+    def measure(self, t, BG, rows=None):
+        """
+        CGM of the sensors in rows (all of them by default), for patients
+        whose time is t and whose subcutaneous glucose is BG
+        """
+        if rows is None:
+            rows = np.arange(len(self))
+        if t % self.sample_time == 0:
+            CGM = np.clip(BG + self._next_noise(rows), self._params["min"],
+                          self._params["max"])
+            self._last_CGM[rows] = CGM
+            return CGM
+
+        # Zero-Order Hold
+        return self._last_CGM[rows]
+
+    def _next_noise(self, rows):
+        for i in rows[self._pos[rows] == self.BLOCK]:
+            self._noise[i] = self._noise_generators[i].generate(self.BLOCK)
+            self._pos[i] = 0
+        noise = self._noise[rows, self._pos[rows]]
+        self._pos[rows] += 1
+        return noise
+
+    def reset_rows(self, rows, seeds=None):
+        """
+        Restart the noise of the sensors in rows, from new seeds if given
+        """
+        if seeds is not None:
+            for i, seed in zip(rows, seeds):
+                self.seeds[i] = seed
+        for i in rows:
+            self._noise_generators[i] = CGMNoise(self._params,
+                                                 seed=self.seeds[i])
+            self._pos[i] = self.BLOCK
+            self._last_CGM[i] = 0
+
+    def reset(self):
+        n = len(self)
+        self._noise_generators = [None] * n
+        self._noise = np.empty((n, self.BLOCK))
+        self._pos = np.full(n, self.BLOCK)
+        self._last_CGM = np.zeros(n)
+        self.reset_rows(range(n))
+
 
 if __name__ == '__main__':
     pass
@@ -1,7 +1,7 @@
+from simglucose import trace_cache
 import numpy as np
 from scipy.interpolate import interp1d
 import math
-from collections import deque
 import logging
 import matplotlib.pyplot as plt
 
@@ -15,8 +15,15 @@ def johnson_transform_SU(xi, lam, gamma, delta, x):
 class CGMNoise(object):
     PRECOMPUTE = 10  # length of pre-compute noise sequence
     MDL_SAMPLE_TIME = 15
-
-    def __init__(self, params, n=np.inf, seed=None):
+    BLOCK = 32  # number of PRECOMPUTE sequences generated at once
+    # sensor parameters the noise depends on
+    PARAM_NAMES = ("PACF", "gamma", "lambda", "delta", "xi", "sample_time")
+
+    def __init__(self, params, n=np.inf, seed=None, use_cache=True):
+        """
+        use_cache - read the first values from the trace cache when it is
+                    enabled, see simglucose.trace_cache
+        """
         self._params = params
         self.seed = seed
         # self._noise15_gen = self._noise15_generator()
@@ -25,50 +32,116 @@ class CGMNoise(object):
 
         self.n = n
         self.count = 0
-        self.noise = deque()
-
-    def _get_noise_seq(self):
+        self.noise = np.empty(0)
+        self._pos = 0
+        self._trace = self._load_trace() if use_cache else None
+
+    def _load_trace(self):
+        length = int(trace_cache.horizon_days() * 1440 //
+                     self._params["sample_time"])
+        length = int(min(length, self.n))
+        params = [(k, self._params[k]) for k in self.PARAM_NAMES]
+
+        def generate():
+            noise = CGMNoise(self._params, seed=self.seed, use_cache=False)
+            return noise.generate(length)
+
+        return trace_cache.load("cgm_noise", params, self.seed, length,
+                                generate)
+
+    def _leave_trace(self):
+        # the generator has not moved while values came from the cached
+        # trace; bring it to the same position
+        self._trace = None
+        self._draw(self.count)
+
+    def _get_noise_seq(self, n_seq=1):
+        """
+        The next n_seq noise sequences, concatenated. Each sequence is the
+        cubic interpolation of PRECOMPUTE + 1 noise values sampled every
+        MDL_SAMPLE_TIME minutes; the sequences are interpolated together,
+        which gives the same values as interpolating them one by one.
+        """
         # To make the noise sequence continous, keep the last noise as the
         # beginning of the new sequence
-        noise15 = [self._noise_init]
-        noise15.extend([next(self._noise15_gen)
-                        for _ in range(self.PRECOMPUTE)])
+        noise15 = np.empty(n_seq * self.PRECOMPUTE + 1)
+        noise15[0] = self._noise_init
+        noise15[1:] = self._noise15_gen.take(n_seq * self.PRECOMPUTE)
         self._noise_init = noise15[-1]
 
-        noise15 = np.array(noise15)
-        t15 = np.array(range(0, len(noise15))) * self.MDL_SAMPLE_TIME
+        # column j holds the 15-minute points of sequence j
+        idx = np.arange(self.PRECOMPUTE + 1)[:, None] + \
+            self.PRECOMPUTE * np.arange(n_seq)
+        t15 = np.array(range(0, self.PRECOMPUTE + 1)) * self.MDL_SAMPLE_TIME
 
         nsample = int(math.floor(
             self.PRECOMPUTE * self.MDL_SAMPLE_TIME / self._params["sample_time"])) + 1
         t = np.array(range(0, nsample)) * self._params["sample_time"]
 
-        interp_f = interp1d(t15, noise15, kind='cubic')
+        interp_f = interp1d(t15, noise15[idx], kind='cubic', axis=0)
         noise = interp_f(t)
-        noise2return = deque(noise[1:])
-
-        # logger.debug('New noise sampled every 15 min:\n{}'.format(noise15))
-        # logger.debug('New noise sequence:\n{}'.format(noise2return))
-
-        # plt.plot(t15, noise15, 'o')
-        # plt.plot(t, noise, '.-')
-        # plt.show()
-
-        return noise2return
+        return noise[1:].T.ravel()
+
+    def generate(self, n):
+        """
+        The next n noise values as an array, same as n calls of next()
+        """
+        n = int(min(n, self.n - self.count))
+        k = 0
+        if self._trace is not None:
+            k = max(0, min(n, len(self._trace) - self.count))
+            cached = self._trace[self.count:self.count + k]
+            self.count += k
+            if k == n:
+                return np.array(cached)
+            self._leave_trace()
+            return np.concatenate([cached, self.generate(n - k)])
+        out = self._draw(n)
+        self.count += n
+        return out
+
+    def _draw(self, n):
+        out = np.empty(n)
+        filled = 0
+        while filled < n:
+            if self._pos == len(self.noise):
+                self.noise = self._get_noise_seq(self.BLOCK)
+                self._pos = 0
+            k = min(n - filled, len(self.noise) - self._pos)
+            out[filled:filled + k] = self.noise[self._pos:self._pos + k]
+            self._pos += k
+            filled += k
+        return out
 
     def __iter__(self):
         return self
 
     def __next__(self):
         if self.count < self.n:
-            if len(self.noise) == 0:
+            if self._trace is not None:
+                if self.count < len(self._trace):
+                    self.count += 1
+                    return self._trace[self.count - 1]
+                self._leave_trace()
+            if self._pos == len(self.noise):
                 logger.debug('Generating a new noise sequence ...')
-                self.noise = self._get_noise_seq()
+                self.noise = self._get_noise_seq(self.BLOCK)
+                self._pos = 0
             self.count += 1
-            return self.noise.popleft()
+            self._pos += 1
+            return self.noise[self._pos - 1]
         else:
             raise StopIteration()
 
 
+def cgm_noise(params, n, seed=None):
+    """
+    The first n values of CGMNoise(params, seed=seed) as an array, e.g. the
+    noise of a whole episode.
+    """
+    return CGMNoise(params, seed=seed).generate(n)
+
+
 class noise15_iter:
     def __init__(self, params, seed=None, n=np.inf):
         self.seed = seed
@@ -81,6 +154,31 @@ class noise15_iter:
     def __iter__(self):
         return self
 
+    def take(self, k):
+        """
+        The next k values as an array, same as k calls of next()
+        """
+        k = int(min(k, self.n - self.count))
+        if k <= 0:
+            return np.empty(0)
+        z = self.rand_gen.randn(k)
+        e = np.empty(k)
+        i = 0
+        if self.count == 0:
+            self.e = z[0]
+            e[0] = self.e
+            i = 1
+        PACF = self._params["PACF"]
+        for j in range(i, k):
+            self.e = PACF * (self.e + z[j])
+            e[j] = self.e
+        self.count += k
+        return johnson_transform_SU(self._params["xi"],
+                                    self._params["lambda"],
+                                    self._params["gamma"],
+                                    self._params["delta"],
+                                    e)
+
     def __next__(self):
         if self.count == 0:
             self.e = self.rand_gen.randn()
@@ -0,0 +1,178 @@
+"""
+Streaming storage of simulation trajectories.
+
+A TrajectoryDataset is a directory holding the runs of a batch as one
+partitioned dataset, one file per run under patient=<name>/. Each file has
+an int64 "minutes" column (minutes since the start_time stored in the file
+metadata) and the History columns as float32. A TrajectoryWriter appends
+the rows of a running simulation to its file in row groups, so that the
+history does not need to be kept until the end of the run.
+
+Parquet and Arrow IPC files are written with pyarrow, which is optional.
+"""
+from simglucose.simulation.history import History
+import numpy as np
+import pandas as pd
+import os
+import re
+import logging
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("TrajectoryDataset requires pyarrow")
+
+
+def schema(start_time=None):
+    """Schema of a trajectory file"""
+    _require_pyarrow()
+    fields = [pa.field("minutes", pa.int64())]
+    fields += [pa.field(name, pa.float32()) for name in History.COLUMNS]
+    metadata = None
+    if start_time is not None:
+        metadata = {b"start_time": str(start_time).encode("utf-8")}
+    return pa.schema(fields, metadata=metadata)
+
+
+class TrajectoryDataset(object):
+    """
+    Directory of trajectory files, partitioned by patient.
+
+    The object only holds settings, so that it can be sent to worker
+    processes; every run opens its own writer.
+        root           - directory of the dataset
+        format         - "parquet" or "arrow" (IPC file)
+        row_group_size - number of rows written at once
+        trim_history   - drop the rows written from the env history, so
+                         that memory stays constant over long runs. The
+                         env then only keeps the rows not yet written.
+    """
+
+    def __init__(self, root, format="parquet", row_group_size=1024,
+                 trim_history=False):
+        if format not in FORMATS:
+            raise ValueError("format must be one of {}, got {}".format(
+                tuple(FORMATS), format))
+        _require_pyarrow()
+        self.root = root
+        self.format = format
+        self.row_group_size = row_group_size
+        self.trim_history = trim_history
+
+    def path(self, patient_name, run_id):
+        partition = "patient={}".format(re.sub(r"[^\w#.-]", "_", patient_name))
+        return os.path.join(self.root, partition,
+                            str(run_id) + FORMATS[self.format])
+
+    def writer(self, patient_name, run_id, start_time, keep=0):
+        """A TrajectoryWriter for a run, replacing any file of the same id"""
+        return TrajectoryWriter(self.path(patient_name, run_id), start_time,
+                                format=self.format,
+                                row_group_size=self.row_group_size,
+                                trim_history=self.trim_history, keep=keep)
+
+    def files(self):
+        """Paths of the trajectory files, sorted"""
+        ext = FORMATS[self.format]
+        paths = []
+        for root, dirs, files in os.walk(self.root):
+            paths += [os.path.join(root, f) for f in files if f.endswith(ext)]
+        return sorted(paths)
+
+    def to_arrow_dataset(self):
+        """The whole dataset as a pyarrow.dataset.Dataset"""
+        fmt = "parquet" if self.format == "parquet" else "ipc"
+        return ds.dataset(self.files(), format=fmt,
+                          partitioning=ds.partitioning(flavor="hive"),
+                          partition_base_dir=self.root)
+
+    def read(self, path):
+        """One trajectory file as a DataFrame indexed by Time"""
+        if self.format == "parquet":
+            table = pq.read_table(path)
+        else:
+            with pa.memory_map(path) as source:
+                table = pa.ipc.open_file(source).read_all()
+        start_time = pd.Timestamp(
+            table.schema.metadata[b"start_time"].decode("utf-8"))
+        minutes = table.column("minutes").to_numpy()
+        index = pd.DatetimeIndex(start_time + pd.to_timedelta(minutes, unit="min"),
+                                 name="Time")
+        return pd.DataFrame(
+            {name: table.column(name).to_numpy() for name in History.COLUMNS},
+            index=index)
+
+
+class TrajectoryWriter(object):
+    """
+    Writes the rows of a History to one file as they are completed.
+
+    A row is complete once its action is known, i.e. when the next row is
+    recorded; the last row is written by close().
+    """
+
+    def __init__(self, path, start_time, format="parquet",
+                 row_group_size=1024, trim_history=False, keep=0):
+        """
+        keep - rows left in the history when trim_history is set, e.g. the
+               last hour the reward function reads
+        """
+        _require_pyarrow()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.format = format
+        self.row_group_size = row_group_size
+        self.trim_history = trim_history
+        self.keep = keep
+        self._schema = schema(start_time)
+        self._tmp = path + ".tmp"
+        if format == "parquet":
+            self._writer = pq.ParquetWriter(self._tmp, self._schema)
+        else:
+            self._sink = pa.OSFile(self._tmp, "wb")
+            self._writer = pa.ipc.new_file(self._sink, self._schema)
+        self._written = 0  # rows of the history written
+        self.rows = 0
+
+    def update(self, history):
+        """Write the complete rows of history once a row group is ready"""
+        if len(history) - 1 - self._written >= self.row_group_size:
+            self._write(history, len(history) - 1)
+
+    def _write(self, history, stop):
+        start = self._written
+        if stop <= start:
+            return
+        arrays = [pa.array(np.asarray(history.minutes[start:stop]))]
+        arrays += [
+            pa.array(history.column(name)[start:stop].astype(np.float32))
+            for name in History.COLUMNS
+        ]
+        batch = pa.RecordBatch.from_arrays(arrays, schema=self._schema)
+        self._writer.write_batch(batch)
+        self.rows += stop - start
+        self._written = stop
+        if self.trim_history:
+            drop = max(stop - self.keep, 0)
+            history.discard(drop)
+            self._written -= drop
+
+    def close(self, history):
+        """Write the remaining rows and move the file into place"""
+        self._write(history, len(history))
+        self._writer.close()
+        if self.format != "parquet":
+            self._sink.close()
+        os.replace(self._tmp, self.path)
+        logger.debug("Wrote {} rows to {}".format(self.rows, self.path))
@@ -1,10 +1,16 @@
 from simglucose.patient.t1dpatient import Action
-from simglucose.analysis.risk import risk_index
-import pandas as pd
+from simglucose.analysis.risk import risk_index, risk
+from simglucose.analysis.online import GlucoseStats
+from simglucose.simulation.scenario import parseTime
+from simglucose.simulation.history import History
+import numpy as np
 from datetime import timedelta
+import copy
+import itertools
 import logging
 from collections import namedtuple
-from simglucose.simulation.rendering import Viewer
+from collections.abc import Mapping
+from simglucose.simulation.rendering import AsyncViewer
 
 try:
     from rllab.envs.base import Step
@@ -21,24 +27,123 @@ except ImportError:
 
 
 Observation = namedtuple("Observation", ["CGM"])
+LeanStep = namedtuple("Step", ["observation", "reward", "done", "info"])
+EnvSnapshot = namedtuple(
+    "EnvSnapshot",
+    ["patient", "sensor", "scenario", "n_hist", "episode", "glucose_stats"],
+)
 logger = logging.getLogger(__name__)
+_episode_counter = itertools.count()
+
+
+class LeanObservation(object):
+    """
+    Observation of the lean mode, same fields as Observation. The env keeps
+    one instance and updates it in place at every step. The fields are the
+    entries of one preallocated float64 array, array, in the order of
+    FIELDS, so that a worker can copy the whole observation at once.
+    """
+    __slots__ = ("array",)
+    FIELDS = Observation._fields
+
+    def __init__(self, CGM=0.0):
+        self.array = np.array([CGM], dtype=np.float64)
+
+    @property
+    def CGM(self):
+        return self.array[0]
+
+    @CGM.setter
+    def CGM(self, CGM):
+        self.array[0] = CGM
+
+    def __repr__(self):
+        return "LeanObservation(CGM={})".format(self.CGM)
+
+
+class StepInfo(Mapping):
+    """
+    The info of a lean T1DSimEnv.step. It has the keys of the usual info
+    dict; time and the risk indices are only computed when read, and
+    patient_state is a copy of the patient state made when read. The env
+    keeps one instance and updates it at every step, like the observation.
+    """
+    __slots__ = ("_env", "_minutes", "_BG", "_meal")
+    KEYS = ("sample_time", "patient_name", "meal", "patient_state", "time",
+            "bg", "lbgi", "hbgi", "risk")
+
+    def __init__(self, env, minutes=0, BG=0.0, meal=0.0):
+        self._env = env
+        self._minutes = minutes
+        self._BG = BG
+        self._meal = meal
+
+    def _set(self, minutes, BG, meal):
+        self._minutes = minutes
+        self._BG = BG
+        self._meal = meal
+        return self
+
+    def __getitem__(self, key):
+        if key == "sample_time":
+            return self._env.sample_time
+        if key == "patient_name":
+            return self._env.patient.name
+        if key == "meal":
+            return self._meal
+        if key == "patient_state":
+            return np.array(self._env.patient.state)
+        if key == "time":
+            return self._env.scenario.start_time + timedelta(minutes=self._minutes)
+        if key == "bg":
+            return self._BG
+        if key == "lbgi":
+            return risk(self._BG)[0]
+        if key == "hbgi":
+            return risk(self._BG)[1]
+        if key == "risk":
+            return risk(self._BG)[2]
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self):
+        return len(self.KEYS)
 
 
 def risk_diff(BG_last_hour):
     if len(BG_last_hour) < 2:
         return 0
     else:
-        _, _, risk_current = risk_index([BG_last_hour[-1]], 1)
-        _, _, risk_prev = risk_index([BG_last_hour[-2]], 1)
+        # risk is risk_index of a single value, without its checks
+        _, _, risk_current = risk(BG_last_hour[-1])
+        _, _, risk_prev = risk(BG_last_hour[-2])
         return risk_prev - risk_current
 
 
 class T1DSimEnv(object):
-    def __init__(self, patient, sensor, pump, scenario):
+    def __init__(self, patient, sensor, pump, scenario, macro_step=False, lean=False):
+        """
+        macro_step - integrate the patient over a whole sample period in one
+                     solver call whenever no meal is being eaten in it. The
+                     outputs are averaged over the same one-minute grid as
+                     the default mode.
+        lean       - step() returns a LeanStep whose observation is a
+                     LeanObservation and whose info is a StepInfo, both
+                     updated in place at every step. reward_fun is given a
+                     read-only array of the CGM of the last hour instead of
+                     a list. The risk indices of the history are computed
+                     when it is read.
+        """
         self.patient = patient
         self.sensor = sensor
         self.pump = pump
         self.scenario = scenario
+        self.macro_step = macro_step
+        self.lean = lean
+        self._lean_obs = LeanObservation()
+        self._lean_info = StepInfo(self)
         self._reset()
 
     @property
@@ -63,6 +168,31 @@ class T1DSimEnv(object):
 
         return CHO, insulin, BG, CGM
 
+    def mini_steps(self, action):
+        """
+        Per-minute (CHO, insulin, BG, CGM) over one sample period
+        """
+        if not self.macro_step:
+            for _ in range(int(self.sample_time)):
+                yield self.mini_step(action)
+            return
+
+        n = int(self.sample_time)
+        t0 = self.time
+        meals = self.scenario.actions_between(t0, t0 + timedelta(minutes=n))
+        insulin = self.pump.basal(action.basal) + self.pump.bolus(action.bolus)
+        if any(meals) or self.patient.planned_meal > 0:
+            for CHO in meals:
+                self.patient.step(Action(insulin=insulin, CHO=CHO))
+                BG = self.patient.observation.Gsub
+                yield CHO, insulin, BG, self.sensor.measure(self.patient)
+            return
+
+        t = self.patient.t
+        BGs = self.patient.multi_step(Action(insulin=insulin, CHO=0), n)
+        for i, BG in enumerate(BGs):
+            yield 0, insulin, BG, self.sensor.measure_at(t + i + 1, BG)
+
     def step(self, action, reward_fun=risk_diff):
         """
         action is a namedtuple with keys: basal, bolus
@@ -72,33 +202,30 @@ class T1DSimEnv(object):
         BG = 0.0
         CGM = 0.0
 
-        for _ in range(int(self.sample_time)):
+        for tmp_CHO, tmp_insulin, tmp_BG, tmp_CGM in self.mini_steps(action):
             # Compute moving average as the sample measurements
-            tmp_CHO, tmp_insulin, tmp_BG, tmp_CGM = self.mini_step(action)
             CHO += tmp_CHO / self.sample_time
             insulin += tmp_insulin / self.sample_time
             BG += tmp_BG / self.sample_time
             CGM += tmp_CGM / self.sample_time
 
+        if self.lean:
+            return self._lean_step(CHO, insulin, BG, CGM, reward_fun)
+
         # Compute risk index
         horizon = 1
         LBGI, HBGI, risk = risk_index([BG], horizon)
 
         # Record current action
-        self.CHO_hist.append(CHO)
-        self.insulin_hist.append(insulin)
+        self.history.record_action(CHO, insulin)
 
         # Record next observation
-        self.time_hist.append(self.time)
-        self.BG_hist.append(BG)
-        self.CGM_hist.append(CGM)
-        self.risk_hist.append(risk)
-        self.LBGI_hist.append(LBGI)
-        self.HBGI_hist.append(HBGI)
+        self.history.append(round(self.patient.t), BG, CGM, LBGI, HBGI, risk)
+        self._glucose_stats.update(BG, LBGI, HBGI)
 
         # Compute reward, and decide whether game is over
         window_size = int(60 / self.sample_time)
-        BG_last_hour = self.CGM_hist[-window_size:]
+        BG_last_hour = self.history.column("CGM")[-window_size:].tolist()
         reward = reward_fun(BG_last_hour)
         done = BG < 10 or BG > 600
         obs = Observation(CGM=CGM)
@@ -118,22 +245,150 @@ class T1DSimEnv(object):
             risk=risk,
         )
 
+    def _lean_step(self, CHO, insulin, BG, CGM, reward_fun):
+        minutes = round(self.patient.t)
+        self.history.record_action(CHO, insulin)
+        self.history.append(minutes, BG, CGM)
+        # the risk is added when the history computes it, see _fold_risk
+        self._glucose_stats.update_bg(BG)
+
+        window_size = int(60 / self.sample_time)
+        reward = reward_fun(self.history.column("CGM")[-window_size:])
+        done = BG < 10 or BG > 600
+        self._lean_obs.array[0] = CGM
+        info = self._lean_info._set(minutes, BG, CHO)
+        return LeanStep(self._lean_obs, reward, done, info)
+
+    def simulate_schedule(self, actions, sim_time):
+        """
+        Open-loop simulation over sim_time (a timedelta) from the current
+        time. The inputs are piecewise constant, so the patient is integrated
+        adaptively between input changes (meals from the scenario, changes of
+        the controller action) instead of minute by minute.
+
+        actions - a list of (time, action) pairs, action being a controller
+                  Action held until the next pair. time is parsed like the
+                  times of a CustomScenario. No insulin is delivered before
+                  the first pair.
+
+        The history is extended on the CGM grid as step() would, except that
+        BG and CGM are the values at each sample time instead of averages
+        over the sample period.
+        """
+        sample_time = int(self.sample_time)
+        n_samples = -(-int(sim_time.total_seconds() // 60) // sample_time)
+        n = n_samples * sample_time
+        start = self.time
+        t0 = self.patient.t
+
+        meals = self.scenario.actions_between(start, start + timedelta(minutes=n))
+        rates = np.zeros(n)
+        changes = []
+        for time, action in actions:
+            time = parseTime(time, self.scenario.start_time)
+            changes.append((round((time - start).total_seconds() / 60), action))
+        for i, action in sorted(changes, key=lambda c: c[0]):
+            insulin = self.pump.basal(action.basal) + self.pump.bolus(action.bolus)
+            rates[max(i, 0) :] = insulin
+
+        breaks = np.flatnonzero((meals > 0) | (np.diff(rates, prepend=np.nan) != 0))
+        schedule = [
+            (t0 + i, Action(CHO=meals[i], insulin=rates[i])) for i in breaks
+        ]
+        t_eval = t0 + sample_time * np.arange(1, n_samples + 1)
+        BGs = self.patient.simulate_schedule(schedule, t0 + n, t_eval)
+
+        CHOs = meals.reshape(n_samples, sample_time).sum(axis=1) / sample_time
+        insulins = rates.reshape(n_samples, sample_time).mean(axis=1)
+        for k, (t, BG) in enumerate(zip(t_eval, BGs)):
+            CGM = self.sensor.measure_at(t, BG)
+            LBGI, HBGI, risk = risk_index([BG], 1)
+            self.history.record_action(CHOs[k], insulins[k])
+            self.history.append(round(t), BG, CGM, LBGI, HBGI, risk)
+            self._glucose_stats.update(BG, LBGI, HBGI)
+
+    def snapshot(self):
+        """
+        Capture the state of the patient, the sensor noise and the scenario,
+        plus the history length, so that restore() can branch from here.
+        """
+        return EnvSnapshot(
+            patient=self.patient.snapshot(),
+            sensor=self.sensor.snapshot(),
+            scenario=self.scenario.snapshot(),
+            n_hist=len(self.history),
+            episode=self._episode,
+            glucose_stats=self._glucose_stats.copy(),
+        )
+
+    def restore(self, snapshot):
+        """
+        Go back to a snapshot taken earlier in the current episode of this
+        env or of the env it was forked from. History recorded after the
+        snapshot is discarded.
+        """
+        stale = snapshot.episode != self._episode
+        if stale or snapshot.n_hist > len(self.history):
+            raise ValueError("Snapshot does not belong to the current episode")
+        self.patient.restore(snapshot.patient)
+        self.sensor.restore(snapshot.sensor)
+        self.scenario.restore(snapshot.scenario)
+        self.history.truncate(snapshot.n_hist)
+        stats = snapshot.glucose_stats.copy()
+        if stats.risk_pending:
+            # the risk of its last values may have been computed since
+            self.history.column("Risk")
+            n = len(self.history) - stats.risk_pending
+            stats.add_risk(self.history.column("LBGI")[n:],
+                           self.history.column("HBGI")[n:])
+        self._glucose_stats = stats
+
+    def fork(self):
+        """
+        An independent copy of this env at its current time, for what-if
+        rollouts. Parameters and the pump are shared; patient, sensor,
+        scenario and history are copied.
+        """
+        clone = copy.copy(self)
+        clone.patient = self.patient.fork()
+        clone.sensor = self.sensor.fork()
+        clone.scenario = self.scenario.fork()
+        clone.viewer = None
+        clone._lean_obs = LeanObservation(self._lean_obs.CGM)
+        clone._lean_info = StepInfo(clone)
+        clone.history = self.history.copy()
+        clone.history.on_risk = clone._fold_risk
+        clone._glucose_stats = self._glucose_stats.copy()
+        return clone
+
     def _reset(self):
         self.sample_time = self.sensor.sample_time
+        if getattr(self, "viewer", None) is not None:
+            # the animation of the previous episode ends here
+            self._close_viewer()
         self.viewer = None
+        self._episode = next(_episode_counter)
 
         BG = self.patient.observation.Gsub
         horizon = 1
         LBGI, HBGI, risk = risk_index([BG], horizon)
         CGM = self.sensor.measure(self.patient)
-        self.time_hist = [self.scenario.start_time]
-        self.BG_hist = [BG]
-        self.CGM_hist = [CGM]
-        self.risk_hist = [risk]
-        self.LBGI_hist = [LBGI]
-        self.HBGI_hist = [HBGI]
-        self.CHO_hist = []
-        self.insulin_hist = []
+        self.history = History(self.scenario.start_time)
+        self.history.on_risk = self._fold_risk
+        self.history.append(0, BG, CGM, LBGI, HBGI, risk)
+        # metrics of the BG of the episode, kept as it runs
+        self._glucose_stats = GlucoseStats().update(BG, LBGI, HBGI)
+
+    def _fold_risk(self, LBGI, HBGI):
+        # the history computed the risk of the rows added by _lean_step
+        self._glucose_stats.add_risk(LBGI, HBGI)
+
+    @property
+    def glucose_stats(self):
+        """GlucoseStats of the BG of the episode so far"""
+        if self._glucose_stats.risk_pending:
+            self.history.column("Risk")  # computes the pending risk
+        return self._glucose_stats
 
     def reset(self):
         self.patient.reset()
@@ -142,6 +397,10 @@ class T1DSimEnv(object):
         self.scenario.reset()
         self._reset()
         CGM = self.sensor.measure(self.patient)
+        if self.lean:
+            self._lean_obs.CGM = CGM
+            info = self._lean_info._set(round(self.patient.t), self.BG_hist[0], 0)
+            return LeanStep(self._lean_obs, 0, False, info)
         obs = Observation(CGM=CGM)
         return Step(
             observation=obs,
@@ -158,30 +417,61 @@ class T1DSimEnv(object):
             risk=self.risk_hist[0],
         )
 
-    def render(self, close=False):
+    def render(self, close=False, fps=AsyncViewer.FPS, output=None):
+        """
+        Animate the history, in a separate process where the default start
+        method is fork, see AsyncViewer. fps and output are used when the
+        viewer is created; with output set the animation is written there
+        (headless) once the viewer is closed, e.g. by render(close=True).
+        """
         if close:
             self._close_viewer()
             return
 
         if self.viewer is None:
-            self.viewer = Viewer(self.scenario.start_time, self.patient.name)
+            self.viewer = AsyncViewer(
+                self.scenario.start_time, self.patient.name, fps=fps, output=output
+            )
 
-        self.viewer.render(self.show_history())
+        self.viewer.render(self.history)
 
     def _close_viewer(self):
         if self.viewer is not None:
             self.viewer.close()
             self.viewer = None
 
+    # Views of the history columns, see History
+    @property
+    def time_hist(self):
+        return self.history.times()
+
+    @property
+    def BG_hist(self):
+        return self.history.column("BG")
+
+    @property
+    def CGM_hist(self):
+        return self.history.column("CGM")
+
+    @property
+    def risk_hist(self):
+        return self.history.column("Risk")
+
+    @property
+    def LBGI_hist(self):
+        return self.history.column("LBGI")
+
+    @property
+    def HBGI_hist(self):
+        return self.history.column("HBGI")
+
+    @property
+    def CHO_hist(self):
+        return self.history.actions("CHO")
+
+    @property
+    def insulin_hist(self):
+        return self.history.actions("insulin")
+
     def show_history(self):
-        df = pd.DataFrame()
-        df["Time"] = pd.Series(self.time_hist)
-        df["BG"] = pd.Series(self.BG_hist)
-        df["CGM"] = pd.Series(self.CGM_hist)
-        df["CHO"] = pd.Series(self.CHO_hist)
-        df["insulin"] = pd.Series(self.insulin_hist)
-        df["LBGI"] = pd.Series(self.LBGI_hist)
-        df["HBGI"] = pd.Series(self.HBGI_hist)
-        df["Risk"] = pd.Series(self.risk_hist)
-        df = df.set_index("Time")
-        return df
+        return self.history.to_frame()
@@ -0,0 +1,181 @@
+from simglucose.analysis.risk import risk_array
+import numpy as np
+import pandas as pd
+from datetime import timedelta
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+class History(object):
+    """
+    Columnar record of a T1DSimEnv episode.
+
+    Every column is a preallocated float64 array that doubles its capacity
+    when full, and time is kept as integer minutes since start_time. Row i
+    holds the observation recorded at minutes[i] and the action (CHO,
+    insulin) applied from there to row i + 1, which is NaN on the last row
+    until the next step. Rows appended without risk indices get them computed
+    from BG, for all such rows at once, when a risk column is read; on_risk,
+    if set, is then called with the LBGI and HBGI arrays of those rows.
+    """
+    OBS_COLUMNS = ("BG", "CGM", "LBGI", "HBGI", "Risk")
+    ACTION_COLUMNS = ("CHO", "insulin")
+    COLUMNS = ("BG", "CGM", "CHO", "insulin", "LBGI", "HBGI", "Risk")
+    RISK_COLUMNS = ("LBGI", "HBGI", "Risk")
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self, start_time, capacity=INITIAL_CAPACITY):
+        self.start_time = start_time
+        self._n = 0
+        self._risk_pending = None  # first row whose risk is not computed
+        self.on_risk = None
+        self._minutes = np.zeros(capacity, dtype=np.int64)
+        self._columns = {
+            name: np.full(capacity, np.nan) for name in self.COLUMNS
+        }
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def capacity(self):
+        return len(self._minutes)
+
+    def _grow(self):
+        capacity = 2 * self.capacity
+        minutes = np.zeros(capacity, dtype=np.int64)
+        minutes[:self._n] = self._minutes[:self._n]
+        self._minutes = minutes
+        for name, values in self._columns.items():
+            grown = np.full(capacity, np.nan)
+            grown[:self._n] = values[:self._n]
+            self._columns[name] = grown
+
+    def append(self, minutes, BG, CGM, LBGI=None, HBGI=None, risk=None):
+        """
+        Record the observation at minutes since start_time. Without risk,
+        the risk indices are computed when first read.
+        """
+        if risk is not None and self._risk_pending is not None:
+            # the rows without risk stay the last ones
+            self._fill_risk()
+        if self._n == self.capacity:
+            self._grow()
+        i = self._n
+        self._minutes[i] = minutes
+        columns = self._columns
+        columns["BG"][i] = BG
+        columns["CGM"][i] = CGM
+        if risk is None:
+            if self._risk_pending is None:
+                self._risk_pending = i
+        else:
+            columns["LBGI"][i] = LBGI
+            columns["HBGI"][i] = HBGI
+            columns["Risk"][i] = risk
+        columns["CHO"][i] = np.nan
+        columns["insulin"][i] = np.nan
+        self._n += 1
+
+    def record_action(self, CHO, insulin):
+        """Record the action applied after the last observation"""
+        self._columns["CHO"][self._n - 1] = CHO
+        self._columns["insulin"][self._n - 1] = insulin
+
+    def _fill_risk(self):
+        start = self._risk_pending
+        self._risk_pending = None
+        rl, rh, ri = risk_array(self._columns["BG"][start:self._n])
+        self._columns["LBGI"][start:self._n] = rl
+        self._columns["HBGI"][start:self._n] = rh
+        self._columns["Risk"][start:self._n] = ri
+        if self.on_risk is not None:
+            self.on_risk(rl, rh)
+
+    def column(self, name):
+        """Read-only view of a column over the recorded rows"""
+        if self._risk_pending is not None and name in self.RISK_COLUMNS:
+            self._fill_risk()
+        view = self._columns[name][:self._n]
+        view.flags.writeable = False
+        return view
+
+    def actions(self, name):
+        """View of an action column without the pending last row"""
+        return self.column(name)[:max(self._n - 1, 0)]
+
+    @property
+    def minutes(self):
+        view = self._minutes[:self._n]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def time(self):
+        """Time of each row, as a DatetimeIndex"""
+        return pd.DatetimeIndex(
+            pd.Timestamp(self.start_time) + pd.to_timedelta(self.minutes, unit="min"),
+            name="Time",
+        ).as_unit("us")
+
+    def times(self):
+        """Time of each row, as a list of datetime"""
+        return [self.start_time + timedelta(minutes=int(m)) for m in self.minutes]
+
+    def truncate(self, n):
+        """Keep the first n rows; the action of the last one is pending again"""
+        self._n = n
+        if self._risk_pending is not None and self._risk_pending >= n:
+            self._risk_pending = None
+        if n > 0:
+            self.record_action(np.nan, np.nan)
+
+    def discard(self, n):
+        """
+        Drop the first n rows, e.g. once they are written out. Row counts
+        taken before (such as T1DSimEnv snapshots) no longer apply.
+        """
+        n = min(n, self._n)
+        if n == 0:
+            return
+        if self._risk_pending is not None and self._risk_pending < n:
+            self._fill_risk()
+        keep = self._n - n
+        self._minutes[:keep] = self._minutes[n:self._n]
+        for values in self._columns.values():
+            values[:keep] = values[n:self._n]
+        self._n = keep
+        if self._risk_pending is not None:
+            self._risk_pending -= n
+
+    def copy(self):
+        clone = History(self.start_time, capacity=max(self._n, 1))
+        clone._n = self._n
+        clone._risk_pending = self._risk_pending
+        clone._minutes[:self._n] = self._minutes[:self._n]
+        for name, values in self._columns.items():
+            clone._columns[name][:self._n] = values[:self._n]
+        return clone
+
+    def to_frame(self, copy=True):
+        """
+        The history as a DataFrame indexed by Time. With copy=False the
+        columns are views of the buffers, which later steps may overwrite
+        (e.g. after T1DSimEnv.restore), so only use them right away.
+        """
+        data = {name: self.column(name) for name in self.COLUMNS}
+        return pd.DataFrame(data, index=self.time, copy=copy)
+
+    def to_arrow(self):
+        """
+        The history as a pyarrow Table with int64 minutes since start_time,
+        sharing the column buffers. Requires pyarrow.
+        """
+        if pa is None:
+            raise ImportError("History.to_arrow requires pyarrow")
+        arrays = [pa.array(self.minutes)]
+        arrays += [pa.array(self.column(name)) for name in self.COLUMNS]
+        return pa.Table.from_arrays(arrays, names=("minutes",) + self.COLUMNS)
@@ -0,0 +1,188 @@
+"""
+Population Monte Carlo runs of one controller.
+
+population_sim runs every (patient, seed, scenario) of a grid, e.g. all
+virtual patients x 100 meal seeds x a 3-day scenario, in a process pool.
+A worker reduces each run to one row of summary metrics as soon as it ends,
+from the columns of the env history, and only the runs asked for in traces
+send their whole trajectory back. The rows are collected into one table as
+the runs complete, and can be appended to a CSV file at the same time.
+
+Runs are seeded by their seed alone (patient, sensor and scenario seed), so
+the same grid gives the same meals and sensor noise whatever the controller,
+the worker count or the order of the grid.
+"""
+from simglucose.simulation.sim_engine import SimObj, SimConfig, build_env
+from simglucose.simulation.stats import SimStats
+from simglucose.analysis.online import GlucoseStats
+from simglucose.analysis.risk import risk_array
+from simglucose.analysis.metrics import (cvga_bounds, cvga_zone,
+                                         percent_time_in_range)
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# A run of the grid; scenario is the index of the scenario in the list
+PopulationRun = namedtuple('PopulationRun',
+                           ['patient_name', 'seed', 'scenario'])
+
+SUMMARY_COLUMNS = ('patient_name', 'seed', 'scenario', 'steps', 'mean_BG',
+                   'CV', 'GMI', 'TIR', 'TBR', 'TAR', 'LBGI', 'HBGI', 'Risk',
+                   'BG_min', 'BG_max', 'CVGA_zone')
+
+
+def run_summary(BG):
+    """Summary metrics of one run from its BG trace, in mg/dL"""
+    BG = np.asarray(BG, dtype=np.float64)
+    rl, rh, ri = risk_array(BG)
+    TIR, TAR, TBR = percent_time_in_range(BG)[0, :3]
+    BG_min, BG_max = (b.item() for b in cvga_bounds(BG))
+    mean = BG.mean()
+    return {
+        'steps': len(BG) - 1,
+        'mean_BG': mean,
+        'CV': BG.std() / mean * 100,
+        'TIR': TIR,
+        'TBR': TBR,
+        'TAR': TAR,
+        'LBGI': rl.mean(),
+        'HBGI': rh.mean(),
+        'Risk': ri.mean(),
+        'BG_min': BG_min,
+        'BG_max': BG_max,
+        'CVGA_zone': cvga_zone(BG_min, BG_max).item(),
+    }
+
+
+class PopulationResults(object):
+    """
+    Output of population_sim.
+        summary       - DataFrame of SUMMARY_COLUMNS, one row per run in
+                        grid order
+        traces        - {PopulationRun: DataFrame} of the runs asked for,
+                        as T1DSimEnv.show_history
+        stats         - SimStats of all runs
+        glucose_stats - {patient_name: GlucoseStats} of the BG of all the
+                        runs of each patient
+    """
+
+    def __init__(self, summary, traces, stats, glucose_stats=None):
+        self.summary = summary
+        self.traces = traces
+        self.stats = stats
+        self.glucose_stats = glucose_stats or {}
+
+    def __len__(self):
+        return len(self.summary)
+
+
+def population_grid(patients, seeds, scenarios):
+    """The PopulationRuns of a grid, patient-major"""
+    return [
+        PopulationRun(p, int(s), k) for p in patients for s in seeds
+        for k in range(len(scenarios))
+    ]
+
+
+def population_sim(controller_factory, patients, seeds, sim_time,
+                   scenarios=None, traces=None, parallel=True,
+                   max_workers=None, chunksize=None, summary_path=None,
+                   sensor_name='Dexcom', pump_name='Insulet',
+                   start_time=datetime(2018, 1, 1), profile=False):
+    """
+    Run controller_factory() on every patient x seed x scenario for
+    sim_time and return PopulationResults.
+
+    controller_factory - called with no arguments for every run, in the
+                         worker, so it must be picklable (e.g. a class)
+    patients           - patient names
+    seeds              - integer seeds, one run per seed
+    scenarios          - list of scenarios; None in it (the default is
+                         [None]) is a RandomScenario from start_time drawn
+                         from the seed of the run
+    traces             - PopulationRuns whose whole trajectory is kept, or
+                         a function of a PopulationRun returning whether to
+                         keep it
+    summary_path       - CSV file the summary rows are appended to as the
+                         runs complete
+    Workers receive the runs in chunks of chunksize (by default about four
+    chunks per worker); parallel=False runs them in this process.
+    """
+    if scenarios is None:
+        scenarios = [None]
+    runs = population_grid(patients, seeds, scenarios)
+    if traces is None:
+        keep = [False] * len(runs)
+    elif callable(traces):
+        keep = [bool(traces(run)) for run in runs]
+    else:
+        wanted = set(PopulationRun(*r) for r in traces)
+        keep = [run in wanted for run in runs]
+    tasks = [(run, scenarios[run.scenario], controller_factory, sim_time,
+              sensor_name, pump_name, start_time, profile, k)
+             for run, k in zip(runs, keep)]
+
+    rows = []
+    kept = {}
+    run_stats = []
+    glucose_stats = {}
+    tic = time.time()
+    if parallel and tasks:
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        if chunksize is None:
+            chunksize = max(1, len(tasks) // (4 * max_workers))
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            for output in pool.map(_run_population_task, tasks,
+                                   chunksize=chunksize):
+                _collect(output, rows, kept, run_stats, glucose_stats,
+                         summary_path)
+    else:
+        for task in tasks:
+            _collect(_run_population_task(task), rows, kept, run_stats,
+                     glucose_stats, summary_path)
+    summary = pd.DataFrame(rows, columns=list(SUMMARY_COLUMNS))
+    stats = SimStats.combine(run_stats)
+    logger.info('Population of {} runs took {} sec.'.format(
+        len(runs), time.time() - tic))
+    logger.info(str(stats))
+    return PopulationResults(summary, kept, stats, glucose_stats)
+
+
+def _collect(output, rows, kept, run_stats, glucose_stats, summary_path):
+    run, row, trace, stats, run_glucose = output
+    rows.append(row)
+    run_stats.append(stats)
+    glucose_stats.setdefault(run.patient_name, GlucoseStats()).merge(
+        run_glucose)
+    if trace is not None:
+        kept[run] = trace
+    if summary_path is not None:
+        write_header = not os.path.exists(summary_path)
+        pd.DataFrame([row], columns=list(SUMMARY_COLUMNS)).to_csv(
+            summary_path, mode='a', header=write_header, index=False)
+
+
+def _run_population_task(task):
+    (run, scenario, controller_factory, sim_time, sensor_name, pump_name,
+     start_time, profile, keep) = task
+    config = SimConfig(run.patient_name, scenario=scenario,
+                       controller_factory=controller_factory,
+                       sensor_name=sensor_name, pump_name=pump_name,
+                       start_time=start_time)
+    env = build_env(config, (run.seed, run.seed, run.seed))
+    sim_object = SimObj(env, controller_factory(), sim_time, animate=False,
+                        profile=profile)
+    sim_object.simulate()
+    row = dict(run._asdict())
+    row.update(run_summary(env.history.column('BG')))
+    row['GMI'] = env.glucose_stats.GMI
+    trace = env.show_history() if keep else None
+    return run, row, trace, sim_object.stats, env.glucose_stats
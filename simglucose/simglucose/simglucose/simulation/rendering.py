@@ -1,5 +1,14 @@
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+import matplotlib.image
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import multiprocessing
+import threading
+import numpy as np
+import queue
+import time
+import os
 import logging
 from datetime import timedelta
 
@@ -13,9 +22,12 @@ class Viewer(object):
         self.fig, self.axes, self.lines = self.initialize()
         self.update()
 
-    def initialize(self):
+    def new_figure(self):
         plt.ion()
-        fig, axes = plt.subplots(4)
+        return plt.subplots(4)
+
+    def initialize(self):
+        fig, axes = self.new_figure()
 
         axes[0].set_ylabel('BG (mg/dL)')
         axes[1].set_ylabel('CHO (g/min)')
@@ -119,6 +131,259 @@ class Viewer(object):
         plt.close(self.fig)
 
 
+class AsyncViewer(object):
+    """
+    Animation of a simulation history, drawn off the simulation loop.
+
+    render() only hands the rows added since the last frame to a bounded
+    queue, at most fps times per second; calls in between, or while the
+    queue is full, are skipped frames and cost nothing. The renderer draws
+    the latest data with blitting (see BlitViewer), so the simulation loop
+    never waits for matplotlib.
+
+    The window is drawn by a separate process, as GUI toolkits must run on
+    the main thread of their process. That process is forked, so it is only
+    used where fork is the default start method (Linux): with spawn
+    (macOS, Windows) an unguarded script would be re-run by the child, so
+    there the window is drawn in this process instead, at most fps times
+    per second, its events being processed after each frame.
+
+    With output set the renderer is headless instead: a thread draws on an
+    Agg canvas and writes the frames to output, a video when it ends in a
+    movie extension (.gif with Pillow, other ones with ffmpeg), otherwise a
+    directory of PNG frames. The file is complete once close() returns.
+    """
+    FPS = 10
+    QUEUE_SIZE = 4
+    VIDEO_EXTENSIONS = (".gif", ".mp4", ".avi", ".mov", ".mkv", ".webm")
+
+    def __init__(self, start_time, patient_name, fps=FPS, output=None,
+                 queue_size=QUEUE_SIZE):
+        self.start_time = start_time
+        self.patient_name = patient_name
+        self.fps = fps
+        self.output = output
+        self._history = None
+        self._sent = 0
+        self._last_sent = -np.inf
+        self._viewer = None
+        args = (start_time, patient_name, fps, output)
+        if output is None and _default_start_method() != "fork":
+            self._viewer = BlitViewer(start_time, patient_name)
+            self._queue = self._worker = None
+            return
+        if output is None:
+            context = multiprocessing.get_context("fork")
+            self._queue = context.Queue(maxsize=queue_size)
+            self._worker = context.Process(
+                target=_render_loop, args=(self._queue,) + args, daemon=True)
+        else:
+            self._queue = queue.Queue(maxsize=queue_size)
+            self._worker = threading.Thread(
+                target=_render_loop, args=(self._queue,) + args, daemon=True)
+        self._worker.start()
+
+    def render(self, history):
+        """
+        Show history (a simulation.history.History), unless a frame was
+        sent less than 1 / fps seconds ago
+        """
+        self._history = history
+        now = time.perf_counter()
+        if now - self._last_sent >= 1.0 / self.fps:
+            if self._send(block=False):
+                self._last_sent = now
+
+    def _send(self, block):
+        n = len(self._history)
+        # the last row sent may have got its action since
+        start = max(self._sent - 1, 0)
+        frame = (
+            start,
+            np.array(self._history.minutes[start:n]),
+            {name: np.array(self._history.column(name)[start:n])
+             for name in BlitViewer.COLUMNS},
+        )
+        if self._viewer is not None:
+            # draw() blits and processes the window events; a full draw,
+            # e.g. by plt.pause, would leave out the animated lines
+            self._viewer.extend(*frame)
+            self._viewer.draw()
+        else:
+            try:
+                self._queue.put(frame, block=block)
+            except queue.Full:
+                return False
+        self._sent = n
+        return True
+
+    def close(self):
+        """Draw the last frame, finish the output and stop the renderer"""
+        if self._viewer is not None:
+            if self._history is not None:
+                self._send(block=True)
+            self._viewer.close()
+            self._viewer = None
+            return
+        if self._worker is None:
+            return
+        if self._worker.is_alive():
+            if self._history is not None:
+                self._send(block=True)
+            self._queue.put(None)
+        self._worker.join()
+        self._worker = None
+
+
+class BlitViewer(Viewer):
+    """
+    Viewer drawing the lines of the four axes with blitting. Data is added
+    incrementally with extend(); the axes backgrounds are only redrawn when
+    their limits change.
+    """
+    COLUMNS = ("BG", "CGM", "CHO", "insulin", "LBGI", "HBGI", "Risk")
+    # column of each line, and axes of each column
+    AXES = (0, 0, 1, 2, 3, 3, 3)
+
+    def __init__(self, start_time, patient_name, figsize=None, headless=False):
+        self.headless = headless
+        self._t0 = mdates.date2num(start_time)
+        self._n = 0
+        self._t = np.empty(0)
+        self._data = np.empty((len(self.COLUMNS), 0))
+        Viewer.__init__(self, start_time, patient_name, figsize=figsize)
+
+    def initialize(self):
+        fig, axes, lines = Viewer.initialize(self)
+        # left out of the full draws, so that the backgrounds saved by
+        # update() do not contain them
+        for line in lines:
+            line.set_animated(True)
+        return fig, axes, lines
+
+    def new_figure(self):
+        if not self.headless:
+            return Viewer.new_figure(self)
+        # not managed by pyplot, so that it can be drawn from any thread
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        return fig, fig.subplots(4)
+
+    def update(self):
+        Viewer.update(self)
+        self._backgrounds = [self.fig.canvas.copy_from_bbox(ax.bbox)
+                             for ax in self.axes]
+
+    def extend(self, start, minutes, columns):
+        """Set the rows from start on, e.g. a frame sent by AsyncViewer"""
+        n = start + len(minutes)
+        if n > self._t.shape[0]:
+            capacity = max(2 * self._t.shape[0], n, 1024)
+            t = np.empty(capacity)
+            t[:self._n] = self._t[:self._n]
+            data = np.empty((len(self.COLUMNS), capacity))
+            data[:, :self._n] = self._data[:, :self._n]
+            self._t, self._data = t, data
+        self._t[start:n] = self._t0 + np.asarray(minutes) / 1440.0
+        for i, name in enumerate(self.COLUMNS):
+            self._data[i, start:n] = columns[name]
+        self._n = n
+
+    def draw(self):
+        if self._n == 0:
+            return
+        t = self._t[:self._n]
+        data = self._data[:, :self._n]
+        for line, values in zip(self.lines, data):
+            line.set_data(t, values)
+
+        redraw = False
+        for i, ax in enumerate(self.axes):
+            values = data[[j for j, a in enumerate(self.AXES) if a == i]]
+            values = values[np.isfinite(values)]
+            if values.size:
+                redraw |= _extend_ylim(ax, values.min(), values.max())
+            redraw |= _extend_xlim(ax, t[-1])
+        if redraw:
+            self.update()
+
+        canvas = self.fig.canvas
+        for ax, background in zip(self.axes, self._backgrounds):
+            canvas.restore_region(background)
+        for line in self.lines:
+            line.axes.draw_artist(line)
+        for ax in self.axes:
+            canvas.blit(ax.bbox)
+        canvas.flush_events()
+
+
+def _default_start_method():
+    """Start method multiprocessing uses when none is given"""
+    method = multiprocessing.get_start_method(allow_none=True)
+    if method is None:
+        method = multiprocessing.get_all_start_methods()[0]
+    return method
+
+
+def _render_loop(frames, start_time, patient_name, fps, output):
+    """Body of the renderer process or thread of AsyncViewer"""
+    viewer = BlitViewer(start_time, patient_name, headless=output is not None)
+    writer = _frame_writer(viewer.fig, output, fps)
+    done = False
+    while not done:
+        try:
+            frame = frames.get(timeout=1.0 / fps)
+        except queue.Empty:
+            viewer.fig.canvas.flush_events()
+            continue
+        # skip to the latest data
+        while frame is not None:
+            viewer.extend(*frame)
+            try:
+                frame = frames.get_nowait()
+            except queue.Empty:
+                break
+        done = frame is None
+        viewer.draw()
+        if writer is not None:
+            writer()
+    if output is not None:
+        writer.finish()
+    viewer.close()
+
+
+def _frame_writer(fig, output, fps):
+    """
+    Callable saving the current frame of fig to output, with a finish
+    method closing it
+    """
+    if output is None:
+        return None
+
+    if output.lower().endswith(AsyncViewer.VIDEO_EXTENSIONS):
+        from matplotlib import animation
+        if output.lower().endswith(".gif"):
+            movie = animation.PillowWriter(fps=fps)
+        else:
+            movie = animation.FFMpegWriter(fps=fps)
+        movie.setup(fig, output)
+
+        def write():
+            movie.grab_frame()
+        write.finish = movie.finish
+        return write
+
+    os.makedirs(output, exist_ok=True)
+    count = [0]
+
+    def write():
+        filename = os.path.join(output, "frame_{:05d}.png".format(count[0]))
+        matplotlib.image.imsave(filename, np.asarray(fig.canvas.buffer_rgba()))
+        count[0] += 1
+    write.finish = lambda: None
+    return write
+
+
 def adjust_ylim(ax, ymin, ymax):
     ylim = ax.get_ylim()
     update = False
@@ -165,3 +430,27 @@ def adjust_xlim(ax, timemax, xlabel=False):
             ax.xaxis.set_minor_formatter(mdates.DateFormatter('%H:%M\n'))
             ax.xaxis.set_major_locator(mdates.DayLocator())
             ax.xaxis.set_major_formatter(mdates.DateFormatter('\n%b %d'))
+
+
+def _extend_ylim(ax, ymin, ymax):
+    """Widen the y limits of ax as adjust_ylim does, return if they changed"""
+    y1, y2 = ax.get_ylim()
+    if not (ymin < y1 or ymax > y2):
+        return False
+    if ymin < y1:
+        y1 = ymin - 0.1 * abs(ymin)
+    if ymax > y2:
+        y2 = ymax + 0.1 * abs(ymax)
+    ax.set_ylim([y1, y2])
+    return True
+
+
+def _extend_xlim(ax, tmax):
+    """Widen the x limits of ax as adjust_xlim does, return if they changed"""
+    x1, x2 = ax.get_xlim()
+    if tmax <= x2 - 30.0 / 1440:
+        return False
+    while tmax > x2 - 30.0 / 1440:
+        x2 += 0.25  # 6 hours
+    ax.set_xlim([x1, x2])
+    return True
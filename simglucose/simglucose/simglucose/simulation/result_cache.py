@@ -0,0 +1,269 @@
+"""
+Content-addressed cache of simulation results.
+
+A run is identified by simulation_key, a hash of everything that determines
+its trajectory: the patient, sensor and pump parameters and seeds, the
+scenario (its seed and constructor arguments), the controller (its class,
+the source of its module and its public settings once reset, which must be
+plain values), the simulation time, and digests of the bundled parameter
+files and of the simulator source. Completed runs are stored as compressed
+columnar .npz files named by their key, and a line is appended to
+manifest.jsonl once the file is in place. A batch interrupted half-way
+therefore resumes from the runs listed in the manifest, and a run found in
+it is loaded instead of being simulated.
+"""
+from simglucose.simulation.scenario_gen import RandomScenario
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+import logging
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.jsonl"
+_PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the parts of the package a trajectory depends on, relative to it; the
+# controller is keyed by the source of its own module
+SIMULATOR_SOURCES = (
+    "patient", "sensor", "actuator", "params", "registry.py",
+    "trace_cache.py", "analysis/risk.py", "simulation/env.py",
+    "simulation/history.py", "simulation/scenario.py",
+    "simulation/scenario_gen.py", "simulation/sim_engine.py",
+)
+_digests = {}
+
+
+def _file_digest(filenames):
+    sha = hashlib.sha1()
+    for filename in filenames:
+        with open(filename, "rb") as f:
+            sha.update(f.read())
+    return sha.hexdigest()
+
+
+def _source_digest():
+    """Digest of the SIMULATOR_SOURCES and of the bundled parameter files"""
+    if "source" not in _digests:
+        filenames = []
+        for source in SIMULATOR_SOURCES:
+            path = os.path.join(_PACKAGE_DIR, *source.split("/"))
+            if os.path.isfile(path):
+                filenames.append(path)
+                continue
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                filenames += [os.path.join(root, f) for f in sorted(files)
+                              if f.endswith((".py", ".csv"))]
+        _digests["source"] = _file_digest(filenames)
+    return _digests["source"]
+
+
+def _module_digest(obj):
+    """Digest of the source file defining the class of obj"""
+    try:
+        filename = inspect.getsourcefile(type(obj))
+    except TypeError:
+        return None
+    if filename is None or not os.path.exists(filename):
+        return None
+    if filename not in _digests:
+        _digests[filename] = _file_digest([filename])
+    return _digests[filename]
+
+
+def _canonical(value):
+    """JSON-serializable form of value, stable across processes"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if isinstance(value, np.record):
+        return [[name, _canonical(value[name])] for name in value.dtype.names]
+    if isinstance(value, np.ndarray):
+        return _canonical(value.tolist())
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return hashlib.sha1(
+            pd.util.hash_pandas_object(value).values.tobytes()).hexdigest()
+    if isinstance(value, dict):
+        return [[str(k), _canonical(v)] for k, v in sorted(value.items())]
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    # a repr may hold a memory address, or leave out state such as weights
+    raise TypeError(
+        "Cannot build a cache key from {!r} of type {}; make the attribute "
+        "private (leading underscore) if it does not change the "
+        "results".format(value, type(value).__name__))
+
+
+def _public_settings(obj):
+    return {k: v for k, v in vars(obj).items() if not k.startswith("_")}
+
+
+def _constructor_settings(obj, skip=()):
+    """
+    The arguments obj was constructed with, read back from the attributes
+    of the same name, with or without a leading underscore
+    """
+    settings = {}
+    parameters = inspect.signature(type(obj).__init__).parameters
+    for name, param in list(parameters.items())[1:]:
+        if name in skip:
+            continue
+        if param.kind in (param.VAR_POSITIONAL, param.VAR_KEYWORD):
+            raise TypeError("Cannot build a cache key from {} as it takes "
+                            "*{}".format(_qualname(obj), name))
+        for attr in (name, "_" + name):
+            if hasattr(obj, attr):
+                settings[name] = getattr(obj, attr)
+                break
+        else:
+            raise TypeError(
+                "Cannot build a cache key from {}: its argument {} is not "
+                "kept as an attribute".format(_qualname(obj), name))
+    return settings
+
+
+def _qualname(obj):
+    return "{}.{}".format(type(obj).__module__, type(obj).__qualname__)
+
+
+def scenario_config(scenario):
+    """
+    The definition of a scenario, without its position: its seed and the
+    arguments it was constructed with. The meals of a RandomScenario are
+    pre-generated days of its seed, so they are left out.
+    """
+    skip = ("meals",) if isinstance(scenario, RandomScenario) else ()
+    settings = _constructor_settings(scenario, skip)
+    settings.setdefault("seed", getattr(scenario, "seed", None))
+    return {"type": _qualname(scenario), **settings}
+
+
+def simulation_config(env, controller, sim_time):
+    """Everything simulation_key depends on, as a dict"""
+    patient = env.patient
+    return {
+        "patient": {
+            "type": _qualname(patient),
+            "params": patient._params,
+            "init_state": patient._init_state,
+            "random_init_bg": patient.random_init_bg,
+            "seed": patient.seed,
+            "t0": patient.t0,
+            "integrator": getattr(patient, "integrator", None),
+            "substeps": getattr(patient, "substeps", None),
+        },
+        "sensor": {"params": env.sensor._params, "seed": env.sensor.seed},
+        "pump": {"params": env.pump._params},
+        "scenario": scenario_config(env.scenario),
+        "macro_step": getattr(env, "macro_step", False),
+        "controller": {
+            "type": _qualname(controller),
+            "source": _module_digest(controller),
+            "settings": _public_settings(controller),
+        },
+        "sim_time": sim_time,
+        "simulator": _source_digest(),
+    }
+
+
+def simulation_key(env, controller, sim_time):
+    """Hash identifying the result of SimObj(env, controller, sim_time)"""
+    payload = json.dumps(
+        _canonical(simulation_config(env, controller, sim_time)),
+        sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache(object):
+    """
+    Directory of cached simulation results, see the module docstring.
+    Several processes may read and fill the same cache.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._entries = {}
+
+    def key(self, env, controller, sim_time):
+        return simulation_key(env, controller, sim_time)
+
+    def _filename(self, key):
+        return os.path.join(self.path, key + ".npz")
+
+    def entries(self):
+        """Manifest entries by key, re-read from disk"""
+        entries = {}
+        try:
+            with open(os.path.join(self.path, MANIFEST)) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # a line cut short by an interrupted run
+                        continue
+                    entries[entry["key"]] = entry
+        except FileNotFoundError:
+            pass
+        self._entries = entries
+        return entries
+
+    def __contains__(self, key):
+        if key not in self._entries:
+            self.entries()
+        return key in self._entries and os.path.exists(self._filename(key))
+
+    def get(self, key):
+        """The cached history of key as a DataFrame, or None on a miss"""
+        if key not in self:
+            return None
+        with np.load(self._filename(key)) as data:
+            columns = [c for c in data.files if c != "Time"]
+            index = pd.DatetimeIndex(data["Time"], name="Time")
+            return pd.DataFrame({c: data[c] for c in columns}, index=index)
+
+    def put(self, key, df, summary=None):
+        """
+        Store a history DataFrame (indexed by Time) under key, and record it
+        in the manifest with the JSON-serializable summary
+        """
+        arrays = {"Time": df.index.values}
+        arrays.update({c: df[c].values for c in df.columns})
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".npz.tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(f, **arrays)
+            os.replace(tmp, self._filename(key))
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+        entry = {"key": key, "file": key + ".npz", "rows": len(df),
+                 "created": datetime.now().isoformat(), "config": summary}
+        # a single short append, so that concurrent writers do not interleave
+        with open(os.path.join(self.path, MANIFEST), "a") as f:
+            f.write(json.dumps(entry, default=str) + "\n")
+        self._entries[key] = entry
+        logger.debug("Cached simulation {}".format(key))
+
+
+def summary(env, controller, sim_time):
+    """Short description of a run for the manifest"""
+    return {
+        "patient": env.patient.name,
+        "sensor": env.sensor.name,
+        "sensor_seed": _canonical(env.sensor.seed),
+        "scenario": _canonical(scenario_config(env.scenario)),
+        "controller": _qualname(controller),
+        "sim_time": str(sim_time),
+    }
@@ -1,4 +1,6 @@
 import logging
+import copy
+import numpy as np
 from collections import namedtuple
 from datetime import datetime
 from datetime import timedelta
@@ -14,9 +16,34 @@ class Scenario(object):
     def get_action(self, t):
         raise NotImplementedError
 
+    def actions_between(self, t0, t1):
+        '''
+        Meal amounts at each minute of [t0, t1), as an array. Same as calling
+        get_action minute by minute, which is what this default does.
+        '''
+        n = int(np.ceil((t1 - t0) / timedelta(minutes=1)))
+        return np.array(
+            [self.get_action(t0 + timedelta(minutes=i)).meal for i in range(n)],
+            dtype=np.float64)
+
     def reset(self):
         raise NotImplementedError
 
+    def snapshot(self):
+        '''
+        Capture the scenario position (e.g. the random generator and the
+        current day of a RandomScenario)
+        '''
+        return copy.deepcopy(self.__dict__)
+
+    def restore(self, snapshot):
+        self.__dict__.update(copy.deepcopy(snapshot))
+
+    def fork(self):
+        clone = copy.copy(self)
+        clone.restore(self.snapshot())
+        return clone
+
 
 class CustomScenario(Scenario):
     def __init__(self, start_time, scenario):
@@ -30,16 +57,56 @@ class CustomScenario(Scenario):
         Scenario.__init__(self, start_time=start_time)
         self.scenario = scenario
 
+    @property
+    def scenario(self):
+        return self._scenario
+
+    @scenario.setter
+    def scenario(self, scenario):
+        self._scenario = scenario
+        self._compiled_for = None
+
+    def _compile(self):
+        '''
+        Index the meals by their minute offset from start_time. Meals off the
+        minute grid are kept by time. As in a linear search, the first meal
+        listed at a given time wins.
+        '''
+        meals = {}
+        off_grid = {}
+        for time, action in self._scenario or ():
+            t = parseTime(time, self.start_time)
+            minutes, rest = divmod(t - self.start_time, timedelta(minutes=1))
+            if rest:
+                off_grid.setdefault(t, action)
+            else:
+                meals.setdefault(minutes, action)
+        self._meals = meals
+        self._off_grid = off_grid
+        self._meal_minutes = np.array(list(meals), dtype=np.int64)
+        self._meal_amounts = np.array(list(meals.values()), dtype=np.float64)
+        self._compiled_for = self.start_time
+
     def get_action(self, t):
-        if not self.scenario:
-            return Action(meal=0)
-        else:
-            times, actions = tuple(zip(*self.scenario))
-            times2compare = [parseTime(time, self.start_time) for time in times]
-            if t in times2compare:
-                idx = times2compare.index(t)
-                return Action(meal=actions[idx])
-            return Action(meal=0)
+        if self._compiled_for != self.start_time:
+            self._compile()
+        minutes, rest = divmod(t - self.start_time, timedelta(minutes=1))
+        if rest:
+            return Action(meal=self._off_grid.get(t, 0))
+        return Action(meal=self._meals.get(minutes, 0))
+
+    def actions_between(self, t0, t1):
+        if self._compiled_for != self.start_time:
+            self._compile()
+        start, rest = divmod(t0 - self.start_time, timedelta(minutes=1))
+        if rest:
+            return Scenario.actions_between(self, t0, t1)
+        n = int(np.ceil((t1 - t0) / timedelta(minutes=1)))
+        meals = np.zeros(n)
+        offsets = self._meal_minutes - start
+        inside = (offsets >= 0) & (offsets < n)
+        meals[offsets[inside]] = self._meal_amounts[inside]
+        return meals
 
     def reset(self):
         pass
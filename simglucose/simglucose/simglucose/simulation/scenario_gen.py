@@ -1,67 +1,110 @@
 from simglucose.simulation.scenario import Action, Scenario
+from simglucose import trace_cache
 import numpy as np
+import copy
 from scipy.stats import truncnorm
 from datetime import datetime
 import logging
 
 logger = logging.getLogger(__name__)
 
+# one day of a RandomScenario: a row of up to N_MEALS meals, the unused
+# entries having time NaN
+MEAL_DTYPE = np.dtype([('time', np.float64), ('amount', np.float64)])
+N_MEALS = 6
+
+# Probability of taking each meal
+# [breakfast, snack1, lunch, snack2, dinner, snack3]
+MEAL_PROB = [0.95, 0.3, 0.95, 0.3, 0.95, 0.3]
+TIME_LB = np.array([5, 9, 10, 14, 16, 20]) * 60
+TIME_UB = np.array([9, 10, 14, 16, 20, 23]) * 60
+TIME_MU = np.array([7, 9.5, 12, 15, 18, 21.5]) * 60
+TIME_SIGMA = np.array([60, 30, 60, 30, 60, 30])
+AMOUNT_MU = [45, 10, 70, 10, 80, 10]
+AMOUNT_SIGMA = [10, 5, 10, 5, 10, 5]
+
 
 class RandomScenario(Scenario):
-    def __init__(self, start_time, seed=None):
+    def __init__(self, start_time, seed=None, meals=None):
+        '''
+        meals - pre-generated days of this seed, an array of MEAL_DTYPE of
+                shape (n_days, N_MEALS), e.g. a row of a RandomScenarioBank.
+                Days past them are drawn as usual.
+        '''
         Scenario.__init__(self, start_time=start_time)
+        self._meals = meals
         self.seed = seed
 
+    @property
+    def scenario(self):
+        return self._scenario
+
+    @scenario.setter
+    def scenario(self, scenario):
+        self._scenario = scenario
+        # minute of the day -> amount, the first meal listed at a minute wins
+        self._meal_at = {}
+        for minute, amount in zip(scenario['meal']['time'],
+                                  scenario['meal']['amount']):
+            self._meal_at.setdefault(minute, amount)
+
     def get_action(self, t):
         # t must be datetime.datetime object
-        delta_t = t - datetime.combine(t.date(), datetime.min.time())
-        t_sec = delta_t.total_seconds()
-
-        if t_sec < 1:
+        if t.hour == 0 and t.minute == 0 and t.second == 0:
             logger.info('Creating new one day scenario ...')
-            self.scenario = self.create_scenario()
+            self.scenario = self._next_scenario()
 
-        t_min = np.floor(t_sec / 60.0)
-
-        if t_min in self.scenario['meal']['time']:
+        t_min = t.hour * 60 + t.minute
+        if t_min in self._meal_at:
             logger.info('Time for meal!')
-            idx = self.scenario['meal']['time'].index(t_min)
-            return Action(meal=self.scenario['meal']['amount'][idx])
+            return Action(meal=self._meal_at[t_min])
         else:
             return Action(meal=0)
 
     def create_scenario(self):
-        scenario = {'meal': {'time': [], 'amount': []}}
-
-        # Probability of taking each meal
-        # [breakfast, snack1, lunch, snack2, dinner, snack3]
-        prob = [0.95, 0.3, 0.95, 0.3, 0.95, 0.3]
-        time_lb = np.array([5, 9, 10, 14, 16, 20]) * 60
-        time_ub = np.array([9, 10, 14, 16, 20, 23]) * 60
-        time_mu = np.array([7, 9.5, 12, 15, 18, 21.5]) * 60
-        time_sigma = np.array([60, 30, 60, 30, 60, 30])
-        amount_mu = [45, 10, 70, 10, 80, 10]
-        amount_sigma = [10, 5, 10, 5, 10, 5]
-
-        for p, tlb, tub, tbar, tsd, mbar, msd in zip(prob, time_lb, time_ub,
-                                                     time_mu, time_sigma,
-                                                     amount_mu, amount_sigma):
-            if self.random_gen.rand() < p:
-                tmeal = np.round(
-                    truncnorm.rvs(a=(tlb - tbar) / tsd,
-                                  b=(tub - tbar) / tsd,
-                                  loc=tbar,
-                                  scale=tsd,
-                                  random_state=self.random_gen))
-                scenario['meal']['time'].append(tmeal)
-                scenario['meal']['amount'].append(
-                    max(round(self.random_gen.normal(mbar, msd)), 0))
-
-        return scenario
+        return scenario_from_meals(draw_meals(self.random_gen, 1)[0])
+
+    def _next_scenario(self):
+        """
+        The next day of the scenario, read from the pre-generated meals
+        while they cover it
+        """
+        day = self._n_days
+        self._n_days += 1
+        if self._trace is not None:
+            if day < len(self._trace):
+                return scenario_from_meals(self._trace[day])
+            # the generator has not moved while days came from the trace
+            self._trace = None
+            for _ in range(day):
+                self.create_scenario()
+        return self.create_scenario()
+
+    def _load_trace(self):
+        n_days = trace_cache.horizon_days() + 1
+
+        def generate():
+            if type(self).create_scenario is RandomScenario.create_scenario:
+                return meal_bank([self.seed], n_days)[0]
+            gen = copy.copy(self)
+            gen.random_gen = np.random.RandomState(self.seed)
+            meals = np.empty((n_days, N_MEALS), dtype=MEAL_DTYPE)
+            for day in range(n_days):
+                meals[day] = meals_from_scenario(gen.create_scenario())
+            return meals
+
+        kind = 'random_scenario'
+        params = [type(self).__module__, type(self).__qualname__]
+        return trace_cache.load(kind, params, self.seed, n_days, generate)
 
     def reset(self):
         self.random_gen = np.random.RandomState(self.seed)
-        self.scenario = self.create_scenario()
+        if self._meals is not None:
+            self._trace = self._meals
+        else:
+            self._trace = self._load_trace()
+        self._n_days = 0
+        self.scenario = self._next_scenario()
 
     @property
     def seed(self):
@@ -73,10 +116,101 @@ class RandomScenario(Scenario):
         self.reset()
 
 
+class RandomScenarioBank(object):
+    '''
+    The first n_days of RandomScenario(seed) for many seeds, generated at
+    once. meals[i, k] holds the meals of day k of seeds[i] (MEAL_DTYPE, one
+    entry per meal slot, time NaN when the meal is skipped).
+    '''
+
+    def __init__(self, seeds, n_days):
+        self.seeds = list(seeds)
+        self.n_days = n_days
+        self.meals = meal_bank(self.seeds, n_days)
+
+    def __len__(self):
+        return len(self.seeds)
+
+    def scenario(self, i, start_time):
+        """RandomScenario of seeds[i] reading its days from the bank"""
+        return RandomScenario(start_time, seed=self.seeds[i],
+                              meals=self.meals[i])
+
+
+def draw_meals(random_gen, n_days):
+    '''
+    The next n_days of meals from random_gen, as an array of MEAL_DTYPE of
+    shape (n_days, N_MEALS). The draws are those of create_scenario, in the
+    same order; the truncated normal of the meal times is sampled by
+    inversion of the same uniform draws, for all meals at once.
+    '''
+    q = np.full((n_days, N_MEALS), np.nan)
+    amount = np.full((n_days, N_MEALS), np.nan)
+    _draw_quantiles(random_gen, q, amount)
+    return _to_meals(q, amount)
+
+
+def meal_bank(seeds, n_days):
+    '''
+    The first n_days of meals of RandomScenario(seed) for each seed, as an
+    array of MEAL_DTYPE of shape (len(seeds), n_days, N_MEALS)
+    '''
+    q = np.full((len(seeds), n_days, N_MEALS), np.nan)
+    amount = np.full((len(seeds), n_days, N_MEALS), np.nan)
+    for i, seed in enumerate(seeds):
+        _draw_quantiles(np.random.RandomState(seed), q[i], amount[i])
+    return _to_meals(q, amount)
+
+
+def _draw_quantiles(random_gen, q, amount):
+    # Only the sequential RandomState calls are made here. truncnorm.rvs
+    # draws one uniform and maps it through the ppf, which _to_meals does
+    # for all meals at once.
+    for day in range(q.shape[0]):
+        for j, (p, mbar, msd) in enumerate(zip(MEAL_PROB, AMOUNT_MU,
+                                               AMOUNT_SIGMA)):
+            if random_gen.rand() < p:
+                q[day, j] = random_gen.uniform()
+                amount[day, j] = max(round(random_gen.normal(mbar, msd)), 0)
+
+
+def _to_meals(q, amount):
+    meals = np.empty(q.shape, dtype=MEAL_DTYPE)
+    taken = ~np.isnan(q)
+    a = np.broadcast_to((TIME_LB - TIME_MU) / TIME_SIGMA, q.shape)[taken]
+    b = np.broadcast_to((TIME_UB - TIME_MU) / TIME_SIGMA, q.shape)[taken]
+    loc = np.broadcast_to(TIME_MU, q.shape)[taken]
+    scale = np.broadcast_to(TIME_SIGMA, q.shape)[taken]
+    meals['time'] = np.nan
+    meals['time'][taken] = np.round(
+        truncnorm.ppf(q[taken], a, b, loc=loc, scale=scale))
+    meals['amount'] = amount
+    return meals
+
+
+def meals_from_scenario(scenario):
+    """One day of a RandomScenario as a row of MEAL_DTYPE"""
+    meals = np.full(N_MEALS, np.nan, dtype=MEAL_DTYPE)
+    n = len(scenario['meal']['time'])
+    meals['time'][:n] = scenario['meal']['time']
+    meals['amount'][:n] = scenario['meal']['amount']
+    return meals
+
+
+def scenario_from_meals(meals):
+    """The scenario dict of one day of meals, see meals_from_scenario"""
+    taken = meals[~np.isnan(meals['time'])]
+    return {
+        'meal': {
+            'time': [np.float64(t) for t in taken['time']],
+            'amount': [int(a) if a.is_integer() else a for a in taken['amount']],
+        }
+    }
+
+
 if __name__ == '__main__':
     from datetime import time
     from datetime import timedelta
-    import copy
     now = datetime.now()
     t0 = datetime.combine(now.date(), time(6, 0, 0, 0))
     t = copy.deepcopy(t0)
@@ -1,3 +1,20 @@
+from simglucose.simulation.env import T1DSimEnv
+from simglucose.simulation.history import History
+from simglucose.simulation.scenario_gen import RandomScenario
+from simglucose.simulation import result_cache
+from simglucose.simulation.stats import SimStats
+from simglucose.controller.basal_bolus_ctrller import BBController
+from simglucose.sensor.cgm import CGMSensor
+from simglucose.actuator.pump import InsulinPump
+from simglucose.patient.t1dpatient import T1DPatient
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+import contextlib
+import copy
 import logging
 import time
 import os
@@ -18,27 +35,97 @@ class SimObj(object):
                  controller,
                  sim_time,
                  animate=True,
-                 path=None):
+                 path=None,
+                 render_options=None,
+                 cache=None,
+                 dataset=None,
+                 profile=False):
+        """
+        render_options - keyword arguments of env.render when animate is
+                         True, e.g. dict(fps=5) or dict(output='sim.gif')
+                         to write the animation instead of showing it
+        cache          - a result_cache.ResultCache. A run found there is
+                         loaded instead of simulated, and new runs are
+                         stored in it.
+        dataset        - a dataset.TrajectoryDataset the history is streamed
+                         to while the simulation runs, one file per run
+                         named by its result_cache.simulation_key
+        profile        - time the patient, sensor, scenario, controller and
+                         history in self.stats, see stats.SimStats. The
+                         step count, simulated minutes and wall time are
+                         always recorded.
+        """
+        if cache is not None and dataset is not None and dataset.trim_history:
+            raise ValueError('The cache needs the whole history, which '
+                             'dataset.trim_history discards')
         self.env = env
         self.controller = controller
         self.sim_time = sim_time
         self.animate = animate
+        self.render_options = render_options or {}
+        self.cache = cache
+        self.dataset = dataset
+        self.profile = profile
+        self.stats = SimStats()
+        self._cached_results = None
         self._ctrller_kwargs = None
         self.path = path
 
     def simulate(self):
+        key = None
+        # before the key, which depends on the public controller settings
         self.controller.reset()
+        if self.cache is not None:
+            key = self.cache.key(self.env, self.controller, self.sim_time)
+            self._cached_results = self.cache.get(key)
+            if self._cached_results is not None:
+                self.stats = SimStats.cached_run()
+                logger.info('Loaded simulation {} from the cache.'.format(key))
+                return
+
+        writer = None
+        if self.dataset is not None:
+            if key is None:
+                key = result_cache.simulation_key(self.env, self.controller,
+                                                  self.sim_time)
+            writer = self.dataset.writer(
+                self.env.patient.name, key, self.env.scenario.start_time,
+                keep=int(60 / self.env.sensor.sample_time) + 1)
+
+        stats = self.stats = SimStats()
+        stats.runs = 1
         obs, reward, done, info = self.env.reset()
-        tic = time.time()
-        while self.env.time < self.env.scenario.start_time + self.sim_time:
-            if self.animate:
-                self.env.render()
-            action = self.controller.policy(obs, reward, done, **info)
-            obs, reward, done, info = self.env.step(action)
-        toc = time.time()
+        t0 = self.env.patient.t
+        tic = time.perf_counter()
+        profiler = (stats.instrument(self.env, self.controller)
+                    if self.profile else contextlib.nullcontext())
+        with profiler:
+            while self.env.time < self.env.scenario.start_time + self.sim_time:
+                if self.animate:
+                    self.env.render(**self.render_options)
+                action = self.controller.policy(obs, reward, done, **info)
+                obs, reward, done, info = self.env.step(action)
+                stats.steps += 1
+                if writer is not None:
+                    writer.update(self.env.history)
+        toc = time.perf_counter()
+        stats.wall_time = toc - tic
+        stats.sim_minutes = self.env.patient.t - t0
+        if writer is not None:
+            writer.close(self.env.history)
+        if self.animate and self.render_options.get('output') is not None:
+            # write the animation out
+            self.env.render(close=True)
+        if self.cache is not None:
+            self.cache.put(key, self.env.show_history(),
+                           result_cache.summary(self.env, self.controller,
+                                                self.sim_time))
         logger.info('Simulation took {} seconds.'.format(toc - tic))
+        logger.info(str(stats))
 
     def results(self):
+        if self._cached_results is not None:
+            return self._cached_results
         return self.env.show_history()
 
     def save_results(self):
@@ -51,6 +138,8 @@ class SimObj(object):
     def reset(self):
         self.env.reset()
         self.controller.reset()
+        self.stats = SimStats()
+        self._cached_results = None
 
 
 def sim(sim_object):
@@ -62,15 +151,246 @@ def sim(sim_object):
     return sim_object.results()
 
 
-def batch_sim(sim_instances, parallel=False):
+def _sim_with_stats(sim_object):
+    # the SimObj is a copy in a pool worker, so its stats are sent back
+    return sim(sim_object), sim_object.stats
+
+
+def batch_sim(sim_instances, parallel=False, return_stats=False):
+    """
+    Run the SimObjs and return their results. With return_stats, return
+    (results, stats) where stats is the SimStats of all runs combined; the
+    stats of each run are also set on sim_instances, including those run
+    in worker processes.
+    """
     tic = time.time()
     if parallel and pathos:
         with Pool() as p:
-            results = p.map(sim, sim_instances)
+            outputs = p.map(_sim_with_stats, sim_instances)
     else:
         if parallel and not pathos:
             print('Simulation is using single process even though parallel=True.')
-        results = [sim(s) for s in sim_instances]
+        outputs = [_sim_with_stats(s) for s in sim_instances]
     toc = time.time()
+    results = [r for r, _ in outputs]
+    for s, (_, run_stats) in zip(sim_instances, outputs):
+        s.stats = run_stats
+    stats = SimStats.combine(run_stats for _, run_stats in outputs)
     print('Simulation took {} sec.'.format(toc - tic))
+    logger.info(str(stats))
+    if return_stats:
+        return results, stats
     return results
+
+
+# Everything needed to build and run one simulation. scenario=None is a
+# RandomScenario drawn from the task seed; controller_factory is called with
+# no arguments in the worker, so it must be picklable (e.g. a class).
+SimConfig = namedtuple(
+    'SimConfig',
+    ['patient_name', 'scenario', 'controller_factory', 'sensor_name',
+     'pump_name', 'start_time', 'random_init_bg'],
+    defaults=[None, BBController, 'Dexcom', 'Insulet', datetime(2018, 1, 1),
+              False])
+
+
+class BatchResults(object):
+    """
+    Trajectories of a batch_simulate run.
+
+    data[i, k] holds the History.COLUMNS of step k of configs[i], NaN past
+    the end of shorter runs. seeds[i] are the (patient, sensor, scenario)
+    seeds the run used.
+    """
+    COLUMNS = History.COLUMNS
+
+    def __init__(self, configs, seeds, sample_times, data, run_stats=None):
+        self.configs = configs
+        self.seeds = seeds
+        self.sample_times = sample_times
+        self.data = data
+        # SimStats of each run
+        self.run_stats = run_stats
+
+    @property
+    def stats(self):
+        """SimStats of the whole batch, summed over the runs"""
+        return SimStats.combine(s for s in self.run_stats or []
+                                if s is not None)
+
+    def __len__(self):
+        return len(self.configs)
+
+    def start_time(self, i):
+        config = self.configs[i]
+        if config.scenario is not None:
+            return config.scenario.start_time
+        return config.start_time
+
+    def time(self, i):
+        """Time of each row of run i, as a DatetimeIndex"""
+        n = self.data.shape[1]
+        return pd.DatetimeIndex(
+            pd.Timestamp(self.start_time(i)) +
+            pd.to_timedelta(np.arange(n) * self.sample_times[i], unit='min'),
+            name='Time').as_unit('us')
+
+    def frame(self, i):
+        """Run i as a DataFrame indexed by Time, as T1DSimEnv.show_history"""
+        df = pd.DataFrame(self.data[i], index=self.time(i),
+                          columns=list(self.COLUMNS))
+        return df.dropna(how='all')
+
+    def to_frame(self):
+        """All runs, keyed by patient name as in user_interface.simulate"""
+        return pd.concat([self.frame(i) for i in range(len(self))],
+                         keys=[c.patient_name for c in self.configs])
+
+
+def n_steps(sim_time, sample_time):
+    """Steps SimObj.simulate takes to cover sim_time"""
+    return int(np.ceil(sim_time / timedelta(minutes=sample_time)))
+
+
+def task_seeds(seed, n):
+    """
+    Independent (patient, sensor, scenario) seeds of n tasks, from
+    np.random.SeedSequence(seed). They only depend on seed and on the task
+    index, not on how the tasks are scheduled.
+    """
+    children = np.random.SeedSequence(seed).spawn(n)
+    return np.array([c.generate_state(3) for c in children], dtype=np.int64)
+
+
+def batch_simulate(configs, sim_time, seed=None, parallel=True,
+                   max_workers=None, chunksize=None, cache_dir=None,
+                   dataset=None, profile=False):
+    """
+    Run SimConfigs for sim_time in a process pool and return BatchResults.
+
+    Workers receive only the configs and seeds, in chunks of chunksize
+    tasks (by default about four chunks per worker), and write the
+    trajectories straight into a shared-memory array. With cache_dir, runs
+    found in that ResultCache are not simulated and the others are stored
+    there as they complete, so an interrupted batch resumes where it
+    stopped. With dataset (a TrajectoryDataset without trim_history), the
+    simulated runs are also streamed to it. The SimStats of every run
+    (section times too with profile) are in the run_stats of the results.
+    """
+    if dataset is not None and dataset.trim_history:
+        raise ValueError('batch_simulate keeps the whole history of each '
+                         'run, which dataset.trim_history discards')
+    configs = list(configs)
+    seeds = task_seeds(seed, len(configs))
+    sample_times = [CGMSensor.withName(c.sensor_name).sample_time
+                    for c in configs]
+    n_rows = max([n_steps(sim_time, st) + 1 for st in sample_times] + [1])
+    shape = (len(configs), n_rows, len(BatchResults.COLUMNS))
+    tasks = [(i, config, seeds[i], sim_time, cache_dir, dataset, profile)
+             for i, config in enumerate(configs)]
+    run_stats = [None] * len(configs)
+
+    tic = time.time()
+    shm = shared_memory.SharedMemory(create=True,
+                                     size=max(int(np.prod(shape)) * 8, 1))
+    try:
+        data = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        data[:] = np.nan
+        if cache_dir is not None:
+            remaining = []
+            for task in tasks:
+                if _load_cached(task, data):
+                    run_stats[task[0]] = SimStats.cached_run()
+                else:
+                    remaining.append(task)
+            tasks = remaining
+        if parallel:
+            if max_workers is None:
+                max_workers = os.cpu_count() or 1
+            if chunksize is None:
+                chunksize = max(1, len(tasks) // (4 * max_workers))
+            with ProcessPoolExecutor(max_workers=max_workers,
+                                     initializer=_attach_results,
+                                     initargs=(shm.name, shape)) as pool:
+                for i, stats in pool.map(_run_task, tasks,
+                                         chunksize=chunksize):
+                    run_stats[i] = stats
+        else:
+            _worker_results['data'] = data
+            try:
+                for task in tasks:
+                    i, run_stats[i] = _run_task(task)
+            finally:
+                _worker_results.clear()
+        results = BatchResults(configs, seeds, sample_times, data.copy(),
+                               run_stats)
+        del data
+    finally:
+        shm.close()
+        shm.unlink()
+    logger.info('Batch of {} simulations took {} sec.'.format(
+        len(configs), time.time() - tic))
+    logger.info(str(results.stats))
+    return results
+
+
+# the shared result array, as seen by a worker process
+_worker_results = {}
+
+
+def _attach_results(name, shape):
+    # Pool workers share the resource tracker of the parent, which owns the
+    # segment and unlinks it
+    shm = shared_memory.SharedMemory(name=name)
+    _worker_results['shm'] = shm
+    _worker_results['data'] = np.ndarray(shape, dtype=np.float64,
+                                         buffer=shm.buf)
+
+
+def build_env(config, seeds):
+    """The T1DSimEnv of a SimConfig, seeded with its task seeds"""
+    patient_seed, sensor_seed, scenario_seed = (int(s) for s in seeds)
+    patient = T1DPatient.withName(config.patient_name,
+                                  random_init_bg=config.random_init_bg,
+                                  seed=patient_seed)
+    sensor = CGMSensor.withName(config.sensor_name, seed=sensor_seed)
+    pump = InsulinPump.withName(config.pump_name)
+    if config.scenario is None:
+        scenario = RandomScenario(start_time=config.start_time,
+                                  seed=scenario_seed)
+    else:
+        scenario = copy.deepcopy(config.scenario)
+    return T1DSimEnv(patient, sensor, pump, scenario)
+
+
+def _run_task(task):
+    i, config, seeds, sim_time, cache_dir, dataset, profile = task
+    env = build_env(config, seeds)
+    cache = None if cache_dir is None else result_cache.ResultCache(cache_dir)
+    sim_object = SimObj(env, config.controller_factory(), sim_time,
+                        animate=False, cache=cache, dataset=dataset,
+                        profile=profile)
+    sim_object.simulate()
+    out = _worker_results['data'][i]
+    if sim_object.stats.cached:
+        # stored meanwhile by another batch, env was not simulated
+        df = sim_object.results()
+        out[:len(df)] = df[list(BatchResults.COLUMNS)].values
+    else:
+        history = env.history
+        for j, name in enumerate(BatchResults.COLUMNS):
+            out[:len(history), j] = history.column(name)
+    return i, sim_object.stats
+
+
+def _load_cached(task, data):
+    """Fill the rows of task from the cache, return whether it was there"""
+    i, config, seeds, sim_time, cache_dir = task[:5]
+    cache = result_cache.ResultCache(cache_dir)
+    controller = config.controller_factory()
+    controller.reset()
+    df = cache.get(cache.key(build_env(config, seeds), controller, sim_time))
+    if df is None:
+        return False
+    data[i, :len(df)] = df[list(BatchResults.COLUMNS)].values
+    return True
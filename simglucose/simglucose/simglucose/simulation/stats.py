@@ -0,0 +1,184 @@
+"""
+Throughput statistics of simulation runs.
+
+SimObj.simulate always counts the steps, the simulated minutes and the wall
+time of a run. With profile=True it also splits the wall time across the
+parts of the simulation loop (see SimStats.SECTIONS) by timing the methods
+of the patient, sensor, scenario and controller while it runs. Each time is
+exclusive: the time env.step spends in the patient is counted as patient
+time, and what is left of env.step (risk indices, history, reward) as
+history time. Stats of several runs, e.g. from the workers of a batch, are
+combined with merge or SimStats.combine.
+"""
+from contextlib import contextmanager
+from time import perf_counter
+
+
+class SimStats(object):
+    SECTIONS = ("patient", "sensor", "scenario", "controller", "history")
+    # methods timed by instrument, on the component of each section
+    METHODS = {
+        "patient": ("step", "multi_step", "simulate_schedule"),
+        "sensor": ("measure", "measure_at"),
+        "scenario": ("get_action", "actions_between"),
+        "controller": ("policy", ),
+        "history": ("step", ),
+    }
+
+    def __init__(self):
+        self.runs = 0
+        self.cached = 0  # runs loaded from a cache instead of simulated
+        self.steps = 0
+        self.sim_minutes = 0.0
+        self.wall_time = 0.0
+        self.times = dict.fromkeys(self.SECTIONS, 0.0)
+        self.calls = dict.fromkeys(self.SECTIONS, 0)
+        self._stack = []
+        self._mark = 0.0
+
+    @classmethod
+    def cached_run(cls):
+        """Stats of one run loaded from a cache instead of simulated"""
+        stats = cls()
+        stats.runs = stats.cached = 1
+        return stats
+
+    @property
+    def profiled(self):
+        """Whether the section times were measured"""
+        return any(self.calls.values())
+
+    @property
+    def sim_minutes_per_second(self):
+        if self.wall_time == 0:
+            return float("nan")
+        return self.sim_minutes / self.wall_time
+
+    @property
+    def steps_per_second(self):
+        if self.wall_time == 0:
+            return float("nan")
+        return self.steps / self.wall_time
+
+    @property
+    def other_time(self):
+        """Wall time outside of the sections, e.g. rendering or writing"""
+        if not self.profiled:
+            return float("nan")
+        return self.wall_time - sum(self.times.values())
+
+    def fractions(self):
+        """Share of the wall time of each section, and of the rest"""
+        total = self.wall_time or float("nan")
+        shares = {k: v / total for k, v in self.times.items()}
+        shares["other"] = self.other_time / total
+        return shares
+
+    def merge(self, other):
+        """Add the counts and times of other to these stats"""
+        self.runs += other.runs
+        self.cached += other.cached
+        self.steps += other.steps
+        self.sim_minutes += other.sim_minutes
+        self.wall_time += other.wall_time
+        for k in self.SECTIONS:
+            self.times[k] += other.times[k]
+            self.calls[k] += other.calls[k]
+        return self
+
+    def __add__(self, other):
+        return SimStats().merge(self).merge(other)
+
+    @classmethod
+    def combine(cls, stats):
+        """Sum of an iterable of SimStats"""
+        total = cls()
+        for s in stats:
+            total.merge(s)
+        return total
+
+    def as_dict(self):
+        d = {
+            "runs": self.runs,
+            "cached": self.cached,
+            "steps": self.steps,
+            "sim_minutes": self.sim_minutes,
+            "wall_time": self.wall_time,
+            "sim_minutes_per_second": self.sim_minutes_per_second,
+        }
+        d.update({k + "_time": v for k, v in self.times.items()})
+        d["other_time"] = self.other_time
+        return d
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_stack"] = []
+        return state
+
+    def __repr__(self):
+        return ("SimStats(runs={}, steps={}, sim_minutes={:.0f}, "
+                "wall_time={:.3f}s, {:.0f} sim min/s)").format(
+                    self.runs, self.steps, self.sim_minutes, self.wall_time,
+                    self.sim_minutes_per_second)
+
+    def __str__(self):
+        lines = [repr(self)]
+        if self.profiled:
+            shares = self.fractions()
+            for k in self.SECTIONS + ("other", ):
+                t = self.times.get(k, self.other_time)
+                lines.append("  {:<10} {:9.3f}s {:6.1%}".format(
+                    k, t, shares[k]))
+        return "\n".join(lines)
+
+    def _timed(self, section, fn):
+        stack = self._stack
+        times = self.times
+        calls = self.calls
+
+        def timed(*args, **kwargs):
+            now = perf_counter()
+            if stack:
+                # pause the caller, its time is exclusive
+                times[stack[-1]] += now - self._mark
+            stack.append(section)
+            calls[section] += 1
+            self._mark = now
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                now = perf_counter()
+                times[stack.pop()] += now - self._mark
+                self._mark = now
+
+        return timed
+
+    @contextmanager
+    def instrument(self, env, controller):
+        """
+        Time the sections of a run of env and controller within the block.
+        The methods are wrapped on the instances and restored on exit.
+        """
+        components = {
+            "patient": env.patient,
+            "sensor": env.sensor,
+            "scenario": env.scenario,
+            "controller": controller,
+            "history": env,
+        }
+        patched = []
+        try:
+            for section, obj in components.items():
+                for name in self.METHODS[section]:
+                    fn = getattr(obj, name, None)
+                    if fn is None or not hasattr(obj, "__dict__"):
+                        continue
+                    patched.append((obj, name, obj.__dict__.get(name)))
+                    setattr(obj, name, self._timed(section, fn))
+            yield self
+        finally:
+            for obj, name, previous in reversed(patched):
+                if previous is None:
+                    del obj.__dict__[name]
+                else:
+                    setattr(obj, name, previous)
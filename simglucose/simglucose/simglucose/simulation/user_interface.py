@@ -1,4 +1,5 @@
 from simglucose.simulation.sim_engine import SimObj, batch_sim
+from simglucose.simulation.result_cache import ResultCache
 from simglucose.simulation.env import T1DSimEnv
 from simglucose.controller.basal_bolus_ctrller import BBController
 from simglucose.sensor.cgm import CGMSensor
@@ -7,9 +8,9 @@ from simglucose.patient.t1dpatient import T1DPatient
 from simglucose.simulation.scenario_gen import RandomScenario
 from simglucose.simulation.scenario import CustomScenario
 from simglucose.analysis.report import report
+from simglucose import registry
 import pandas as pd
 import copy
-import pkg_resources
 import logging
 import os
 from datetime import datetime
@@ -18,20 +19,13 @@ import platform
 
 logger = logging.getLogger(__name__)
 
-PATIENT_PARA_FILE = pkg_resources.resource_filename(
-    "simglucose", "params/vpatient_params.csv"
-)
-SENSOR_PARA_FILE = pkg_resources.resource_filename(
-    "simglucose", "params/sensor_params.csv"
-)
-INSULIN_PUMP_PARA_FILE = pkg_resources.resource_filename(
-    "simglucose", "params/pump_params.csv"
-)
+PATIENT_PARA_FILE = registry.PATIENT_PARA_FILE
+SENSOR_PARA_FILE = registry.SENSOR_PARA_FILE
+INSULIN_PUMP_PARA_FILE = registry.INSULIN_PUMP_PARA_FILE
 
 
 def pick_patients():
-    patient_params = pd.read_csv(PATIENT_PARA_FILE)
-    patient_names = list(patient_params["Name"].values)
+    patient_names = list(registry.patients.names)
     while True:
         select1 = input(
             "Select virtual patients:\n"
@@ -103,9 +97,8 @@ def pick_patients():
 
 
 def pick_cgm_sensor():
-    sensor_params = pd.read_csv(SENSOR_PARA_FILE)
-    sensor_names = list(sensor_params["Name"].values)
-    total_sensor_num = len(sensor_params.index)
+    sensor_names = list(registry.sensors.names)
+    total_sensor_num = len(sensor_names)
     while True:
         print("Select the CGM sensor:")
         for i in range(total_sensor_num):
@@ -146,8 +139,7 @@ def pick_cgm_seed():
 
 
 def pick_insulin_pump():
-    pump_params = pd.read_csv(INSULIN_PUMP_PARA_FILE)
-    pump_names = list(pump_params["Name"].values)
+    pump_names = list(registry.pumps.names)
     while True:
         print("Select the insulin pump:")
         for i, pump in enumerate(pump_names):
@@ -320,6 +312,7 @@ def simulate(
     save_path=None,
     animate=None,
     parallel=None,
+    cache_dir=None,
 ):
     """
     Main user interface.
@@ -334,6 +327,9 @@ def simulate(
     save_path  - a string representing the directory to save simulation results.
     animate    - switch for animation. True/False.
     parallel   - switch for parallel computing. True/False.
+    cache_dir  - a directory caching the simulation results. Runs whose
+                 configuration is unchanged are loaded from it instead of
+                 simulated, see simglucose.simulation.result_cache.
     """
     if animate is None:
         animate = pick_animate()
@@ -386,8 +382,9 @@ def simulate(
     envs = [local_build_env(p) for p in patient_names]
 
     ctrllers = [copy.deepcopy(controller) for _ in range(len(envs))]
+    cache = None if cache_dir is None else ResultCache(cache_dir)
     sim_instances = [
-        SimObj(e, c, sim_time, animate=animate, path=save_path)
+        SimObj(e, c, sim_time, animate=animate, path=save_path, cache=cache)
         for (e, c) in zip(envs, ctrllers)
     ]
 
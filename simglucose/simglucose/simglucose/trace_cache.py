@@ -0,0 +1,99 @@
+"""
+Optional on-disk cache of seeded random traces.
+
+When a cache directory is set, CGMNoise and RandomScenario store the first
+days of their (params, seed) streams as .npy files and load them back with
+np.load(mmap_mode='r'). Runs repeating the same combinations, including
+parallel workers, then read one shared copy of the pages instead of
+regenerating the trace. The cache is off by default; it can be turned on
+with set_cache_dir or the SIMGLUCOSE_TRACE_CACHE environment variable.
+
+Traces drawn with seed=None are never cached.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ENV_VAR = "SIMGLUCOSE_TRACE_CACHE"
+DEFAULT_DAYS = 31  # length of the cached traces
+
+_config = {"path": os.environ.get(ENV_VAR) or None, "days": DEFAULT_DAYS}
+
+
+def set_cache_dir(path, days=DEFAULT_DAYS):
+    """
+    Cache traces under path, covering the first days of each stream.
+    path=None disables the cache.
+    """
+    if path is not None:
+        os.makedirs(path, exist_ok=True)
+    _config["path"] = path
+    _config["days"] = days
+
+
+def cache_dir():
+    return _config["path"]
+
+
+def horizon_days():
+    return _config["days"]
+
+
+def _plain(value):
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def _param_items(params):
+    if getattr(params, "dtype", None) is not None and params.dtype.names:
+        return [(n, params[n]) for n in params.dtype.names]
+    if hasattr(params, "items"):
+        return list(params.items())
+    return params
+
+
+def trace_key(kind, params, seed, length):
+    """Hash identifying the trace of kind for (params, seed, length)"""
+    payload = json.dumps(
+        [kind, _param_items(params), seed, length], default=_plain, sort_keys=True
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def load(kind, params, seed, length, generate):
+    """
+    The cached trace of kind for (params, seed, length) as a read-only
+    memory map, created from generate() on a miss. Returns None when the
+    cache is disabled or seed is None.
+    """
+    path = cache_dir()
+    if path is None or seed is None:
+        return None
+    filename = os.path.join(
+        path, "{}-{}.npy".format(kind, trace_key(kind, params, seed, length))
+    )
+    try:
+        return np.load(filename, mmap_mode="r")
+    except FileNotFoundError:
+        pass
+
+    logger.debug("Caching {} trace in {}".format(kind, filename))
+    data = generate()
+    os.makedirs(path, exist_ok=True)
+    # write under a temporary name so that concurrent readers only ever see
+    # complete files
+    fd, tmp = tempfile.mkstemp(dir=path, suffix=".npy.tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, data)
+        os.replace(tmp, filename)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return np.load(filename, mmap_mode="r")
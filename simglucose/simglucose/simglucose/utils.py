@@ -1,22 +1,24 @@
-import pkg_resources
+from simglucose import registry
 import pandas as pd
 
-CONTROL_QUEST = pkg_resources.resource_filename('simglucose',
-                                                'params/Quest.csv')
-PATIENT_PARA_FILE = pkg_resources.resource_filename(
-    'simglucose', 'params/vpatient_params.csv')
+CONTROL_QUEST = registry.CONTROL_QUEST
+PATIENT_PARA_FILE = registry.PATIENT_PARA_FILE
 
 
 def fetch_patient_params(patient_name: str):
-    all_params = pd.read_csv(PATIENT_PARA_FILE)
-    patient_params = lookup_patient_meta_data(all_params, patient_name)
-    return patient_params
+    return lookup_registry(registry.patients, patient_name)
 
 
 def fetch_patient_quest(patient_name: str):
-    all_quests = pd.read_csv(CONTROL_QUEST)
-    quest = lookup_patient_meta_data(all_quests, patient_name)
-    return quest
+    return lookup_registry(registry.quests, patient_name)
+
+
+def lookup_registry(table: registry.ParamTable, patient_name: str) -> dict:
+    params = {}
+    if patient_name in table:
+        record = table.get(patient_name)
+        params = dict(zip(record.dtype.names, record.tolist()))
+    return params
 
 
 def lookup_patient_meta_data(df: pd.DataFrame, patient_name: str) -> dict:
@@ -0,0 +1,26 @@
+"""T1DSimEnv set-up shared by the tests"""
+from datetime import datetime
+from simglucose.simulation.env import T1DSimEnv
+from simglucose.sensor.cgm import CGMSensor
+from simglucose.actuator.pump import InsulinPump
+from simglucose.patient.t1dpatient import T1DPatient
+from simglucose.simulation.scenario_gen import RandomScenario
+
+START_TIME = datetime(2018, 1, 1, 6, 0, 0)
+
+
+def make_env(patient_name="adolescent#001", integrator="dopri5",
+             scenario=None, scenario_seed=1, sensor_seed=1, macro_step=False,
+             lean=False):
+    """
+    Environment of patient_name with the Dexcom sensor and the Insulet
+    pump. The scenario is RandomScenario from START_TIME unless one is
+    given.
+    """
+    patient = T1DPatient.withName(patient_name, integrator=integrator)
+    sensor = CGMSensor.withName("Dexcom", seed=sensor_seed)
+    pump = InsulinPump.withName("Insulet")
+    if scenario is None:
+        scenario = RandomScenario(start_time=START_TIME, seed=scenario_seed)
+    return T1DSimEnv(patient, sensor, pump, scenario, macro_step=macro_step,
+                     lean=lean)
@@ -0,0 +1,52 @@
+import unittest
+import numpy as np
+import pandas as pd
+from simglucose.patient.t1dpatient import T1DPatient, Action, PATIENT_PARA_FILE
+from simglucose.patient.batch_t1dpatient import BatchT1DPatient
+
+
+class TestBatchT1DPatient(unittest.TestCase):
+    def test_matches_scalar_patients(self):
+        names = list(pd.read_csv(PATIENT_PARA_FILE).Name)
+        seeds = list(range(len(names)))
+        batch = BatchT1DPatient.withNames(names, random_init_bg=True, seed=seeds)
+        patients = [
+            T1DPatient.withName(n, random_init_bg=True, seed=s)
+            for n, s in zip(names, seeds)
+        ]
+        np.testing.assert_allclose(
+            batch.state, np.array([p.state for p in patients], dtype=float)
+        )
+
+        basal = np.array([p._params.u2ss * p._params.BW / 6000 for p in patients])
+        for t in range(150):
+            CHO = 45 if t == 30 else 0
+            insulin = basal + (4.5 if t == 30 else 0)
+            batch.step(Action(CHO=CHO, insulin=insulin))
+            for p, ins in zip(patients, insulin):
+                p.step(Action(CHO=CHO, insulin=ins))
+
+        self.assertEqual(batch.t, patients[0].t)
+        np.testing.assert_array_equal(
+            batch.planned_meal, [p.planned_meal for p in patients]
+        )
+        np.testing.assert_allclose(
+            batch.observation.Gsub,
+            [p.observation.Gsub for p in patients],
+            rtol=1e-5,
+        )
+
+    def test_reset(self):
+        batch = BatchT1DPatient.withNames(["adult#001", "child#002"])
+        init = batch.state.copy()
+        for _ in range(10):
+            batch.step(Action(CHO=5, insulin=0.02))
+        self.assertEqual(batch.t, 10)
+        batch.reset()
+        self.assertEqual(batch.t, 0)
+        np.testing.assert_array_equal(batch.state, init)
+        np.testing.assert_array_equal(batch.planned_meal, [0, 0])
+
+
+if __name__ == "__main__":
+    unittest.main()
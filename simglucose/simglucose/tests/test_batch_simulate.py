@@ -0,0 +1,55 @@
+import unittest
+from datetime import datetime, timedelta
+import numpy as np
+from simglucose.simulation.sim_engine import (SimObj, SimConfig, BatchResults,
+                                              batch_simulate, build_env,
+                                              task_seeds)
+from simglucose.simulation.scenario import CustomScenario
+from simglucose.controller.basal_bolus_ctrller import BBController
+
+SIM_TIME = timedelta(hours=6)
+
+
+def configs():
+    scenario = CustomScenario(datetime(2018, 1, 1, 6), [(7, 45), (10, 20)])
+    return [
+        SimConfig('adolescent#001'),
+        SimConfig('adult#002', scenario=scenario),
+        SimConfig('child#003', random_init_bg=True),
+        SimConfig('adult#002', start_time=datetime(2018, 1, 1, 11)),
+    ]
+
+
+class TestBatchSimulate(unittest.TestCase):
+    def test_task_seeds(self):
+        seeds = task_seeds(7, 5)
+        self.assertEqual(seeds.shape, (5, 3))
+        np.testing.assert_array_equal(seeds[:3], task_seeds(7, 3))
+        self.assertFalse((seeds == task_seeds(8, 5)).all())
+
+    def test_parallel_matches_serial(self):
+        serial = batch_simulate(configs(), SIM_TIME, seed=1, parallel=False)
+        parallel = batch_simulate(configs(), SIM_TIME, seed=1, max_workers=2,
+                                  chunksize=1)
+        self.assertEqual(serial.data.shape, (4, 73, len(BatchResults.COLUMNS)))
+        np.testing.assert_array_equal(serial.data, parallel.data)
+        np.testing.assert_array_equal(serial.seeds, parallel.seeds)
+
+        df = parallel.to_frame()
+        self.assertEqual(list(df.index.levels[0]),
+                         sorted({c.patient_name for c in configs()}))
+        self.assertEqual(parallel.frame(1).index[0], datetime(2018, 1, 1, 6))
+
+    def test_matches_sim_obj(self):
+        results = batch_simulate(configs(), SIM_TIME, seed=3, parallel=False)
+        for i, config in enumerate(configs()):
+            env = build_env(config, results.seeds[i])
+            SimObj(env, BBController(), SIM_TIME, animate=False).simulate()
+            ref = env.show_history()
+            df = results.frame(i)
+            self.assertTrue(df.index.equals(ref.index))
+            np.testing.assert_array_equal(df.values, ref.values)
+
+
+if __name__ == '__main__':
+    unittest.main()
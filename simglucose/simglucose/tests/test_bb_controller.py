@@ -0,0 +1,65 @@
+import unittest
+import numpy as np
+from simglucose import registry
+from simglucose.controller.base import Action
+from simglucose.controller.basal_bolus_ctrller import (BBController,
+                                                       AVERAGE_PARAMS)
+from simglucose.simulation.env import Observation
+
+NAMES = ['adolescent#001', 'adult#005', 'child#010', 'unknown', 'adult#005']
+
+
+class TestBBController(unittest.TestCase):
+    def test_params(self):
+        ctrller = BBController()
+        quest = registry.quests.to_frame().set_index('Name')
+        patients = registry.patients.to_frame().set_index('Name')
+        params = ctrller.params('child#002')
+        self.assertAlmostEqual(params.CR, quest.CR['child#002'])
+        self.assertAlmostEqual(params.CF, quest.CF['child#002'])
+        self.assertAlmostEqual(params.u2ss, patients.u2ss['child#002'])
+        self.assertAlmostEqual(params.BW, patients.BW['child#002'])
+        self.assertIs(ctrller.params('child#002'), params)
+        self.assertEqual(ctrller.params('unknown'), AVERAGE_PARAMS)
+        self.assertEqual(ctrller.params(None), AVERAGE_PARAMS)
+
+    def test_policy(self):
+        ctrller = BBController()
+        patients = registry.patients.to_frame().set_index('Name')
+        quest = registry.quests.to_frame().set_index('Name')
+        name = 'adult#003'
+        action = ctrller.policy(Observation(CGM=180.0), 0, False,
+                                patient_name=name, meal=15, sample_time=3)
+        u2ss, BW = patients.u2ss[name], patients.BW[name]
+        CR, CF = quest.CR[name], quest.CF[name]
+        self.assertAlmostEqual(action.basal, u2ss * BW / 6000)
+        self.assertAlmostEqual(action.bolus,
+                               (15 * 3 / CR + (180 - 140) / CF) / 3)
+        action = ctrller.policy(Observation(CGM=180.0), 0, False,
+                                patient_name=name, meal=0, sample_time=3)
+        self.assertEqual(action.bolus, 0)
+
+    def test_policy_batch(self):
+        ctrller = BBController()
+        meal = np.array([0, 10, 5, 20, 0])
+        glucose = np.array([120, 160, 140, 200, 90])
+        batch = ctrller.policy_batch(NAMES, meal, glucose, sample_time=3)
+        self.assertIsInstance(batch, Action)
+        for i, name in enumerate(NAMES):
+            action = BBController().policy(Observation(CGM=glucose[i]), 0,
+                                           False, patient_name=name,
+                                           meal=meal[i], sample_time=3)
+            self.assertAlmostEqual(batch.basal[i], action.basal)
+            self.assertAlmostEqual(batch.bolus[i], action.bolus)
+
+        # the parameter arrays are reused while the names do not change
+        arrays = ctrller._batch
+        again = ctrller.policy_batch(NAMES, meal * 0, glucose)
+        self.assertIs(ctrller._batch, arrays)
+        np.testing.assert_array_equal(again.bolus, 0)
+        ctrller.policy_batch(NAMES[:2], meal[:2], glucose[:2])
+        self.assertEqual(len(ctrller._batch[1]), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+from datetime import datetime, timedelta
+import numpy as np
+from simglucose.simulation.scenario import CustomScenario, Scenario
+
+
+def linear_search(scenario, t):
+    # the lookup CustomScenario.get_action used to do
+    from simglucose.simulation.scenario import parseTime
+
+    for time, meal in scenario.scenario:
+        if parseTime(time, scenario.start_time) == t:
+            return meal
+    return 0
+
+
+class TestCustomScenario(unittest.TestCase):
+    def setUp(self):
+        self.start_time = datetime(2018, 1, 1, 6, 0, 0)
+        meals = [
+            (1, 45),
+            (timedelta(hours=5, minutes=30), 70),
+            (datetime(2018, 1, 1, 18, 0, 0), 80),
+            (datetime(2018, 1, 1, 20, 0, 30), 10),  # off the minute grid
+            (1, 20),  # shadowed by the first meal at 7:00
+            (-2, 15),  # before start_time
+        ]
+        self.scenario = CustomScenario(start_time=self.start_time, scenario=meals)
+
+    def test_matches_linear_search(self):
+        times = [self.start_time + timedelta(minutes=i) for i in range(-180, 1440)]
+        times.append(datetime(2018, 1, 1, 20, 0, 30))
+        for t in times:
+            self.assertEqual(
+                self.scenario.get_action(t).meal, linear_search(self.scenario, t)
+            )
+
+    def test_actions_between(self):
+        t0 = self.start_time - timedelta(hours=3)
+        t1 = self.start_time + timedelta(days=1)
+        expected = Scenario.actions_between(self.scenario, t0, t1)
+        np.testing.assert_array_equal(self.scenario.actions_between(t0, t1), expected)
+        self.assertEqual(expected.sum(), 15 + 45 + 70 + 80)
+
+    def test_follows_changes(self):
+        self.scenario.scenario = [(2, 30)]
+        hour = self.start_time + timedelta(hours=1)
+        self.assertEqual(self.scenario.get_action(hour).meal, 0)
+        self.assertEqual(self.scenario.get_action(hour + timedelta(hours=1)).meal, 30)
+        self.scenario.start_time += timedelta(hours=1)
+        self.assertEqual(self.scenario.get_action(self.start_time + timedelta(hours=3)).meal, 30)
+
+
+if __name__ == "__main__":
+    unittest.main()
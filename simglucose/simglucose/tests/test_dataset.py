@@ -0,0 +1,74 @@
+import unittest
+import shutil
+import tempfile
+from datetime import timedelta
+import numpy as np
+from simglucose.simulation.sim_engine import SimObj
+from simglucose.controller.basal_bolus_ctrller import BBController
+from env_helpers import make_env
+
+try:
+    import pyarrow
+    from simglucose.simulation.dataset import TrajectoryDataset
+except ImportError:
+    pyarrow = None
+
+SIM_TIME = timedelta(hours=12)
+
+
+def make_sim(name, dataset):
+    env = make_env(name, integrator='rk4')
+    return SimObj(env, BBController(), SIM_TIME, animate=False,
+                  dataset=dataset)
+
+
+@unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+class TestDataset(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def check_format(self, format):
+        ref = make_sim('adolescent#001', None)
+        ref.simulate()
+        ref = ref.results()
+
+        dataset = TrajectoryDataset(self.root, format=format,
+                                    row_group_size=50)
+        for name in ['adolescent#001', 'child#002']:
+            make_sim(name, dataset).simulate()
+        files = dataset.files()
+        self.assertEqual(len(files), 2)
+        self.assertIn('patient=adolescent#001', files[0])
+
+        df = dataset.read(files[0])
+        self.assertTrue(df.index.equals(ref.index))
+        np.testing.assert_allclose(df.values, ref.values.astype(np.float32))
+        table = dataset.to_arrow_dataset().to_table()
+        self.assertEqual(table.num_rows, 2 * len(ref))
+        self.assertEqual(table.schema.field('minutes').type, pyarrow.int64())
+        self.assertEqual(table.schema.field('BG').type, pyarrow.float32())
+
+    def test_parquet(self):
+        self.check_format('parquet')
+
+    def test_arrow(self):
+        self.check_format('arrow')
+
+    def test_trim_history(self):
+        dataset = TrajectoryDataset(self.root, row_group_size=20,
+                                    trim_history=True)
+        sim = make_sim('adolescent#001', dataset)
+        sim.simulate()
+        self.assertLess(len(sim.env.history), 40)
+        ref = make_sim('adolescent#001', None)
+        ref.simulate()
+        df = dataset.read(dataset.files()[0])
+        np.testing.assert_allclose(df.values,
+                                   ref.results().values.astype(np.float32))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+import numpy as np
+from simglucose.simulation.env import T1DSimEnv
+from simglucose.simulation.sim_engine import SimObj
+from simglucose.simulation.scenario_gen import RandomScenario
+from simglucose.controller.basal_bolus_ctrller import BBController
+from simglucose.sensor.cgm import CGMSensor
+from simglucose.actuator.pump import InsulinPump
+from simglucose.patient.t1dpatient import T1DPatient
+from simglucose.analysis.metrics import GlycemicMetrics
+
+try:
+    import pyarrow
+    from simglucose.simulation.dataset import TrajectoryDataset
+    from simglucose.analysis.ensemble import dataset_report
+except ImportError:
+    pyarrow = None
+
+SIM_TIME = timedelta(hours=12)
+PATIENTS = ['adolescent#001', 'adult#001', 'child#002']
+
+
+def make_sim(name, seed, dataset=None):
+    patient = T1DPatient.withName(name)
+    sensor = CGMSensor.withName('Dexcom', seed=seed)
+    pump = InsulinPump.withName('Insulet')
+    scenario = RandomScenario(start_time=datetime(2018, 1, 1, 6), seed=seed)
+    env = T1DSimEnv(patient, sensor, pump, scenario)
+    return SimObj(env, BBController(), SIM_TIME, animate=False,
+                  dataset=dataset)
+
+
+@unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+class TestDatasetReport(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.root = tempfile.mkdtemp()
+        dataset = TrajectoryDataset(cls.root, row_group_size=64)
+        cls.BG = {}
+        for name in PATIENTS:
+            for seed in (1, 2):
+                sim = make_sim(name, seed, dataset)
+                sim.simulate()
+                cls.BG[name, seed] = sim.results().BG.values.astype(
+                    np.float32)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.root)
+
+    def test_matches_in_memory_metrics(self):
+        results, ri_per_hour, zone_stats = dataset_report(
+            self.root, runs_per_batch=4)
+        self.assertEqual(len(results), 6)
+        self.assertEqual(list(results.index.names), ['patient', 'run_id'])
+        self.assertEqual(list(ri_per_hour.index.levels[0]),
+                         ['LBGI', 'HBGI', 'Risk Index'])
+
+        # runs are keyed by their file name, so match them by TIR and LBGI
+        BG = np.column_stack(list(self.BG.values())).astype(np.float64)
+        metrics = GlycemicMetrics(BG, sample_time=5)
+        expected = metrics.results()
+        np.testing.assert_allclose(
+            np.sort(results['70<=BG<=180'].values),
+            np.sort(expected['70<=BG<=180'].values))
+        np.testing.assert_allclose(np.sort(results.LBGI.values),
+                                   np.sort(expected.LBGI.values))
+        np.testing.assert_allclose(zone_stats.values,
+                                   metrics.zone_stats().values)
+
+    def test_filters(self):
+        results, ri_per_hour, _ = dataset_report(
+            self.root, patients=['child#002'], start=60, stop=6 * 60)
+        self.assertEqual(set(results.index.get_level_values('patient')),
+                         {'child#002'})
+        self.assertEqual(len(results), 2)
+        # 5 hours of 5-minute samples
+        self.assertEqual(ri_per_hour.shape[1], 5)
+        BG = self.BG['child#002', 1][12:72].astype(np.float64)
+        expected = GlycemicMetrics(BG, sample_time=5).results()
+        self.assertIn(round(expected.HBGI.iloc[0], 6),
+                      list(results.HBGI.round(6)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+from pandas.testing import assert_frame_equal
+from simglucose.controller.base import Action
+from env_helpers import make_env
+
+
+class TestFork(unittest.TestCase):
+    def setUp(self):
+        self.env = make_env()
+        self.env.reset()
+        for _ in range(20):
+            self.env.step(Action(basal=0.01, bolus=0))
+
+    def test_fork_continues_like_original(self):
+        fork = self.env.fork()
+        for _ in range(30):
+            obs, _, _, _ = self.env.step(Action(basal=0.02, bolus=0))
+            fork_obs, _, _, _ = fork.step(Action(basal=0.02, bolus=0))
+            self.assertEqual(obs, fork_obs)
+        assert_frame_equal(self.env.show_history(), fork.show_history())
+
+    def test_fork_is_independent(self):
+        fork = self.env.fork()
+        fork.step(Action(basal=0.5, bolus=1.0))
+        self.assertEqual(len(self.env.BG_hist), 21)
+        self.assertEqual(self.env.patient.t, 20 * self.env.sample_time)
+        self.assertNotEqual(fork.patient.state[10], self.env.patient.state[10])
+
+    def test_restore(self):
+        snapshot = self.env.snapshot()
+        for _ in range(10):
+            self.env.step(Action(basal=0.01, bolus=0.1))
+        first = self.env.show_history()
+
+        self.env.restore(snapshot)
+        self.assertEqual(len(self.env.BG_hist), 21)
+        self.assertEqual(len(self.env.CHO_hist), 20)
+        for _ in range(10):
+            self.env.step(Action(basal=0.01, bolus=0.1))
+        assert_frame_equal(first, self.env.show_history())
+
+        self.env.reset()
+        with self.assertRaises(ValueError):
+            self.env.restore(snapshot)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+from datetime import datetime, timedelta
+import numpy as np
+from simglucose.simulation.history import History
+from simglucose.analysis.risk import risk_array
+
+
+class TestHistory(unittest.TestCase):
+    def setUp(self):
+        self.start_time = datetime(2018, 1, 1, 6, 0, 0)
+        self.history = History(self.start_time, capacity=4)
+        self.history.append(0, 120.0, 118.0, 0.1, 0.2, 0.3)
+        for i in range(1, 10):
+            self.history.record_action(i, 0.01 * i)
+            self.history.append(3 * i, 120.0 + i, 118.0 + i, 0.1, 0.2, 0.3)
+
+    def test_grows(self):
+        self.assertEqual(len(self.history), 10)
+        self.assertGreaterEqual(self.history.capacity, 10)
+        np.testing.assert_array_equal(self.history.column("BG"), 120.0 + np.arange(10))
+        np.testing.assert_array_equal(self.history.actions("CHO"), np.arange(1, 10))
+
+    def test_frame(self):
+        df = self.history.to_frame()
+        self.assertEqual(list(df.columns), list(History.COLUMNS))
+        self.assertEqual(df.index.name, "Time")
+        self.assertEqual(df.index[-1], self.start_time + timedelta(minutes=27))
+        self.assertTrue(np.isnan(df.CHO.iloc[-1]))
+        self.assertEqual(self.history.times(), list(df.index.to_pydatetime()))
+
+        view = self.history.to_frame(copy=False)
+        self.assertTrue(
+            np.shares_memory(view["BG"].to_numpy(), self.history.column("BG"))
+        )
+        self.assertFalse(np.shares_memory(df["BG"].to_numpy(), self.history.column("BG")))
+
+    def test_truncate_and_copy(self):
+        clone = self.history.copy()
+        self.history.truncate(4)
+        self.assertEqual(len(self.history), 4)
+        self.assertTrue(np.isnan(self.history.column("insulin")[-1]))
+        self.assertEqual(len(clone), 10)
+        self.assertEqual(clone.column("insulin")[3], 0.04)
+
+    def test_discard(self):
+        history = History(self.start_time)
+        for i in range(6):
+            history.append(5 * i, 100.0 + i, 100.0 + i)
+        self.history.discard(4)
+        self.assertEqual(len(self.history), 6)
+        np.testing.assert_array_equal(self.history.minutes, 3 * np.arange(4, 10))
+        np.testing.assert_array_equal(self.history.column("CHO")[:5], np.arange(5, 10))
+        self.assertEqual(self.history.time[0], self.start_time + timedelta(minutes=12))
+
+        # pending risk indices of the dropped rows are not lost
+        history.discard(2)
+        history.append(30, 106.0, 106.0)
+        _, _, ri = risk_array(100.0 + np.arange(2, 7))
+        np.testing.assert_allclose(history.column("Risk"), ri)
+
+
+if __name__ == "__main__":
+    unittest.main()
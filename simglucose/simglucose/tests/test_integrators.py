@@ -0,0 +1,81 @@
+import unittest
+import numpy as np
+import pandas as pd
+from simglucose import registry
+from simglucose.patient.t1dpatient import T1DPatient, Action, PATIENT_PARA_FILE
+from simglucose.patient.batch_t1dpatient import batch_model
+from simglucose.patient.integrators import _model
+from simglucose.patient.parameters import params_to_array, init_state_from_params
+
+NAMES = ["adolescent#001", "adult#005", "child#010"]
+
+
+class TestIntegrators(unittest.TestCase):
+    def test_rk4_matches_dopri5_on_all_patients(self):
+        names = pd.read_csv(PATIENT_PARA_FILE).Name
+        for name in names:
+            reference = T1DPatient.withName(name)
+            fixed = T1DPatient.withName(name, integrator="rk4")
+            basal = reference._params.u2ss * reference._params.BW / 6000
+            for t in range(120):
+                CHO = 50 if t == 10 else 0
+                insulin = basal + (5 if t == 10 else 0)
+                reference.step(Action(CHO=CHO, insulin=insulin))
+                fixed.step(Action(CHO=CHO, insulin=insulin))
+                self.assertAlmostEqual(
+                    fixed.observation.Gsub / reference.observation.Gsub,
+                    1.0,
+                    places=3,
+                    msg=name,
+                )
+            self.assertEqual(fixed.t, reference.t)
+            np.testing.assert_allclose(
+                fixed.state, reference.state.astype(float), rtol=1e-3, atol=1e-6
+            )
+
+    def test_right_hand_sides_agree(self):
+        # T1DPatient.model, batch_model and the RK4 kernel on random states,
+        # some entries negative, with and without food in the stomach
+        rng = np.random.RandomState(0)
+        n = 20
+        params = registry.patients.take(rng.choice(NAMES, n))
+        p = params_to_array(params)
+        x = init_state_from_params(params) * rng.uniform(-0.2, 2.0, (n, 13))
+        CHO = rng.uniform(0, 10, n) * (rng.uniform(size=n) < 0.5)
+        insulin = rng.uniform(0, 0.1, n)
+        last_Qsto = rng.uniform(0, 5e4, n) * (rng.uniform(size=n) < 0.5)
+        last_foodtaken = rng.uniform(0, 60, n) * (rng.uniform(size=n) < 0.5)
+
+        batch = batch_model(0, x, CHO, insulin, p, last_Qsto, last_foodtaken)
+        self.assertEqual(batch.shape, x.shape)
+        for i in range(n):
+            single = T1DPatient.model(
+                0,
+                x[i],
+                Action(CHO=CHO[i], insulin=insulin[i]),
+                p[i],
+                last_Qsto[i],
+                last_foodtaken[i],
+            )
+            kernel = _model(
+                x[i], CHO[i], insulin[i], p[i], last_Qsto[i], last_foodtaken[i]
+            )
+            np.testing.assert_allclose(single, batch[i], rtol=1e-12)
+            np.testing.assert_allclose(kernel, batch[i], rtol=1e-12)
+
+    def test_model_takes_records(self):
+        params = registry.patients.get("adult#005")
+        x = init_state_from_params(params)
+        action = Action(CHO=5.0, insulin=0.05)
+        np.testing.assert_array_equal(
+            T1DPatient.model(0, x, action, params, 1e4, 10.0),
+            T1DPatient.model(0, x, action, params_to_array(params), 1e4, 10.0),
+        )
+
+    def test_unknown_integrator(self):
+        with self.assertRaises(ValueError):
+            T1DPatient.withName("adult#001", integrator="euler")
+
+
+if __name__ == "__main__":
+    unittest.main()
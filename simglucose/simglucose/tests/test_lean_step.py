@@ -0,0 +1,67 @@
+import unittest
+import numpy as np
+from simglucose.simulation.env import LeanObservation
+from simglucose.controller.base import Action
+from env_helpers import make_env
+
+
+class TestLeanStep(unittest.TestCase):
+    def test_same_as_default(self):
+        ref = make_env(integrator="rk4")
+        lean = make_env(integrator="rk4", lean=True)
+        self.assertEqual(ref.reset().observation.CGM,
+                         lean.reset().observation.CGM)
+        for i in range(200):
+            action = Action(basal=0.015, bolus=0.5 if i % 60 == 10 else 0)
+            r = ref.step(action)
+            s = lean.step(action)
+            self.assertEqual(s.observation.CGM, r.observation.CGM)
+            self.assertEqual(s.reward, r.reward)
+            self.assertEqual(s.done, r.done)
+            for key in ("sample_time", "patient_name", "meal", "time", "bg"):
+                self.assertEqual(s.info[key], r.info[key])
+            for key in ("lbgi", "hbgi", "risk"):
+                self.assertAlmostEqual(s.info[key], r.info[key], places=9)
+            np.testing.assert_array_equal(s.info["patient_state"],
+                                          r.info["patient_state"])
+        self.assertEqual(set(s.info), set(r.info))
+
+        ref_hist, lean_hist = ref.show_history(), lean.show_history()
+        self.assertTrue(ref_hist.index.equals(lean_hist.index))
+        np.testing.assert_allclose(lean_hist.values, ref_hist.values,
+                                   rtol=1e-12, atol=1e-12)
+
+    def test_observation_updated_in_place(self):
+        env = make_env(integrator="rk4", lean=True)
+        obs = env.reset().observation
+        step = env.step(Action(basal=0.015, bolus=0))
+        self.assertIs(step.observation, obs)
+        self.assertEqual(obs.CGM, env.CGM_hist[-1])
+        self.assertEqual(obs.array[0], obs.CGM)
+        self.assertEqual(LeanObservation.FIELDS, ("CGM",))
+
+    def test_info_reused(self):
+        env = make_env(integrator="rk4", lean=True)
+        info = env.reset().info
+        step = env.step(Action(basal=0.015, bolus=0))
+        self.assertIs(step.info, info)
+        self.assertEqual(info["bg"], env.BG_hist[-1])
+        # patient_state is a copy, not the solver array
+        state = info["patient_state"]
+        np.testing.assert_array_equal(state, env.patient.state)
+        self.assertIsNot(state, env.patient.state)
+        env.step(Action(basal=0.015, bolus=0))
+        self.assertFalse(np.array_equal(state, env.patient.state))
+
+    def test_fork_has_own_observation(self):
+        env = make_env(integrator="rk4", lean=True)
+        obs = env.reset().observation
+        CGM = obs.CGM
+        clone = env.fork()
+        step = clone.step(Action(basal=0.015, bolus=0))
+        self.assertIsNot(step.observation, obs)
+        self.assertEqual(obs.CGM, CGM)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+import numpy as np
+from simglucose.controller.base import Action
+from env_helpers import make_env
+
+
+def run(env, n_steps=300):
+    env.reset()
+    for i in range(n_steps):
+        bolus = 0.5 if i % 60 == 10 else 0
+        env.step(Action(basal=0.015, bolus=bolus))
+    return env.show_history()
+
+
+class TestMacroStep(unittest.TestCase):
+    def test_rk4_matches_per_minute(self):
+        ref = run(make_env(integrator="rk4"))
+        macro = run(make_env(integrator="rk4", macro_step=True))
+        np.testing.assert_allclose(macro.values, ref.values, rtol=1e-12)
+
+    def test_dopri5_matches_per_minute(self):
+        ref = run(make_env())
+        macro = run(make_env(macro_step=True))
+        np.testing.assert_array_equal(macro.CHO, ref.CHO)
+        np.testing.assert_array_equal(macro.insulin, ref.insulin)
+        np.testing.assert_allclose(macro.BG, ref.BG, rtol=1e-4)
+        np.testing.assert_allclose(macro.CGM, ref.CGM, rtol=1e-4)
+
+
+if __name__ == "__main__":
+    unittest.main()
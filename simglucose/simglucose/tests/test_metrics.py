@@ -0,0 +1,72 @@
+import unittest
+import os
+import numpy as np
+import pandas as pd
+from simglucose.analysis.metrics import (GlycemicMetrics, cvga_zone,
+                                         percent_time_in_range,
+                                         risk_per_window)
+from simglucose.analysis.report import report
+
+TESTDATA_FILENAME = os.path.join(os.path.dirname(__file__), 'sim_results.csv')
+
+
+def reference_risk_trace(BG, step_size):
+    # the per-chunk computation report.risk_index_trace used to do
+    chunks = [BG.iloc[i:i + step_size] for i in range(0, len(BG), step_size)]
+    if len(chunks[-1]) != step_size:
+        chunks.pop()
+    fBG = [1.509 * (np.log(c[c > 0])**1.084 - 5.381) for c in chunks]
+    LBGI = pd.concat([(10 * (f * (f < 0))**2).mean() for f in fBG], axis=1)
+    HBGI = pd.concat([(10 * (f * (f > 0))**2).mean() for f in fBG], axis=1)
+    return LBGI.values.T, HBGI.values.T
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        df = pd.read_csv(TESTDATA_FILENAME, index_col=0)
+        rng = np.random.RandomState(0)
+        # an ensemble of noisy copies of the test run
+        BG = df.BG.values[:, np.newaxis] * rng.uniform(0.5, 1.5, (1, 20))
+        BG[5, 3] = -1.0
+        self.BG = pd.DataFrame(BG, columns=['run%d' % i for i in range(20)])
+
+    def test_percent_time_in_range(self):
+        percent = percent_time_in_range(self.BG)
+        BG = self.BG
+        np.testing.assert_allclose(
+            percent[:, 0], ((BG >= 70) & (BG <= 180)).sum() / len(BG) * 100)
+        np.testing.assert_allclose(percent[:, 2],
+                                   (BG < 70).sum() / len(BG) * 100)
+        np.testing.assert_allclose(percent[:, 4],
+                                   (BG < 50).sum() / len(BG) * 100)
+
+    def test_risk_per_window(self):
+        LBGI, HBGI, RI = risk_per_window(self.BG, sample_time=3)
+        ref_LBGI, ref_HBGI = reference_risk_trace(self.BG, 20)
+        self.assertEqual(LBGI.shape, (48, 20))
+        np.testing.assert_allclose(LBGI, ref_LBGI, atol=1e-12)
+        np.testing.assert_allclose(HBGI, ref_HBGI, atol=1e-12)
+        np.testing.assert_allclose(RI, ref_LBGI + ref_HBGI, atol=1e-12)
+
+    def test_cvga_zone(self):
+        zones = cvga_zone(np.array([100, 80, 60, 60, 100, 120]),
+                          np.array([150, 250, 150, 350, 350, 150]))
+        self.assertEqual(list(zones), ['A', 'B', 'C', 'E', 'C', ''])
+
+    def test_report_without_plots(self):
+        df = pd.concat([self.BG[c].to_frame('BG') for c in self.BG],
+                       keys=list(self.BG.columns))
+        results, ri_per_hour, zone_stats, figs, axes = report(df, plot=False)
+        self.assertEqual(figs, [])
+        metrics = GlycemicMetrics(self.BG)
+        self.assertEqual(list(results.columns),
+                         ['70<=BG<=180', 'BG>180', 'BG<70', 'BG>250', 'BG<50',
+                          'LBGI', 'HBGI', 'Risk Index'])
+        np.testing.assert_allclose(results.LBGI,
+                                   ri_per_hour.loc['LBGI'].mean(axis=1))
+        self.assertAlmostEqual(zone_stats.values.sum(),
+                               (metrics.zones != '').mean())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+import numpy as np
+from simglucose import registry
+from simglucose.sensor.cgm import CGMSensor
+from simglucose.sensor.noise_gen import CGMNoise, cgm_noise
+
+
+class TestCGMNoise(unittest.TestCase):
+    def test_bulk_matches_iterator(self):
+        params = registry.sensors.get("Dexcom")
+        n = 3 * CGMNoise.BLOCK * 30 + 7  # spans several blocks
+        noise = CGMNoise(params, seed=5)
+        expected = np.array([next(noise) for _ in range(n)])
+        np.testing.assert_array_equal(cgm_noise(params, n, seed=5), expected)
+
+    def test_generate_continues_iterator(self):
+        params = registry.sensors.get("Navigator")
+        noise = CGMNoise(params, seed=2)
+        head = [next(noise) for _ in range(10)]
+        tail = noise.generate(2000)
+        np.testing.assert_array_equal(
+            np.concatenate([head, tail]), cgm_noise(params, 2010, seed=2)
+        )
+        self.assertEqual(noise.count, 2010)
+
+    def test_length_limit(self):
+        params = registry.sensors.get("Dexcom")
+        noise = CGMNoise(params, n=5, seed=1)
+        self.assertEqual(len(noise.generate(10)), 5)
+        with self.assertRaises(StopIteration):
+            next(noise)
+
+
+class TestCGMSensor(unittest.TestCase):
+    def test_measure_reads_episode_noise(self):
+        sensor = CGMSensor.withName("Dexcom", seed=3)
+        n = 2 * int(sensor.NOISE_MINUTES // sensor.sample_time) + 5
+        times = np.arange(n) * sensor.sample_time
+        CGM = [sensor.measure_at(t, 150.0) for t in times]
+        np.testing.assert_array_equal(
+            CGM, 150.0 + cgm_noise(sensor._params, n, seed=3))
+        self.assertEqual(sensor._noise_pos, 5)
+
+    def test_restore_mid_block(self):
+        sensor = CGMSensor.withName("Dexcom", seed=3)
+        for t in range(0, 30, 3):
+            sensor.measure_at(t, 150.0)
+        snapshot = sensor.snapshot()
+        expected = [sensor.measure_at(t, 150.0) for t in range(30, 60, 3)]
+        sensor.restore(snapshot)
+        self.assertEqual(
+            [sensor.measure_at(t, 150.0) for t in range(30, 60, 3)], expected)
+        sensor.reset()
+        self.assertEqual(sensor.measure_at(0, 150.0),
+                         150.0 + cgm_noise(sensor._params, 1, seed=3)[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
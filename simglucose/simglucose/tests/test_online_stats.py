@@ -0,0 +1,100 @@
+import unittest
+import pickle
+from datetime import timedelta
+import numpy as np
+from simglucose.analysis.online import GlucoseStats
+from simglucose.analysis.risk import risk_array
+from simglucose.analysis.metrics import percent_time_in_range
+from simglucose.simulation.sim_engine import SimObj, SimConfig, build_env
+from simglucose.controller.basal_bolus_ctrller import BBController
+from simglucose.controller.base import Action
+
+
+class TestGlucoseStats(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.BG = np.concatenate([rng.uniform(30, 450, 995),
+                                  [50, 54, 70, 180, 250]])
+
+    def check(self, stats, BG):
+        self.assertEqual(stats.n, len(BG))
+        self.assertAlmostEqual(stats.mean, BG.mean())
+        self.assertAlmostEqual(stats.CV, BG.std() / BG.mean() * 100)
+        self.assertAlmostEqual(stats.GMI, 3.31 + 0.02392 * BG.mean())
+        # the ranges of report.percent_stats
+        TIR, TAR, TBR, above_250, below_50 = percent_time_in_range(BG)[0]
+        self.assertAlmostEqual(stats.TIR, TIR)
+        self.assertAlmostEqual(stats.TAR, TAR)
+        self.assertAlmostEqual(stats.TBR, TBR)
+        self.assertAlmostEqual(stats.percent()['BG>250'], above_250)
+        self.assertAlmostEqual(stats.percent()['BG<50'], below_50)
+        rl, rh, ri = risk_array(BG)
+        self.assertAlmostEqual(stats.LBGI, rl.mean())
+        self.assertAlmostEqual(stats.HBGI, rh.mean())
+        self.assertAlmostEqual(stats.risk, ri.mean())
+        self.assertEqual((stats.min, stats.max), (BG.min(), BG.max()))
+
+    def test_update(self):
+        stats = GlucoseStats()
+        for bg in self.BG:
+            stats.update(bg)
+        self.check(stats, self.BG)
+        self.check(GlucoseStats().update_many(self.BG), self.BG)
+
+    def test_merge(self):
+        parts = [GlucoseStats().update_many(self.BG[i:i + 300])
+                 for i in range(0, len(self.BG), 300)]
+        parts[1] = pickle.loads(pickle.dumps(parts[1]))
+        self.check(GlucoseStats.combine(parts), self.BG)
+        self.check(parts[0] + parts[1], self.BG[:600])
+        self.assertTrue(np.isnan(GlucoseStats().TIR))
+
+    def test_deferred_risk(self):
+        stats = GlucoseStats().update_many(self.BG[:500])
+        for bg in self.BG[500:]:
+            stats.update_bg(bg)
+        self.assertEqual(stats.risk_pending, 500)
+        rl, rh, _ = risk_array(self.BG[:500])
+        self.assertAlmostEqual(stats.LBGI, rl.mean())
+        rl, rh, _ = risk_array(self.BG[500:])
+        stats.add_risk(rl, rh)
+        self.check(stats, self.BG)
+
+    def test_env(self):
+        env = build_env(SimConfig('adolescent#001'), (1, 1, 1))
+        sim = SimObj(env, BBController(), timedelta(hours=6), animate=False)
+        sim.simulate()
+        self.check(env.glucose_stats, env.BG_hist)
+
+        snapshot = env.snapshot()
+        n = env.glucose_stats.n
+        env.step(Action(basal=0.01, bolus=0))
+        self.assertEqual(env.glucose_stats.n, n + 1)
+        env.restore(snapshot)
+        self.check(env.glucose_stats, env.BG_hist)
+
+    def test_lean_env(self):
+        env = build_env(SimConfig('adolescent#001'), (1, 1, 1))
+        env.lean = True
+        env.reset()
+        for _ in range(20):
+            env.step(Action(basal=0.01, bolus=0))
+        # the risk is computed with the history's, not at every step
+        self.assertEqual(env._glucose_stats.risk_pending, 20)
+        snapshot = env.snapshot()
+        fork = env.fork()
+        self.check(env.glucose_stats, env.BG_hist)
+        self.assertEqual(env._glucose_stats.risk_pending, 0)
+        for _ in range(10):
+            env.step(Action(basal=0.02, bolus=0))
+            fork.step(Action(basal=0.03, bolus=0))
+        self.check(fork.glucose_stats, fork.BG_hist)
+        env.restore(snapshot)
+        self.check(env.glucose_stats, env.BG_hist)
+        env.step(Action(basal=0.02, bolus=0))
+        env.restore(snapshot)
+        self.check(env.glucose_stats, env.BG_hist)
+
+
+if __name__ == '__main__':
+    unittest.main()
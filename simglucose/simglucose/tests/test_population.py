@@ -0,0 +1,59 @@
+import unittest
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from simglucose.simulation.population import (PopulationRun, population_sim,
+                                              run_summary)
+from simglucose.simulation.sim_engine import SimObj, SimConfig, build_env
+from simglucose.simulation.scenario import CustomScenario
+from simglucose.controller.basal_bolus_ctrller import BBController
+
+SIM_TIME = timedelta(hours=6)
+PATIENTS = ['adolescent#001', 'child#002']
+SEEDS = [1, 2]
+
+
+class TestPopulationSim(unittest.TestCase):
+    def test_grid(self):
+        scenario = CustomScenario(datetime(2018, 1, 1, 6), [(7, 45)])
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        summary_path = os.path.join(path, 'summary.csv')
+        keep = PopulationRun('child#002', 2, 1)
+        serial = population_sim(BBController, PATIENTS, SEEDS, SIM_TIME,
+                                scenarios=[None, scenario], traces=[keep],
+                                parallel=False, summary_path=summary_path)
+        parallel = population_sim(BBController, PATIENTS, SEEDS, SIM_TIME,
+                                  scenarios=[None, scenario],
+                                  traces=lambda run: run.seed == 1,
+                                  max_workers=2, chunksize=1)
+        self.assertEqual(len(serial), 8)
+        self.assertEqual(list(serial.summary.patient_name),
+                         ['adolescent#001'] * 4 + ['child#002'] * 4)
+        pd.testing.assert_frame_equal(serial.summary, parallel.summary)
+        self.assertEqual(serial.stats.runs, 8)
+        self.assertEqual(list(serial.traces), [keep])
+        self.assertEqual(len(parallel.traces), 4)
+
+        # the summary was streamed to the CSV file
+        written = pd.read_csv(summary_path, keep_default_na=False)
+        np.testing.assert_allclose(written.TIR, serial.summary.TIR)
+
+        # a run equals SimObj with its seed
+        env = build_env(SimConfig('child#002', scenario=scenario), (2, 2, 2))
+        SimObj(env, BBController(), SIM_TIME, animate=False).simulate()
+        ref = env.show_history()
+        self.assertTrue(serial.traces[keep].equals(ref))
+        row = serial.summary.iloc[-1]
+        expected = run_summary(ref.BG.values)
+        self.assertEqual(row.steps, 72)
+        self.assertAlmostEqual(row.TIR, expected['TIR'])
+        self.assertAlmostEqual(row.LBGI, ref.LBGI.mean())
+        self.assertEqual(row.CVGA_zone, expected['CVGA_zone'])
+
+
+if __name__ == '__main__':
+    unittest.main()
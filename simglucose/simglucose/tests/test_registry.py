@@ -0,0 +1,42 @@
+import unittest
+import pickle
+import pandas as pd
+from simglucose import registry
+from simglucose.patient.t1dpatient import T1DPatient
+from simglucose.sensor.cgm import CGMSensor
+from simglucose.actuator.pump import InsulinPump
+
+
+class TestRegistry(unittest.TestCase):
+    def test_records_match_csv(self):
+        df = pd.read_csv(registry.PATIENT_PARA_FILE)
+        self.assertEqual(registry.patients.names, tuple(df.Name))
+        record = registry.patients.get("adult#004")
+        row = df.loc[df.Name == "adult#004"].squeeze()
+        for column in df.columns:
+            self.assertEqual(record[column], row[column])
+        self.assertEqual(registry.patients.get_id(14).Name, "adult#004")
+
+    def test_parsed_once_and_read_only(self):
+        records = registry.sensors.records
+        CGMSensor.withName("Dexcom")
+        CGMSensor.withName("GuardianRT")
+        self.assertIs(registry.sensors.records, records)
+        with self.assertRaises(ValueError):
+            records[0]["PACF"] = 0
+
+    def test_unknown_name(self):
+        with self.assertRaises(KeyError):
+            InsulinPump.withName("NoSuchPump")
+        with self.assertRaises(KeyError):
+            T1DPatient.withID(31)
+
+    def test_params_are_picklable(self):
+        params = registry.patients.get("child#001")
+        clone = pickle.loads(pickle.dumps(params))
+        self.assertEqual(clone.Name, "child#001")
+        self.assertEqual(clone.BW, params.BW)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,16 @@
-from simglucose.simulation.rendering import Viewer
+from simglucose.simulation.rendering import Viewer, BlitViewer
+from simglucose.simulation import rendering
+from simglucose.simulation.env import T1DSimEnv
+from simglucose.simulation.scenario_gen import RandomScenario
+from simglucose.controller.base import Action
+from simglucose.sensor.cgm import CGMSensor
+from simglucose.actuator.pump import InsulinPump
+from simglucose.patient.t1dpatient import T1DPatient
 from datetime import datetime
+from unittest import mock
 import pandas as pd
+import numpy as np
+import tempfile
 import unittest
 import logging
 import os
@@ -22,6 +32,96 @@ class TestRendering(unittest.TestCase):
             viewer.render(df_tmp)
         viewer.close()
 
+    def test_blit_rendering(self):
+        start_time = datetime(2018, 1, 1, 0, 0, 0)
+        viewer = BlitViewer(start_time, 'adolescent#001')
+        minutes = (self.df.index - start_time) / pd.Timedelta(minutes=1)
+        for i in range(0, len(self.df), 50):
+            rows = slice(max(i - 1, 0), i + 50)
+            viewer.extend(max(i - 1, 0), minutes[rows],
+                          {name: self.df[name].values[rows]
+                           for name in BlitViewer.COLUMNS})
+            viewer.draw()
+        np.testing.assert_array_equal(viewer.lines[0].get_ydata(),
+                                      self.df['BG'].values)
+        self.assertGreaterEqual(viewer.axes[0].get_ylim()[1],
+                                self.df['BG'].max())
+        viewer.close()
+
+    def test_blit_resent_row(self):
+        # a re-sent row that changed must not leave its old segment behind
+        start_time = datetime(2018, 1, 1, 0, 0, 0)
+        # past the initial x limits, so that the first draw saves new
+        # backgrounds
+        minutes = np.arange(0, 200, 3.0)
+        columns = {name: self.df[name].values[:len(minutes)]
+                   for name in BlitViewer.COLUMNS}
+        viewer = BlitViewer(start_time, 'adolescent#001', headless=True)
+        changed = dict(columns, CHO=columns['CHO'].copy())
+        changed['CHO'][-1] += 10
+        viewer.extend(0, minutes, changed)
+        viewer.draw()
+        viewer.extend(len(minutes) - 1, minutes[-1:],
+                      {name: values[-1:] for name, values in columns.items()})
+        viewer.draw()
+        reference = BlitViewer(start_time, 'adolescent#001', headless=True)
+        reference.extend(0, minutes, columns)
+        reference.draw()
+        np.testing.assert_array_equal(
+            np.asarray(viewer.fig.canvas.buffer_rgba()),
+            np.asarray(reference.fig.canvas.buffer_rgba()))
+        viewer.close()
+        reference.close()
+
+    def test_render_without_fork(self):
+        # where fork is not the default the window is drawn in this process
+        patient = T1DPatient.withName('adolescent#001', integrator='rk4')
+        sensor = CGMSensor.withName('Dexcom', seed=1)
+        pump = InsulinPump.withName('Insulet')
+        scenario = RandomScenario(start_time=datetime(2018, 1, 1), seed=1)
+        env = T1DSimEnv(patient, sensor, pump, scenario)
+        env.reset()
+        with mock.patch.object(rendering, '_default_start_method',
+                               return_value='spawn'):
+            for _ in range(20):
+                env.render(fps=1000)
+                env.step(Action(basal=0.02, bolus=0))
+            viewer = env.viewer
+            # a figure left stale, e.g. by a change to an artist that is not
+            # animated, must not be fully redrawn over the blitted lines
+            viewer._viewer.fig.stale = True
+            viewer._last_sent = -np.inf
+            env.render()
+            self.assertIsNone(viewer._worker)
+            np.testing.assert_array_equal(
+                viewer._viewer.lines[0].get_ydata(), env.BG_hist)
+            # the lines are still on the canvas after render()
+            canvas = viewer._viewer.fig.canvas
+            frame = np.array(canvas.buffer_rgba())
+            for background in viewer._viewer._backgrounds:
+                canvas.restore_region(background)
+            self.assertFalse(np.array_equal(
+                frame, np.asarray(canvas.buffer_rgba())))
+            env.render(close=True)
+        self.assertIsNone(viewer._viewer)
+
+    def test_headless_animation(self):
+        patient = T1DPatient.withName('adolescent#001', integrator='rk4')
+        sensor = CGMSensor.withName('Dexcom', seed=1)
+        pump = InsulinPump.withName('Insulet')
+        scenario = RandomScenario(start_time=datetime(2018, 1, 1), seed=1)
+        env = T1DSimEnv(patient, sensor, pump, scenario)
+        env.reset()
+        with tempfile.TemporaryDirectory() as output:
+            for _ in range(100):
+                env.render(fps=1000, output=output)
+                env.step(Action(basal=0.02, bolus=0))
+            env.render()
+            env.render(close=True)
+            frames = sorted(os.listdir(output))
+            self.assertGreater(len(frames), 1)
+            self.assertEqual(frames[0], 'frame_00000.png')
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,8 +1,13 @@
-from simglucose.analysis.report import risk_index_trace
+from simglucose.analysis.report import (risk_index_trace, ensemble_BG,
+                                        report, FIGURES)
+from matplotlib.collections import LineCollection
 from simglucose.sensor.cgm import CGMSensor
 from simglucose.simulation.rendering import Viewer
 from datetime import datetime
 import pandas as pd
+import numpy as np
+import shutil
+import tempfile
 import unittest
 import logging
 import os
@@ -36,6 +41,30 @@ class TestReport(unittest.TestCase):
         self.assertEqual(round(RI.iloc[-1].test,3), 0.843)
         self.assertEqual(round(RI.iloc[0].test,3), 2.755)
 
+    def ensemble(self, n):
+        df = self.df.droplevel(0)
+        return pd.concat([df] * n, keys=['run%d' % i for i in range(n)])
+
+    def test_ensemble_BG(self):
+        BG = self.ensemble(50).unstack(level=0).BG
+        ax = ensemble_BG(BG)
+        curves = [c for c in ax.collections if isinstance(c, LineCollection)]
+        self.assertEqual(len(curves), 1)
+        self.assertEqual(len(curves[0].get_segments()), 50)
+        np.testing.assert_allclose(curves[0].get_segments()[3][:, 1],
+                                   BG['run3'].values)
+
+    def test_parallel_figures(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        df = self.ensemble(3)
+        results, _, zone_stats, figs, axes = report(df, save_path=path,
+                                                    parallel=True)
+        self.assertEqual(figs, [])
+        self.assertEqual(len(results), 3)
+        for name in FIGURES + ('performance_stats.csv', 'CVGA_stats.csv'):
+            self.assertGreater(os.path.getsize(os.path.join(path, name)), 0)
+
 
 if __name__ == '__main__':
     unittest.main()
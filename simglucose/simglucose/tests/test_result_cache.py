@@ -0,0 +1,188 @@
+import unittest
+import functools
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+import numpy as np
+from simglucose.simulation import sim_engine
+from simglucose.simulation.sim_engine import (SimObj, SimConfig,
+                                              batch_simulate, BatchResults)
+from simglucose.simulation.result_cache import (ResultCache, simulation_key,
+                                                MANIFEST)
+from simglucose.simulation.scenario import Scenario, Action
+from simglucose.controller.basal_bolus_ctrller import BBController
+from simglucose.controller.pid_ctrller import PIDController
+import env_helpers
+
+SIM_TIME = timedelta(hours=4)
+
+
+class SeededScenario(Scenario):
+    """A Scenario subclass with its own seed and meal state"""
+
+    def __init__(self, start_time, seed):
+        Scenario.__init__(self, start_time)
+        self.seed = seed
+        self.reset()
+
+    def reset(self):
+        self.scenario = np.random.RandomState(self.seed).uniform(20, 80, 3)
+
+    def get_action(self, t):
+        minutes = (t - self.start_time).total_seconds() / 60
+        if minutes in (60, 300, 600):
+            return Action(meal=self.scenario[int(minutes) // 300])
+        return Action(meal=0)
+
+
+class UnkeyableScenario(SeededScenario):
+    def __init__(self, start_time, seed, rng):
+        self.generator = rng
+        SeededScenario.__init__(self, start_time, seed)
+
+
+make_env = functools.partial(env_helpers.make_env, integrator='rk4')
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_key(self):
+        key = simulation_key(make_env(), BBController(), SIM_TIME)
+        self.assertEqual(key,
+                         simulation_key(make_env(), BBController(), SIM_TIME))
+        for other in [
+            simulation_key(make_env(sensor_seed=2), BBController(), SIM_TIME),
+            simulation_key(make_env(scenario_seed=2), BBController(),
+                           SIM_TIME),
+            simulation_key(make_env(), BBController(target=120), SIM_TIME),
+            simulation_key(make_env(), BBController(), 2 * SIM_TIME),
+        ]:
+            self.assertNotEqual(key, other)
+
+    def test_scenario_key(self):
+        start_time = datetime(2018, 1, 1, 6)
+
+        def key(scenario):
+            env = make_env()
+            env.scenario = scenario
+            return simulation_key(env, BBController(), SIM_TIME)
+
+        self.assertEqual(key(SeededScenario(start_time, 1)),
+                         key(SeededScenario(start_time, 1)))
+        self.assertNotEqual(key(SeededScenario(start_time, 1)),
+                            key(SeededScenario(start_time, 2)))
+        # the position of the scenario is not part of the key
+        moved = SeededScenario(start_time, 1)
+        moved.scenario = moved.scenario * 2
+        self.assertEqual(key(moved), key(SeededScenario(start_time, 1)))
+        with self.assertRaises(TypeError):
+            key(UnkeyableScenario(start_time, 1, np.random.RandomState(1)))
+
+        # the runs of two seeds are cached apart
+        cache = ResultCache(self.path)
+        for seed in (1, 2):
+            env = make_env()
+            env.scenario = SeededScenario(start_time, seed)
+            sim = SimObj(env, BBController(), SIM_TIME, animate=False,
+                         cache=cache)
+            sim.simulate()
+            self.assertEqual(sim.stats.cached, 0)
+        self.assertEqual(len(cache.entries()), 2)
+
+    def test_key_settings(self):
+        # settings without a stable canonical form are refused
+        controller = BBController()
+        controller.model = object()
+        with self.assertRaises(TypeError):
+            simulation_key(make_env(), controller, SIM_TIME)
+        controller._model = controller.model
+        del controller.model
+        self.assertEqual(simulation_key(make_env(), controller, SIM_TIME),
+                         simulation_key(make_env(), BBController(), SIM_TIME))
+
+    def test_rerun_stateful_controller(self):
+        # the key is taken after reset, not from the state of the last run
+        cache = ResultCache(self.path)
+        controller = PIDController(P=0.001, I=0.00001, target=140)
+        s1 = SimObj(make_env(), controller, SIM_TIME, animate=False,
+                    cache=cache)
+        s1.simulate()
+        self.assertNotEqual(controller.integrated_state, 0)
+        s2 = SimObj(make_env(), controller, SIM_TIME, animate=False,
+                    cache=cache)
+        s2.simulate()
+        self.assertEqual(s2.stats.cached, 1)
+        self.assertEqual(len(cache.entries()), 1)
+
+    def test_hit_skips_simulation(self):
+        cache = ResultCache(self.path)
+        s1 = SimObj(make_env(), BBController(), SIM_TIME, animate=False,
+                    cache=cache)
+        s1.simulate()
+        ref = s1.results()
+        self.assertEqual(len(cache.entries()), 1)
+
+        s2 = SimObj(make_env(), BBController(), SIM_TIME, animate=False,
+                    cache=ResultCache(self.path))
+        s2.simulate()
+        self.assertEqual(len(s2.env.history), 1)  # not simulated
+        df = s2.results()
+        self.assertTrue(df.index.equals(ref.index))
+        np.testing.assert_array_equal(df.values, ref.values)
+        self.assertEqual(list(df.columns), list(ref.columns))
+
+    def test_interrupted_manifest(self):
+        cache = ResultCache(self.path)
+        SimObj(make_env(), BBController(), SIM_TIME, animate=False,
+               cache=cache).simulate()
+        key = next(iter(cache.entries()))
+        with open(os.path.join(self.path, MANIFEST), 'a') as f:
+            f.write('{"key": "cut sh')
+        cache = ResultCache(self.path)
+        self.assertEqual(list(cache.entries()), [key])
+        self.assertIn(key, cache)
+        # a data file without its manifest line is not a hit
+        os.rename(os.path.join(self.path, key + '.npz'),
+                  os.path.join(self.path, 'other.npz'))
+        self.assertIsNone(cache.get('other'))
+        self.assertIsNone(cache.get(key))
+
+    def test_batch_resume(self):
+        configs = [SimConfig('adolescent#001'), SimConfig('child#002')]
+        first = batch_simulate(configs[:1], SIM_TIME, seed=0, parallel=False,
+                               cache_dir=self.path)
+        both = batch_simulate(configs, SIM_TIME, seed=0, parallel=False,
+                              cache_dir=self.path)
+        self.assertEqual(len(ResultCache(self.path).entries()), 2)
+        np.testing.assert_array_equal(both.data[:1], first.data)
+        again = batch_simulate(configs, SIM_TIME, seed=0, parallel=False,
+                               cache_dir=self.path)
+        self.assertEqual(len(ResultCache(self.path).entries()), 2)
+        np.testing.assert_array_equal(again.data, both.data)
+        uncached = batch_simulate(configs, SIM_TIME, seed=0, parallel=False)
+        np.testing.assert_array_equal(uncached.data, both.data)
+
+    def test_worker_hit(self):
+        # a run stored by another batch after the parent checked the cache
+        config = SimConfig('adolescent#001')
+        ref = batch_simulate([config], SIM_TIME, seed=0, parallel=False,
+                             cache_dir=self.path)
+        seeds = [int(s) for s in ref.seeds[0]]
+        data = np.full_like(ref.data, np.nan)
+        self.addCleanup(sim_engine._worker_results.clear)
+        sim_engine._worker_results['data'] = data
+        i, stats = sim_engine._run_task(
+            (0, config, seeds, SIM_TIME, self.path, None, False))
+        self.assertEqual(stats.cached, 1)
+        np.testing.assert_array_equal(data, ref.data)
+        self.assertEqual(data.shape[2], len(BatchResults.COLUMNS))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+import numpy as np
+from simglucose.analysis.risk import risk_index, risk_array
+
+
+def reference_risk(BG):
+    # the scalar formula risk_index used to apply element by element
+    if BG <= 20.0:
+        return (100.0, 0.0, 100.0)
+    if BG >= 600.0:
+        return (0.0, 100.0, 100.0)
+    U = 1.509 * (np.log(BG) ** 1.084 - 5.381)
+    ri = 10 * U**2
+    return (ri if U <= 0 else 0.0, ri if U >= 0 else 0.0, ri)
+
+
+class TestRiskIndex(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.BG = np.concatenate(
+            [rng.uniform(5, 700, 5000), [20.0, 600.0, 112.5, 112.52]]
+        )
+        self.expected = np.array([reference_risk(bg) for bg in self.BG]).T
+
+    def test_array_matches_scalar_formula(self):
+        np.testing.assert_allclose(risk_array(self.BG), self.expected, rtol=0, atol=1e-9)
+
+    def test_risk_index(self):
+        for horizon in (1, 20, len(self.BG)):
+            expected = self.expected[:, -horizon:].mean(axis=1)
+            np.testing.assert_allclose(
+                risk_index(list(self.BG), horizon), expected, rtol=0, atol=1e-9
+            )
+
+    def test_batch(self):
+        BG = self.BG[:5000].reshape(500, 10)
+        LBGI, HBGI, RI = risk_index(BG, 12)
+        self.assertEqual(RI.shape, (10,))
+        for j in range(10):
+            np.testing.assert_allclose(
+                (LBGI[j], HBGI[j], RI[j]), risk_index(list(BG[:, j]), 12), atol=1e-12
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+from datetime import datetime, timedelta
+import numpy as np
+from simglucose.simulation.scenario_gen import (
+    RandomScenario,
+    RandomScenarioBank,
+    scenario_from_meals,
+)
+
+
+def meals(scenario, n_days):
+    start = scenario.start_time
+    return [
+        scenario.get_action(start + timedelta(minutes=i)).meal
+        for i in range(n_days * 1440)
+    ]
+
+
+class TestRandomScenarioBank(unittest.TestCase):
+    def test_matches_random_stream(self):
+        seeds = [0, 3, 11]
+        bank = RandomScenarioBank(seeds, n_days=20)
+        self.assertEqual(bank.meals.shape, (3, 20, 6))
+        for i, seed in enumerate(seeds):
+            scenario = RandomScenario(datetime(2018, 1, 1), seed=seed)
+            scenario.random_gen = np.random.RandomState(seed)
+            for day in range(20):
+                self.assertEqual(
+                    scenario_from_meals(bank.meals[i, day]), scenario.create_scenario()
+                )
+
+    def test_bank_scenario_matches_scenario(self):
+        start_time = datetime(2018, 1, 1, 6, 0, 0)
+        bank = RandomScenarioBank([5, 6], n_days=2)
+        for i, seed in enumerate(bank.seeds):
+            expected = meals(RandomScenario(start_time, seed=seed), 4)
+            # the last days are past the bank
+            self.assertEqual(meals(bank.scenario(i, start_time), 4), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+from datetime import datetime, timedelta
+import numpy as np
+from simglucose.controller.base import Action
+from simglucose.patient.t1dpatient import T1DPatient
+from simglucose.simulation.scenario import CustomScenario
+from env_helpers import make_env
+
+
+def schedule_env():
+    start_time = datetime(2018, 1, 1, 0, 0, 0)
+    scenario = CustomScenario(start_time=start_time, scenario=[(1, 50), (7.5, 30)])
+    return make_env("adult#003", scenario=scenario)
+
+
+class TestSimulateSchedule(unittest.TestCase):
+    def test_matches_stepping(self):
+        actions = [(0, Action(basal=0.012, bolus=0)), (6, Action(basal=0.02, bolus=0))]
+        sim_time = timedelta(hours=10)
+
+        ref = schedule_env()
+        ref.reset()
+        n_steps = int(sim_time.total_seconds() / 60 / ref.sample_time)
+        BG = []
+        for k in range(n_steps):
+            action = actions[0][1] if ref.time < datetime(2018, 1, 1, 6) else actions[1][1]
+            ref.step(action)
+            BG.append(ref.patient.observation.Gsub)
+
+        env = schedule_env()
+        env.reset()
+        env.simulate_schedule(actions, sim_time)
+        self.assertEqual(env.time, ref.time)
+        self.assertEqual(env.time_hist, ref.time_hist)
+        np.testing.assert_allclose(env.CHO_hist, ref.CHO_hist)
+        np.testing.assert_allclose(env.insulin_hist, ref.insulin_hist)
+        np.testing.assert_allclose(env.BG_hist[1:], BG, rtol=1e-4)
+        np.testing.assert_allclose(
+            env.patient.state, ref.patient.state, rtol=1e-4, atol=1e-6
+        )
+
+    def test_schedule_must_start_now(self):
+        patient = T1DPatient.withName("adult#003")
+        with self.assertRaises(ValueError):
+            patient.simulate_schedule([(5, None)], 10, [10])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+import pickle
+import shutil
+import tempfile
+from datetime import timedelta
+import numpy as np
+from simglucose.simulation.sim_engine import (SimObj, SimConfig, batch_sim,
+                                              batch_simulate, build_env)
+from simglucose.simulation.stats import SimStats
+from simglucose.controller.basal_bolus_ctrller import BBController
+
+SIM_TIME = timedelta(hours=6)
+
+
+def make_sim(seed=1, profile=True, path=None):
+    env = build_env(SimConfig('adolescent#001'), (seed, seed, seed))
+    return SimObj(env, BBController(), SIM_TIME, animate=False, path=path,
+                  profile=profile)
+
+
+class TestSimStats(unittest.TestCase):
+    def test_profile(self):
+        sim = make_sim()
+        sim.simulate()
+        stats = sim.stats
+        self.assertEqual(stats.runs, 1)
+        self.assertEqual(stats.steps, 72)
+        self.assertEqual(stats.sim_minutes, 360)
+        self.assertGreater(stats.sim_minutes_per_second, 0)
+        self.assertEqual(stats.calls['controller'], 72)
+        self.assertEqual(stats.calls['history'], 72)
+        self.assertEqual(stats.calls['patient'], 360)
+        for section in SimStats.SECTIONS:
+            self.assertGreater(stats.times[section], 0)
+        self.assertGreaterEqual(stats.other_time, 0)
+        self.assertAlmostEqual(sum(stats.fractions().values()), 1)
+        self.assertIn('patient', str(stats))
+
+        # the components are restored, and profiling does not change results
+        self.assertNotIn('step', vars(sim.env.patient))
+        self.assertNotIn('policy', vars(sim.controller))
+        ref = make_sim(profile=False)
+        ref.simulate()
+        self.assertFalse(ref.stats.profiled)
+        self.assertEqual(ref.stats.steps, 72)
+        self.assertTrue(np.isnan(ref.stats.other_time))
+        self.assertTrue(sim.results().equals(ref.results()))
+
+    def test_merge(self):
+        a, b = make_sim(1), make_sim(2)
+        a.simulate()
+        b.simulate()
+        total = SimStats.combine([a.stats, pickle.loads(pickle.dumps(b.stats))])
+        self.assertEqual(total.runs, 2)
+        self.assertEqual(total.steps, 144)
+        self.assertAlmostEqual(total.wall_time,
+                               a.stats.wall_time + b.stats.wall_time)
+        self.assertAlmostEqual(total.times['patient'],
+                               (a.stats + b.stats).times['patient'])
+        self.assertEqual(total.as_dict()['sim_minutes'], 720)
+
+    def test_batch(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        sims = [make_sim(1, path=path), make_sim(2, path=path)]
+        _, stats = batch_sim(sims, return_stats=True)
+        self.assertEqual(stats.runs, 2)
+        self.assertEqual(stats.calls['controller'], 144)
+        self.assertEqual(sims[1].stats.steps, 72)
+
+        configs = [SimConfig('adolescent#001'), SimConfig('child#002')]
+        results = batch_simulate(configs, SIM_TIME, seed=1, max_workers=2,
+                                 profile=True)
+        self.assertEqual(len(results.run_stats), 2)
+        self.assertEqual(results.stats.runs, 2)
+        self.assertEqual(results.stats.steps, 144)
+        self.assertTrue(results.stats.profiled)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+import numpy as np
+from simglucose import registry, trace_cache
+from simglucose.sensor.noise_gen import CGMNoise
+from simglucose.simulation.scenario_gen import RandomScenario
+
+
+def meals(scenario, n_days):
+    start = scenario.start_time
+    return [
+        scenario.get_action(start + timedelta(minutes=i)).meal
+        for i in range(n_days * 1440)
+    ]
+
+
+class TestTraceCache(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        trace_cache.set_cache_dir(None)
+        shutil.rmtree(self.path)
+
+    def test_noise_matches_uncached(self):
+        params = registry.sensors.get("Dexcom")
+        expected = CGMNoise(params, seed=3).generate(700)
+        trace_cache.set_cache_dir(self.path, days=1)
+        for _ in range(2):  # miss, then hit
+            noise = CGMNoise(params, seed=3)
+            self.assertIsInstance(noise._trace, np.memmap)
+            head = [next(noise) for _ in range(100)]
+            tail = noise.generate(600)
+            np.testing.assert_array_equal(np.concatenate([head, tail]), expected)
+        self.assertEqual(len(os.listdir(self.path)), 1)
+
+    def test_scenario_matches_uncached(self):
+        start_time = datetime(2018, 1, 1, 0, 0, 0)
+        expected = meals(RandomScenario(start_time, seed=4), 4)
+        trace_cache.set_cache_dir(self.path, days=2)
+        for _ in range(2):
+            scenario = RandomScenario(start_time, seed=4)
+            self.assertIsInstance(scenario._trace, np.memmap)
+            self.assertEqual(meals(scenario, 4), expected)
+
+    def test_no_cache_without_seed(self):
+        trace_cache.set_cache_dir(self.path)
+        self.assertIsNone(CGMNoise(registry.sensors.get("Dexcom"))._trace)
+        self.assertIsNone(RandomScenario(datetime(2018, 1, 1))._trace)
+        self.assertEqual(os.listdir(self.path), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+from datetime import datetime
+import numpy as np
+from simglucose.envs import T1DSimVectorEnv
+from simglucose.simulation.env import T1DSimEnv
+from simglucose.simulation.scenario import CustomScenario
+from simglucose.simulation.scenario_gen import RandomScenario
+from simglucose.controller.base import Action
+from simglucose.sensor.cgm import CGMSensor
+from simglucose.actuator.pump import InsulinPump
+from simglucose.patient.t1dpatient import T1DPatient
+
+NAMES = ["adolescent#001", "adult#002", "child#003", "adult#002"]
+
+
+def scalar_env(vec_env, i, scenario=None):
+    patient_seed, sensor_seed, scenario_seed = vec_env.episode_seeds[i]
+    patient = T1DPatient.withName(
+        vec_env.patient_names[i], random_init_bg=True, seed=int(patient_seed)
+    )
+    sensor = CGMSensor.withName("Dexcom", seed=int(sensor_seed))
+    pump = InsulinPump.withName("Insulet")
+    if scenario is None:
+        scenario = RandomScenario(vec_env.start_times[i], seed=int(scenario_seed))
+    return T1DSimEnv(patient, sensor, pump, scenario)
+
+
+class TestVectorEnv(unittest.TestCase):
+    def check_matches_scalar(self, vec_env, scenario=None, n_steps=150):
+        obs, _ = vec_env.reset(seed=3)
+        self.assertEqual(obs.shape, (len(NAMES), 1))
+        self.assertEqual(obs.dtype, np.float32)
+        envs = [scalar_env(vec_env, i, scenario) for i in range(len(NAMES))]
+        for env, o in zip(envs, obs):
+            self.assertAlmostEqual(env.reset().observation.CGM, o[0], places=3)
+
+        basal = np.array([0.01, 0.02, 0.015, 0.03], dtype=np.float32)
+        meals = np.zeros(len(NAMES))
+        for _ in range(n_steps):
+            obs, reward, terminated, _, info = vec_env.step(basal[:, None])
+            steps = [
+                env.step(Action(basal=float(b), bolus=0))
+                for env, b in zip(envs, basal)
+            ]
+            meals += info["meal"]
+            np.testing.assert_allclose(
+                obs[:, 0], [s.observation.CGM for s in steps], rtol=1e-4
+            )
+            np.testing.assert_allclose(
+                info["bg"], [s.info["bg"] for s in steps], rtol=1e-4
+            )
+            np.testing.assert_array_equal(
+                info["meal"], [s.info["meal"] for s in steps]
+            )
+            np.testing.assert_allclose(
+                reward, [s.reward for s in steps], rtol=1e-3, atol=1e-3
+            )
+            self.assertFalse(terminated.any())
+        self.assertTrue((meals > 0).all())
+
+    def test_matches_scalar_envs(self):
+        self.check_matches_scalar(T1DSimVectorEnv(NAMES))
+
+    def test_matches_scalar_envs_custom_scenario(self):
+        start_time = datetime(2018, 1, 1, 6, 0, 0)
+        scenario = CustomScenario(start_time, [(1, 30), (6, 50), (10, 20)])
+        self.check_matches_scalar(
+            T1DSimVectorEnv(NAMES, custom_scenario=scenario), scenario
+        )
+
+    def test_autoreset(self):
+        vec_env = T1DSimVectorEnv(NAMES, max_episode_steps=5)
+        vec_env.reset(seed=0)
+        seeds = vec_env.episode_seeds.copy()
+        actions = np.full((len(NAMES), 1), 0.02, dtype=np.float32)
+        for _ in range(4):
+            _, _, _, truncated, info = vec_env.step(actions)
+            self.assertFalse(truncated.any())
+            self.assertNotIn("final_observation", info)
+        obs, _, terminated, truncated, info = vec_env.step(actions)
+        self.assertFalse(terminated.any())
+        self.assertTrue(truncated.all())
+        self.assertTrue(info["_final_observation"].all())
+        self.assertEqual(info["final_observation"][0].shape, (1,))
+        self.assertIn("bg", info["final_info"][0])
+        self.assertFalse((vec_env.episode_seeds == seeds).all(axis=1).any())
+
+        # the new episodes are those of fresh scalar envs
+        for i in range(len(NAMES)):
+            env = scalar_env(vec_env, i)
+            self.assertAlmostEqual(env.reset().observation.CGM, obs[i, 0],
+                                   places=3)
+
+    def test_seeding(self):
+        a = T1DSimVectorEnv(NAMES)
+        b = T1DSimVectorEnv(NAMES)
+        np.testing.assert_array_equal(a.reset(seed=1)[0], b.reset(seed=1)[0])
+        np.testing.assert_array_equal(a.episode_seeds, b.episode_seeds)
+        self.assertEqual(a.start_times, b.start_times)
+
+
+if __name__ == "__main__":
+    unittest.main()